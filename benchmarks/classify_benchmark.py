@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Benchmark of Classify.assignPlacement on a large synthetic jplace file.
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.classify import Classify
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'..','test','data')
+DEFAULT_TAXONOMY = os.path.join(path_to_data, '61_otus.gpkg', '61_otus.refpkg', '61_otus_taxonomy.csv')
+JPLACE_FIELDS = ["classification", "distal_length", "edge_num", "like_weight_ratio", "likelihood", "pendant_length"]
+
+def generate_jplace(taxonomy_path, num_groups, num_distinct, output_io, seed):
+    '''Write a jplace file with num_groups placement groups to output_io. The
+    placement distributions are drawn from a pool of num_distinct
+    distributions, as in real data where many groups share the same
+    distribution.'''
+    rng = random.Random(seed)
+    with open(taxonomy_path) as f:
+        tax_ids = [line.split(',')[0] for line in f if not line.startswith('tax_id')]
+
+    distributions = []
+    for _ in range(num_distinct):
+        num_edges = rng.randint(1, 5)
+        weights = [rng.random() for _ in range(num_edges)]
+        total = sum(weights)
+        distributions.append([[rng.choice(tax_ids), 0.1, i, w/total, -1000.0, 0.2]
+                              for i, w in enumerate(weights)])
+
+    placements = []
+    for i in range(num_groups):
+        placements.append({'p': rng.choice(distributions),
+                           'nm': [['read%i_%i' % (i, rng.randint(0, 3)), 1]]})
+    json.dump({'fields': JPLACE_FIELDS,
+               'version': 3,
+               'tree': '',
+               'metadata': {},
+               'placements': placements}, output_io)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time Classify.assignPlacement on a large synthetic jplace')
+    parser.add_argument('--taxonomy', help='taxtastic taxonomy file of a refpkg', default=DEFAULT_TAXONOMY)
+    parser.add_argument('--groups', type=int, help='number of placement groups', default=200000)
+    parser.add_argument('--distinct', type=int, help='number of distinct placement distributions', default=2000)
+    parser.add_argument('--cutoff', type=float, default=0.75)
+    parser.add_argument('--resolve_placements', action='store_true', default=False)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.jplace') as jplace:
+        generate_jplace(args.taxonomy, args.groups, args.distinct, jplace, args.seed)
+        jplace.flush()
+
+        start = time.perf_counter()
+        classify = Classify(args.taxonomy)
+        classify.assignPlacement(jplace.name, args.cutoff, args.resolve_placements)
+        elapsed = time.perf_counter() - start
+
+    print(json.dumps({'benchmark': 'classify_assign_placement',
+                      'groups': args.groups,
+                      'distinct_distributions': args.distinct,
+                      'cached_distributions': len(classify._placement_cache),
+                      'resolve_placements': args.resolve_placements,
+                      'seconds': round(elapsed, 3)}))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Compare the output of graft_benchmark.py between two commits.
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import argparse
+import json
+import sys
+
+def compare(baseline, current, max_slowdown):
+    '''Print the change in wall time of each stage of each package between
+    two lists of benchmark results, and return the number of stages slower
+    than max_slowdown times the baseline.'''
+    baseline_by_package = {r['package']: r for r in baseline}
+    num_slower = 0
+    print("\t".join(['package', 'stage', 'baseline_seconds', 'current_seconds', 'ratio']))
+    for result in current:
+        base = baseline_by_package.get(result['package'])
+        if base is None:
+            continue
+        for stage in sorted(set(base['stages']) | set(result['stages'])):
+            before = base['stages'].get(stage, {}).get('wall_seconds')
+            after = result['stages'].get(stage, {}).get('wall_seconds')
+            if before and after is not None:
+                ratio = after/before
+                if ratio > max_slowdown:
+                    num_slower += 1
+                ratio = "%.2f" % ratio
+            else:
+                ratio = 'n/a'
+            print("\t".join([result['package'], stage, str(before), str(after), ratio]))
+    return num_slower
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the per-stage wall time of two graft_benchmark.py results')
+    parser.add_argument('baseline', help='JSON output of graft_benchmark.py for the baseline commit')
+    parser.add_argument('current', help='JSON output of graft_benchmark.py for the commit being tested')
+    parser.add_argument('--max_slowdown', type=float, help='exit with status 1 if any stage is this many times slower than the baseline', default=1.2)
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if compare(baseline, current, args.max_slowdown) > 0:
+        sys.exit(1)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# End-to-end benchmark of graftM graft on synthetic metagenomes, reporting
+# the time and resources used by each stage of the pipeline.
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.graftm_package import GraftMPackage, GraftMPackageVersion3
+from graftm.graftm_output_paths import GraftMFiles
+from graftm.profiler import Profiler
+
+from synthetic_metagenome import reference_sequences, generate_reads
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'..','test','data')
+path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)),'..','bin','graftM')
+DEFAULT_PACKAGES = [os.path.join(path_to_data, '61_otus.gpkg'),
+                    os.path.join(path_to_data, 'mcrA.gpkg')]
+
+def git_commit():
+    '''Return the commit being benchmarked, or None if it cannot be determined'''
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.realpath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def summarise_records(records, kind):
+    '''Sum the records of one kind (stage or command) by name. Peak memory is
+    the maximum across records rather than the sum.'''
+    summary = {}
+    for record in records:
+        if record['kind'] != kind: continue
+        s = summary.setdefault(record['name'], {'count': 0,
+                                                'wall_seconds': 0.0,
+                                                'cpu_seconds': 0.0,
+                                                'children_cpu_seconds': 0.0,
+                                                'peak_rss_kb': 0,
+                                                'children_peak_rss_kb': 0,
+                                                'read_bytes': 0,
+                                                'write_bytes': 0})
+        s['count'] += 1
+        for key in ('wall_seconds', 'cpu_seconds', 'children_cpu_seconds'):
+            s[key] = round(s[key]+record[key], 6)
+        for key in ('read_bytes', 'write_bytes'):
+            s[key] += record[key]
+        for key in ('peak_rss_kb', 'children_peak_rss_kb'):
+            s[key] = max(s[key], record[key])
+    return summary
+
+def benchmark_package(graftm_package_path, working_directory, args):
+    '''Generate a synthetic metagenome from the package, graft it, and return
+    a dict describing the run.'''
+    graftm_package = GraftMPackage.acquire(graftm_package_path)
+    name = os.path.basename(graftm_package_path.rstrip('/'))
+    reads_path = os.path.join(working_directory, '%s.fa' % name)
+    output_directory = os.path.join(working_directory, '%s_graftm' % name)
+    with open(reads_path, 'w') as f:
+        generate_reads(reference_sequences(graftm_package), args.reads, f,
+                       read_length=args.read_length,
+                       error_rate=args.error_rate,
+                       background_fraction=args.background_fraction,
+                       seed=args.seed)
+
+    command = [sys.executable, path_to_script, 'graft',
+               '--forward', reads_path,
+               '--graftm_package', graftm_package_path,
+               '--output_directory', output_directory,
+               '--threads', str(args.threads),
+               '--verbosity', '2']
+    start = time.perf_counter()
+    status = subprocess.call(command)
+    wall_seconds = time.perf_counter() - start
+
+    profile_path = GraftMFiles('', output_directory, False).profile_path()
+    if os.path.exists(profile_path):
+        with open(profile_path) as f:
+            records = json.load(f)['records']
+    else:
+        records = []
+
+    return {'benchmark': 'graft',
+            'package': name,
+            'package_type': 'protein' if GraftMPackageVersion3.graftm_package_is_protein(graftm_package) else 'nucleotide',
+            'reads': args.reads,
+            'read_length': args.read_length,
+            'error_rate': args.error_rate,
+            'background_fraction': args.background_fraction,
+            'seed': args.seed,
+            'threads': args.threads,
+            'exit_status': status,
+            'wall_seconds': round(wall_seconds, 3),
+            'stages': summarise_records(records, Profiler.STAGE_KIND),
+            'commands': summarise_records(records, Profiler.COMMAND_KIND)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time each stage of graftM graft on synthetic metagenomes generated from GraftM packages')
+    parser.add_argument('--graftm_package', nargs='+', help='GraftM packages to benchmark', default=DEFAULT_PACKAGES)
+    parser.add_argument('--reads', type=int, help='number of reads per package', default=100000)
+    parser.add_argument('--read_length', type=int, default=150)
+    parser.add_argument('--error_rate', type=float, help='substitution rate per base', default=0.01)
+    parser.add_argument('--background_fraction', type=float, help='fraction of reads which are random sequence', default=0.5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON here rather than to stdout')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    results = []
+    with tempfile.TemporaryDirectory() as working_directory:
+        for graftm_package_path in args.graftm_package:
+            result = benchmark_package(graftm_package_path, working_directory, args)
+            result['commit'] = commit
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    else:
+        print(json.dumps(results, indent=1, sort_keys=True))
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Micro-benchmarks of the pure-python functions on graftM's hot path,
+# measuring time and memory allocation on synthetic inputs of increasing
+# size. No external programs are required.
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import argparse
+import collections
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+import dendropy
+
+from graftm.classify import Classify
+from graftm.deduplicator import Deduplicator
+from graftm.getaxnseq import Getaxnseq
+from graftm.pplacer import Pplacer
+from graftm.sequence_io import Sequence
+from graftm.sequence_search_results import SequenceSearchResult
+from graftm.sequence_searcher import SequenceSearcher
+from graftm.summarise import Stats_And_Summary
+from graftm.tree_decorator import TreeDecorator
+
+from classify_benchmark import generate_jplace
+
+RANK_PREFIXES = ['k__','p__','c__','o__','f__','g__','s__']
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+# name => (setup function, default sizes)
+BENCHMARKS = collections.OrderedDict()
+
+def benchmark(name, sizes):
+    '''Register a benchmark. The decorated function is given the input size,
+    a seeded random.Random and a scratch directory, and returns a function of
+    no arguments which runs the code being measured once. Setup is not
+    included in the measurement, and is repeated before each run, so the
+    measured code is free to modify its inputs.'''
+    def register(setup):
+        BENCHMARKS[name] = (setup, sizes)
+        return setup
+    return register
+
+def synthetic_taxonomies(num_sequences, rng, branching=4):
+    '''Return a dict of sequence name => taxonomy list, where taxa at each rank
+    have exactly one parent. Some sequences are not classified to species
+    level.'''
+    taxonomies = {}
+    for i in range(num_sequences):
+        depth = rng.randint(3, len(RANK_PREFIXES))
+        taxon = 0
+        taxonomy = []
+        for rank in range(depth):
+            taxon = taxon*branching + rng.randrange(branching)
+            taxonomy.append('%st%i' % (RANK_PREFIXES[rank], taxon))
+        taxonomies['seq%i' % i] = taxonomy
+    return taxonomies
+
+def taxtastic_files(num_sequences, directory):
+    '''Write (or reuse) taxtastic taxonomy and seqinfo files for a synthetic
+    taxonomy of the given size, returning their paths.'''
+    taxonomy_path = os.path.join(directory, 'taxonomy%i.csv' % num_sequences)
+    seqinfo_path = os.path.join(directory, 'seqinfo%i.csv' % num_sequences)
+    if not os.path.exists(seqinfo_path):
+        Getaxnseq().write_taxonomy_and_seqinfo_files(
+            synthetic_taxonomies(num_sequences, random.Random(0)),
+            taxonomy_path, seqinfo_path)
+    return taxonomy_path, seqinfo_path
+
+def aligned_sequence(rng, length, gap_fraction=0.1):
+    return ''.join(['-' if rng.random() < gap_fraction else rng.choice(AMINO_ACIDS)
+                    for _ in range(length)])
+
+@benchmark('SequenceSearcher.alignment_correcter', [1000, 10000, 100000])
+def setup_alignment_correcter(size, rng, directory):
+    alignment_length = 200
+    insert_columns = set(rng.sample(range(alignment_length), 20))
+    alignment_path = os.path.join(directory, 'hmmalign.aln.fasta')
+    with open(alignment_path, 'w') as f:
+        for i in range(size):
+            seq = aligned_sequence(rng, alignment_length)
+            # hmmalign marks insert states in lower case
+            seq = ''.join([c.lower() if j in insert_columns else c for j, c in enumerate(seq)])
+            f.write(">read%i\n%s\n" % (i, seq))
+    output_path = os.path.join(directory, 'corrected.aln.fasta')
+    return lambda: SequenceSearcher(None).alignment_correcter(
+        [alignment_path], output_path, filter_minimum=50)
+
+@benchmark('SequenceSearcher.merge_forev_aln', [1000, 10000, 100000])
+def setup_merge_forev_aln(size, rng, directory):
+    alignment_length = 200
+    forward_path = os.path.join(directory, 'forward.aln.fasta')
+    reverse_path = os.path.join(directory, 'reverse.aln.fasta')
+    with open(forward_path, 'w') as forward:
+        with open(reverse_path, 'w') as reverse:
+            for i in range(size):
+                # Forward and reverse reads cover overlapping ends of the
+                # alignment
+                seq = aligned_sequence(rng, alignment_length)
+                split = rng.randint(alignment_length//3, 2*alignment_length//3)
+                overlap = rng.randint(0, alignment_length//4)
+                forward.write(">read%i/1\n%s\n" % (i, seq[:split+overlap]+'-'*(alignment_length-split-overlap)))
+                reverse.write(">read%i/2\n%s\n" % (i, '-'*split+seq[split:]))
+    output_path = os.path.join(directory, 'merged.aln.fasta')
+    return lambda: SequenceSearcher(None).merge_forev_aln(
+        [forward_path], [reverse_path], [output_path])
+
+@benchmark('SequenceSearcher._get_read_names', [1000, 10000, 100000])
+def setup_get_read_names(size, rng, directory):
+    result = SequenceSearchResult()
+    result.fields = [SequenceSearchResult.QUERY_ID_FIELD,
+                     SequenceSearchResult.ALIGNMENT_DIRECTION,
+                     SequenceSearchResult.HIT_FROM_FIELD,
+                     SequenceSearchResult.HIT_TO_FIELD,
+                     SequenceSearchResult.QUERY_FROM_FIELD,
+                     SequenceSearchResult.QUERY_TO_FIELD]
+    num_contigs = max(1, size*4//5)
+    for i in range(size):
+        # Some contigs hit more than once, as for genes with multiple
+        # conserved regions, or multiple genes per contig
+        contig = 'contig%i' % rng.randrange(num_contigs)
+        hit_from = rng.randint(1, 5000)
+        hit_to = hit_from + rng.randint(30, 450)
+        query_from = rng.randint(1, 300)
+        query_to = query_from + (hit_to-hit_from)//3
+        forward = rng.random() < 0.5
+        if not forward:
+            hit_from, hit_to = hit_to, hit_from
+        result.results.append([contig, forward, hit_from, hit_to, query_from, query_to])
+    return lambda: SequenceSearcher(None)._get_read_names([result], 1500)
+
+@benchmark('Deduplicator.deduplicate', [10000, 100000, 1000000])
+def setup_deduplicate(size, rng, directory):
+    distinct = [aligned_sequence(rng, 200) for _ in range(max(1, size//10))]
+    sequences = [Sequence('read%i' % i, rng.choice(distinct)) for i in range(size)]
+    return lambda: Deduplicator().deduplicate(sequences)
+
+@benchmark('Classify.assignPlacement', [1000, 10000, 100000])
+def setup_assign_placement(size, rng, directory):
+    taxonomy_path, _ = taxtastic_files(max(100, size//10), directory)
+    jplace_path = os.path.join(directory, 'placements.jplace')
+    with open(jplace_path, 'w') as f:
+        generate_jplace(taxonomy_path, size, max(1, size//100), f, rng.randrange(2**32))
+    classify = Classify(taxonomy_path)
+    return lambda: classify.assignPlacement(jplace_path, 0.75, False)
+
+@benchmark('Pplacer.jplace_split', [1000, 10000, 100000])
+def setup_jplace_split(size, rng, directory):
+    num_files = 4
+    cluster_dict = {str(i): {} for i in range(num_files)}
+    placements = []
+    for i in range(size):
+        alias = str(rng.randrange(num_files))
+        name = 'read%i' % i
+        # Each placed representative stands for a cluster of identical reads
+        cluster_dict[alias][name] = [Sequence(name if j == 0 else '%s_dup%i' % (name, j), 'SEQUENCE')
+                                     for j in range(rng.randint(1, 3))]
+        placements.append({'p': [['p__t1', 0.1, rng.randrange(500), 1.0, -1000.0, 0.2]],
+                           'nm': [['%s_%s' % (name, alias), 1]]})
+    jplace = {'fields': ['classification', 'distal_length', 'edge_num',
+                         'like_weight_ratio', 'likelihood', 'pendant_length'],
+              'version': 3,
+              'tree': '',
+              'metadata': {},
+              'placements': placements}
+    return lambda: Pplacer(None).jplace_split(jplace, cluster_dict)
+
+@benchmark('Stats_And_Summary._iterate_otu_table_rows', [10000, 100000, 1000000])
+def setup_iterate_otu_table_rows(size, rng, directory):
+    num_samples = 4
+    taxonomies = list(synthetic_taxonomies(max(1, size//100), rng).values())
+    read_taxonomies = [{'read%i' % i: rng.choice(taxonomies) for i in range(size//num_samples)}
+                       for _ in range(num_samples)]
+    return lambda: collections.deque(
+        Stats_And_Summary()._iterate_otu_table_rows(read_taxonomies), maxlen=0)
+
+def random_newick(names, rng):
+    '''Return a newick string of a random binary tree with the given tip
+    names'''
+    names = list(names)
+    rng.shuffle(names)
+    def build(tips):
+        if len(tips) == 1:
+            return '%s:%.3f' % (tips[0], rng.random())
+        split = rng.randint(1, len(tips)-1)
+        return '(%s,%s):%.3f' % (build(tips[:split]), build(tips[split:]), rng.random())
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10*len(names)))
+    return build(names)+';'
+
+@benchmark('TreeDecorator.decorate', [100, 1000, 5000])
+def setup_decorate(size, rng, directory):
+    taxonomy = synthetic_taxonomies(size, rng)
+    tree = dendropy.Tree.get(data=random_newick(taxonomy.keys(), rng), schema='newick')
+    decorator = TreeDecorator(tree, taxonomy)
+    return lambda: decorator.decorate(None, None, True)
+
+@benchmark('Getaxnseq.read_taxtastic_taxonomy_and_seqinfo', [1000, 10000, 100000])
+def setup_read_taxtastic_taxonomy_and_seqinfo(size, rng, directory):
+    taxonomy_path, seqinfo_path = taxtastic_files(size, directory)
+    def run():
+        with open(taxonomy_path) as taxonomy_io:
+            with open(seqinfo_path) as seqinfo_io:
+                return Getaxnseq().read_taxtastic_taxonomy_and_seqinfo(taxonomy_io, seqinfo_io)
+    return run
+
+def measure(name, size, **kwargs):
+    '''Run a benchmark, returning a dict of its timings and allocations.
+
+    Parameters
+    ----------
+    name: str
+        name of a registered benchmark
+    size: int
+        size of the input
+    kwargs:
+        repeat: int
+            number of timed runs
+        seed: int
+            seed for generating the input, which is the same for each run
+    '''
+    repeat = kwargs.pop('repeat', 5)
+    seed = kwargs.pop('seed', 42)
+    if len(kwargs) > 0:
+        raise Exception("Unexpected arguments detected: %s" % kwargs)
+
+    setup, _ = BENCHMARKS[name]
+    times = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(repeat):
+            run = setup(size, random.Random(seed), directory)
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+
+        # Allocations are measured in a separate run since tracing slows
+        # allocation down considerably
+        run = setup(size, random.Random(seed), directory)
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = run()
+            after, peak = tracemalloc.get_traced_memory()
+            del result
+        finally:
+            tracemalloc.stop()
+
+    return {'benchmark': name,
+            'size': size,
+            'repeat': repeat,
+            'seed': seed,
+            'min_seconds': round(min(times), 6),
+            'median_seconds': round(statistics.median(times), 6),
+            'peak_allocated_bytes': peak - before,
+            'retained_bytes': after - before}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time and measure the memory allocation of pure-python graftM functions on synthetic inputs')
+    parser.add_argument('--benchmark', nargs='+', help='benchmarks to run (default: all)', choices=list(BENCHMARKS.keys()))
+    parser.add_argument('--sizes', nargs='+', type=int, help='input sizes (default: a different set for each benchmark)')
+    parser.add_argument('--repeat', type=int, help='number of timed runs of each benchmark', default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit', default=False)
+    parser.add_argument('--output', help='write results as JSON here rather than to stdout')
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (_, sizes) in BENCHMARKS.items():
+            print("%s\t%s" % (name, ' '.join([str(s) for s in sizes])))
+        sys.exit(0)
+
+    # The benchmarked functions log at info level, which would otherwise be
+    # measured too
+    logging.disable(logging.INFO)
+    results = []
+    for name in (args.benchmark or BENCHMARKS.keys()):
+        for size in (args.sizes or BENCHMARKS[name][1]):
+            result = measure(name, size, repeat=args.repeat, seed=args.seed)
+            sys.stderr.write("%s\t%i\t%.4fs\n" % (name, size, result['median_seconds']))
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    else:
+        print(json.dumps(results, indent=1))
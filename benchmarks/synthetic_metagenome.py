@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Generate a deterministic synthetic metagenome from the sequences of a
+# GraftM package, for benchmarking.
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import argparse
+import gzip
+import math
+import os
+import random
+import sys
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.graftm_package import GraftMPackage, GraftMPackageVersion3
+from graftm.sequence_io import SequenceIO
+
+CODONS = {
+    'A': ['GCT','GCC','GCA','GCG'], 'R': ['CGT','CGC','CGA','CGG','AGA','AGG'],
+    'N': ['AAT','AAC'], 'D': ['GAT','GAC'], 'C': ['TGT','TGC'], 'Q': ['CAA','CAG'],
+    'E': ['GAA','GAG'], 'G': ['GGT','GGC','GGA','GGG'], 'H': ['CAT','CAC'],
+    'I': ['ATT','ATC','ATA'], 'L': ['TTA','TTG','CTT','CTC','CTA','CTG'],
+    'K': ['AAA','AAG'], 'M': ['ATG'], 'F': ['TTT','TTC'], 'P': ['CCT','CCC','CCA','CCG'],
+    'S': ['TCT','TCC','TCA','TCG','AGT','AGC'], 'T': ['ACT','ACC','ACA','ACG'],
+    'W': ['TGG'], 'Y': ['TAT','TAC'], 'V': ['GTT','GTC','GTA','GTG'],
+    '*': ['TAA','TAG','TGA']}
+ANY_CODON = [c for aa, codons in sorted(CODONS.items()) if aa != '*' for c in codons]
+COMPLEMENT = str.maketrans('ACGTN', 'TGCAN')
+NUCLEOTIDES = 'ACGT'
+# Each byte of random bits encodes four random bases
+BYTE_TO_BASES = [''.join(NUCLEOTIDES[(b >> shift) & 3] for shift in (6,4,2,0)) for b in range(256)]
+
+def reference_sequences(graftm_package):
+    '''Return a list of (name, nucleotide sequence) of the sequences in the
+    package. Protein sequences are back-translated choosing codons at random
+    with a fixed seed, so the result is the same on each call. If the package
+    has no unaligned sequence database, the sequences of the reference
+    package alignment are used with gaps removed.'''
+    path = graftm_package.unaligned_sequence_database_path() \
+        if graftm_package.version >= 3 else None
+    if not path:
+        path = graftm_package.alignment_fasta_path()
+    is_protein = GraftMPackageVersion3.graftm_package_is_protein(graftm_package)
+
+    rng = random.Random(0)
+    references = []
+    with open(path) as f:
+        for name, seq, _ in SequenceIO().each(f):
+            seq = seq.upper().replace('-','').replace('.','')
+            if is_protein:
+                seq = ''.join([rng.choice(CODONS.get(aa, ANY_CODON)) for aa in seq])
+            if seq:
+                references.append((name, seq))
+    if not references:
+        raise Exception("No sequences found in %s" % path)
+    return references
+
+def generate_reads(references, num_reads, output_io, **kwargs):
+    '''Write num_reads reads to output_io, in FASTA format unless fastq is
+    specified. Reads are written as they are generated so any number of reads
+    can be produced in constant memory.
+
+    Parameters
+    ----------
+    references: list of (name, sequence)
+        as returned by reference_sequences
+    num_reads: int
+        number of reads to generate
+    output_io: io
+        open text file to write to
+    kwargs:
+        read_length: int
+            length of each read
+        error_rate: float
+            probability of a substitution error at each base
+        background_fraction: float
+            fraction of reads which are random sequence rather than drawn from
+            the references
+        seed: int
+            seed for the random number generator
+        fastq: bool
+            write FASTQ rather than FASTA
+    '''
+    read_length = kwargs.pop('read_length', 150)
+    error_rate = kwargs.pop('error_rate', 0.01)
+    background_fraction = kwargs.pop('background_fraction', 0.5)
+    seed = kwargs.pop('seed', 42)
+    fastq = kwargs.pop('fastq', False)
+    if len(kwargs) > 0:
+        raise Exception("Unexpected arguments detected: %s" % kwargs)
+
+    rng = random.Random(seed)
+    # Log-normally distributed abundances, as in real communities
+    abundances = [rng.lognormvariate(0, 1) for _ in references]
+    cumulative = []
+    total = 0
+    for abundance in abundances:
+        total += abundance
+        cumulative.append(total)
+    log_no_error = math.log(1-error_rate) if 0 < error_rate < 1 else None
+
+    quality = 'I'*read_length
+    for i in range(num_reads):
+        if rng.random() < background_fraction:
+            source = 'background'
+            num_bytes = (read_length+3)//4
+            read = ''.join([BYTE_TO_BASES[b] for b in
+                            rng.getrandbits(8*num_bytes).to_bytes(num_bytes, 'little')])[:read_length]
+        else:
+            name, seq = references[rng.choices(range(len(references)), cum_weights=cumulative)[0]]
+            start = rng.randint(0, max(0, len(seq)-read_length))
+            read = seq[start:start+read_length]
+            if rng.random() < 0.5:
+                read = read.translate(COMPLEMENT)[::-1]
+                strand = '-'
+            else:
+                strand = '+'
+            source = '%s:%i%s' % (name, start, strand)
+
+            if log_no_error is not None:
+                # Skip directly to each substitution rather than drawing a
+                # random number for every base
+                bases = list(read)
+                position = int(math.log(1-rng.random())/log_no_error)
+                while position < len(bases):
+                    bases[position] = rng.choice(NUCLEOTIDES.replace(bases[position], ''))
+                    position += 1+int(math.log(1-rng.random())/log_no_error)
+                read = ''.join(bases)
+
+        if fastq:
+            output_io.write("@read%i %s\n%s\n+\n%s\n" % (i, source, read, quality[:len(read)]))
+        else:
+            output_io.write(">read%i %s\n%s\n" % (i, source, read))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a deterministic synthetic metagenome from the sequences of a GraftM package')
+    parser.add_argument('--graftm_package', help='GraftM package to draw sequences from', required=True)
+    parser.add_argument('--output', help='Output file, gzip compressed if it ends in .gz', required=True)
+    parser.add_argument('--reads', type=int, help='number of reads', default=100000)
+    parser.add_argument('--read_length', type=int, default=150)
+    parser.add_argument('--error_rate', type=float, help='substitution rate per base', default=0.01)
+    parser.add_argument('--background_fraction', type=float, help='fraction of reads which are random sequence', default=0.5)
+    parser.add_argument('--fastq', action='store_true', help='write FASTQ rather than FASTA', default=False)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    references = reference_sequences(GraftMPackage.acquire(args.graftm_package))
+    if args.output.endswith('.gz'):
+        output = gzip.open(args.output, 'wt', compresslevel=1)
+    else:
+        output = open(args.output, 'w')
+    with output as f:
+        generate_reads(references, args.reads, f,
+                       read_length=args.read_length,
+                       error_rate=args.error_rate,
+                       background_fraction=args.background_fraction,
+                       seed=args.seed,
+                       fastq=args.fastq)
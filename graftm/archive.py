@@ -1,16 +1,38 @@
 import tarfile
+import gzip
 import logging
 import itertools
 import os
+import io
+import sys
+import json
 import shutil
-from bird_tool_utils import in_tempdir
+from concurrent.futures import ThreadPoolExecutor
+
+import extern
 
 from .graftm_package import GraftMPackage
+from .parallel_gzip import ParallelGzipWriter
+from .package_manifest import PackageManifest
+from .version import __version__
 
 class ArchiveDefaultOptions:
     force=False
+    threads=1
+    include_indexes=False
 
 class Archive:
+    STDIN_PATH = '-'
+
+    # Archives made with include_indexes contain this manifest of the
+    # derived indexes bundled with the package. It is read during
+    # extraction but not written to the extracted package.
+    INDEX_MANIFEST_FILE_NAME = 'INDEXES.json'
+    _INDEX_MANIFEST_VERSION = 1
+    DIAMOND_TOOL = 'diamond'
+    GRAFTM_TOOL = 'graftM'
+    HMMER_TOOL = 'hmmer'
+
     def create(self, input_package_path, output_package_path, **kwargs):
         """Create an archived GraftM package
 
@@ -23,8 +45,16 @@ class Archive:
         kwargs:
             force: bool
                 overwrite an existing directory
+            threads: int
+                number of threads to compress with. The archive is written as
+                a multi-member gzip file, as pigz --independent does.
+            include_indexes: bool
+                bundle the DIAMOND database, compiled taxonomy and search HMM
+                database, so they need not be regenerated after extraction
         """
         force = kwargs.pop('force',ArchiveDefaultOptions.force)
+        threads = kwargs.pop('threads', ArchiveDefaultOptions.threads)
+        include_indexes = kwargs.pop('include_indexes', ArchiveDefaultOptions.include_indexes)
         if len(kwargs) > 0:
             raise Exception("Unexpected arguments detected: %s" % kwargs)
 
@@ -34,29 +64,158 @@ class Archive:
             raise Exception("Archiving GraftM packages only works with format 3 packages")
 
         self._setup_output(output_package_path, force)
+        indexes = self._bundled_indexes(gpkg) if include_indexes else []
+        gpkg_folder = os.path.basename(os.path.abspath(gpkg._base_directory))
 
-        logging.debug("Compressing contents for archive")
-        with tarfile.open(output_package_path, 'w:gz') as tar:
-            for path in itertools.chain([gpkg.contents_file_path(),
+        logging.debug("Compressing contents for archive with %i thread(s)" % threads)
+        with open(output_package_path, 'wb') as f, \
+                ParallelGzipWriter(f, threads=threads) as gzip_writer, \
+                tarfile.open(fileobj=gzip_writer, mode='w|') as tar:
+            # CONTENTS.json, the index manifest and the unaligned sequences
+            # come first so that extract() can build the DIAMOND database
+            # while the rest is being extracted, or knows not to.
+            tar.add(gpkg.contents_file_path(),
+                    os.path.join(gpkg_folder, GraftMPackage._CONTENTS_FILE_NAME))
+            if include_indexes:
+                manifest = json.dumps({
+                    'version': Archive._INDEX_MANIFEST_VERSION,
+                    'indexes': [entry for _, entry in indexes]}).encode()
+                info = tarfile.TarInfo(os.path.join(gpkg_folder, Archive.INDEX_MANIFEST_FILE_NAME))
+                info.size = len(manifest)
+                tar.addfile(info, io.BytesIO(manifest))
+            if os.path.exists(os.path.join(gpkg._base_directory, PackageManifest.FILE_NAME)):
+                tar.add(os.path.join(gpkg._base_directory, PackageManifest.FILE_NAME),
+                        os.path.join(gpkg_folder, PackageManifest.FILE_NAME))
+            for path in itertools.chain([gpkg.unaligned_sequence_database_path(),
                                          gpkg.alignment_hmm_path(),
-                                         gpkg.reference_package_path(),
-                                         gpkg.unaligned_sequence_database_path()],
-                                        [hmm for hmm in gpkg.search_hmm_paths() if hmm != gpkg.alignment_hmm_path()]):
+                                         gpkg.reference_package_path()],
+                                        [hmm for hmm in gpkg.search_hmm_paths() if hmm != gpkg.alignment_hmm_path()],
+                                        [path for path, _ in indexes]):
                 logging.debug("Compressing '%s'" % path)
                 # Put the gpkg folder itself in the archive so as not to tar bomb.
-                tar.add(path,
-                        os.path.join(os.path.basename(os.path.abspath(gpkg._base_directory)),
-                                     os.path.basename(path)))
+                tar.add(path, os.path.join(gpkg_folder, os.path.basename(path)))
             
         logging.info("Archive successfully created")
 
+    @staticmethod
+    def _tool_version(tool):
+        '''Return the version of the tool used to generate an index, or None
+        if it cannot be determined'''
+        if tool == Archive.GRAFTM_TOOL:
+            return __version__
+        elif tool == Archive.DIAMOND_TOOL:
+            try:
+                return extern.run("diamond version").strip()
+            except Exception as e:
+                logging.debug("Unable to determine DIAMOND version: %s" % e)
+                return None
+        elif tool == Archive.HMMER_TOOL:
+            # The first lines of the help are e.g.
+            # # hmmconvert :: convert profile file to a HMMER format
+            # # HMMER 3.1b2 (February 2015); http://hmmer.org/
+            try:
+                for line in extern.run("hmmconvert -h").split("\n"):
+                    if line.startswith('# HMMER '):
+                        return line.split()[2]
+            except Exception as e:
+                logging.debug("Unable to determine HMMER version: %s" % e)
+            return None
+        else:
+            return None
+
+    def _bundled_indexes(self, gpkg):
+        '''Return a list of (path, manifest entry) of the derived indexes of
+        gpkg to include in an archive. Each entry records the tool version
+        used to generate the index, and the checksums of it and the package
+        files it was generated from.'''
+        candidates = []
+        if gpkg.diamond_database_path():
+            if os.path.exists(gpkg.diamond_database_path()):
+                candidates.append((gpkg.diamond_database_path(), Archive.DIAMOND_TOOL,
+                                   [gpkg.unaligned_sequence_database_path()]))
+            else:
+                logging.warning("DIAMOND database %s not found, so it will not be included in the archive" % gpkg.diamond_database_path())
+        # Generate the compiled taxonomy if it is missing or out of date
+        gpkg.compiled_taxonomy()
+        if os.path.exists(gpkg.compiled_taxonomy_path()):
+            candidates.append((gpkg.compiled_taxonomy_path(), Archive.GRAFTM_TOOL,
+                               [gpkg.taxtastic_taxonomy_path(), gpkg.taxtastic_seqinfo_path()]))
+        # The binary format of the search HMM database depends on the HMMER
+        # version, so it is only bundled alongside the version that wrote it
+        if len(gpkg.search_hmm_paths()) > 1:
+            database = gpkg.search_hmm_database()
+            if database.acquire():
+                for path in (database.path, database.sources_path()):
+                    candidates.append((path, Archive.HMMER_TOOL, database.hmm_paths))
+
+        base = gpkg._base_directory
+        indexes = []
+        for path, tool, sources in candidates:
+            logging.debug("Including index %s in archive" % path)
+            indexes.append((path, {
+                'path': os.path.relpath(path, base),
+                'checksum': PackageManifest.checksum(path),
+                'tool': tool,
+                'tool_version': self._tool_version(tool),
+                # mtimes are recorded because tar truncates them, and the
+                # compiled taxonomy is only used if they match its sources
+                'sources': [{'path': os.path.relpath(source, base),
+                             'checksum': PackageManifest.checksum(source),
+                             'mtime_ns': os.stat(source).st_mtime_ns}
+                            for source in sources]}))
+        return indexes
+
+    def _reusable_indexes(self, manifest):
+        '''Return a dict of path to manifest entry of the bundled indexes
+        that were generated by the currently installed tool versions'''
+        if manifest.get('version') != Archive._INDEX_MANIFEST_VERSION:
+            logging.warning("Unsupported index manifest version %s, rebuilding indexes" % manifest.get('version'))
+            return {}
+        versions = {}
+        reusable = {}
+        for entry in manifest['indexes']:
+            tool = entry['tool']
+            if tool not in versions:
+                versions[tool] = self._tool_version(tool)
+            if versions[tool] is not None and versions[tool] == entry['tool_version']:
+                reusable[entry['path']] = entry
+            else:
+                logging.info("Not using bundled index %s generated by %s (%s), as the installed version is %s" % (
+                    entry['path'], tool, entry['tool_version'], versions[tool]))
+        return reusable
+
+    def _verify_index(self, output, entry):
+        '''Return True if an extracted index and the files it was generated
+        from have the checksums recorded in the manifest, restoring the
+        modification times of those files. Otherwise remove the index and
+        return False.'''
+        index_path = os.path.join(output, entry['path'])
+        valid = os.path.exists(index_path) and PackageManifest.checksum(index_path) == entry['checksum'] and \
+            all(PackageManifest.checksum(os.path.join(output, source['path'])) == source['checksum']
+                for source in entry['sources'])
+        if valid:
+            for source in entry['sources']:
+                os.utime(os.path.join(output, source['path']),
+                         ns=(source['mtime_ns'], source['mtime_ns']))
+        else:
+            logging.warning("Bundled index %s failed its integrity check, it will be regenerated" % entry['path'])
+            if os.path.exists(index_path):
+                os.remove(index_path)
+        return valid
+
     def extract(self, archive_path, output_package_path, **kwargs):
         '''Extract an archived GraftM package.
 
+        The archive is decompressed in a single streaming pass, and the
+        DIAMOND database is built in the background as soon as the unaligned
+        sequences have been extracted. Indexes bundled in the archive with
+        include_indexes are used instead if they were generated by the
+        installed tool versions and pass an integrity check.
+
         Parameters
         ----------
         archive_path: str
-            path to archive
+            path to archive, or '-' to read it from stdin
         output_package_path: str
             path to where to put the extracted file
         kwargs:
@@ -66,51 +225,107 @@ class Archive:
         force = kwargs.pop('force', ArchiveDefaultOptions.force)
         if len(kwargs) > 0:
             raise Exception("Unexpected arguments detected: %s" % kwargs)
-        
+
         logging.info("Un-archiving GraftM package '%s' from '%s'" % (output_package_path, archive_path))
-        archive = os.path.abspath(archive_path)
         output = os.path.abspath(output_package_path)
-        
+
         self._setup_output(output, force)
-        
-        with in_tempdir():
-            with tarfile.open(archive) as tar:
-                def is_within_directory(directory, target):
-                    
-                    abs_directory = os.path.abspath(directory)
-                    abs_target = os.path.abspath(target)
-                
-                    prefix = os.path.commonprefix([abs_directory, abs_target])
-                    
-                    return prefix == abs_directory
-                
-                def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-                
-                    for member in tar.getmembers():
-                        member_path = os.path.join(path, member.name)
-                        if not is_within_directory(path, member_path):
-                            raise Exception("Attempted Path Traversal in Tar File")
-                
-                    tar.extractall(path, members, numeric_owner=numeric_owner) 
-                    
-                
-                safe_extract(tar)
-                for tarinfo in tar:
-                    folder = os.path.dirname(tarinfo.name)
-                    break
-
-            # recreate diamond file
-            gpkg = GraftMPackage.acquire(folder)
-            if gpkg.version != 3:
-                raise Exception("Encountered an archived gpkg of unexpected version: %d" % gpkg.version)
-            if gpkg.diamond_database_path():
-                logging.debug("Creating diamond DB")
-                gpkg.create_diamond_db()
 
-            shutil.move(folder, output)
+        # Members are written directly into the output directory, so that a
+        # stream need not be spooled to disk first. If anything goes wrong the
+        # partially extracted package is removed.
+        os.mkdir(output)
+        try:
+            if archive_path == Archive.STDIN_PATH:
+                self._extract_stream(sys.stdin.buffer, output, 'stdin')
+            else:
+                with open(archive_path, 'rb') as f:
+                    self._extract_stream(f, output, archive_path)
+        except:
+            shutil.rmtree(output, ignore_errors=True)
+            raise
 
         logging.info("Archive successfully extracted")
 
+    def _extract_stream(self, fileobj, output, archive_name):
+        '''Extract the members of the gzipped tar stream fileobj into the
+        directory output, removing the leading gpkg folder from their
+        paths.'''
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            diamond_future = None
+            gpkg = None
+            folder = None
+            bundled = set()
+            reusable = {}
+            # tarfile's own 'r|gz' mode only reads the first gzip member, but
+            # archives are written as many members by ParallelGzipWriter
+            with gzip.GzipFile(fileobj=fileobj, mode='rb') as decompressed, \
+                    tarfile.open(fileobj=decompressed, mode='r|') as tar:
+                for member in tar:
+                    # Each member is checked before it is extracted.
+                    if folder is None:
+                        folder = member.name.split('/')[0]
+                    member.name = self._member_path_within_package(folder, member)
+                    if member.name == '':
+                        continue
+                    self._check_member_path(output, member)
+                    if member.name == Archive.INDEX_MANIFEST_FILE_NAME:
+                        manifest = json.load(tar.extractfile(member))
+                        bundled = set(entry['path'] for entry in manifest['indexes'])
+                        reusable = self._reusable_indexes(manifest)
+                        continue
+                    if member.name in bundled and member.name not in reusable:
+                        continue
+                    tar.extract(member, output)
+
+                    if gpkg is None and member.name == GraftMPackage._CONTENTS_FILE_NAME:
+                        gpkg = GraftMPackage.acquire(output)
+                        if gpkg.version != 3:
+                            raise Exception("Encountered an archived gpkg of unexpected version: %d" % gpkg.version)
+                    if diamond_future is None and gpkg is not None and gpkg.diamond_database_path() and \
+                            os.path.relpath(gpkg.diamond_database_path(), output) not in reusable and \
+                            os.path.exists(gpkg.unaligned_sequence_database_path()):
+                        # recreate diamond file while the rest is extracted
+                        logging.debug("Creating diamond DB")
+                        diamond_future = pool.submit(gpkg.create_diamond_db)
+
+            if gpkg is None:
+                raise Exception("No %s file found in archive %s" % (GraftMPackage._CONTENTS_FILE_NAME, archive_name))
+            reused = set(path for path, entry in reusable.items() if self._verify_index(output, entry))
+            if diamond_future is None and gpkg.diamond_database_path() and \
+                    os.path.relpath(gpkg.diamond_database_path(), output) not in reused:
+                # bundled database failed its integrity check, or the
+                # archive was made before the unaligned sequences were
+                # written early
+                logging.debug("Creating diamond DB")
+                diamond_future = pool.submit(gpkg.create_diamond_db)
+            if diamond_future is not None:
+                diamond_future.result()
+
+    @staticmethod
+    def _member_path_within_package(folder, member):
+        '''Return the path of the tar member relative to the gpkg folder
+        that all members of an archive are within, or raise an Exception if
+        it is not in that folder or is not a regular file or directory.'''
+        if not (member.isfile() or member.isdir()):
+            raise Exception("Unexpected link or special file in archive: %s" % member.name)
+        name = member.name.rstrip('/')
+        if name == folder:
+            return ''
+        if not name.startswith(folder + '/'):
+            raise Exception("Archive member %s is not within the package folder %s" % (member.name, folder))
+        return name[len(folder)+1:]
+
+    @staticmethod
+    def _check_member_path(directory, member):
+        '''Raise an Exception if the tar member would be extracted outside
+        directory'''
+        abs_directory = os.path.abspath(directory)
+        abs_target = os.path.abspath(os.path.join(directory, member.name))
+        if os.path.isabs(member.name) or \
+                os.path.commonpath([abs_directory, abs_target]) != abs_directory:
+            raise Exception("Attempted Path Traversal in Tar File")
+
     def _setup_output(self, path, force):
         '''Clear the way for an output to be placed at path'''
         # Allow for special case of output being a pipe
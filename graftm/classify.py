@@ -1,9 +1,18 @@
 import json
 import logging
 
+from graftm.compiled_taxonomy import CompiledTaxonomy
+
 class Classify:
     def __init__(self,taxonomy):
-        self.taxonomy=self.readRefpkgTax(taxonomy)
+        ## taxonomy is either the path to the taxtastic taxonomy file of the
+        ## refpkg, or a CompiledTaxonomy of it.
+        if isinstance(taxonomy, CompiledTaxonomy):
+            self.taxonomy=taxonomy.refpkg_taxonomy_hash()
+        else:
+            self.taxonomy=self.readRefpkgTax(taxonomy)
+        self._index_taxonomy()
+        self._placement_cache={}
 
     def readRefpkgTax(self, taxonomy_file):
         ## Read in the taxonomic description of the tree within the refpkg
@@ -13,98 +22,114 @@ class Classify:
 
         return taxonomy_hash
 
-    def assignPlacement(self, placement_json_path, cutoff, resolve_placements):
-        ## Function that reads in classification and returns a 'guppy classify'
-        ## like file
-        all_placements_reads={}
-
-        def getIndex(index, lists):
-            gen_list=[]
-
-            for item in lists:
+    def _index_taxonomy(self):
+        ## Intern each taxon name as an integer, and store every lineage in
+        ## self.taxonomy as a tuple of those integers, so that placements can
+        ## be consolidated without repeatedly comparing and hashing strings.
+        self._taxon_names=[]
+        self._lineage_paths={}
+        name_to_index={}
+        for tax_id, lineage in self.taxonomy.items():
+            path=[]
+            for name in lineage:
                 try:
-                    gen_list.append(item['p'][index])
-                except IndexError:
-                    gen_list.append(None)
-            return gen_list
-
-        def reduceTaxString(placement_hashes, threshold, resolve_placements):
-            confidences=[x['c'] for x in placement_hashes]
-            normalised_confidences =  [x/sum(confidences) for x in confidences]
-            tax_that_meets_threshold={'placement':[],
-                                      'confidence':[]}
-
-            for i in range(0,max([len(x['p']) for x in placement_hashes])):
-                cumil_confidence={}
-                for idx, item in enumerate(getIndex(i, placement_hashes)):
-                    if item:
-                        if item in cumil_confidence.keys():
-                            cumil_confidence[item]+=normalised_confidences[idx]
-                        else:
-                            cumil_confidence[item]=normalised_confidences[idx]
-                if resolve_placements:
-                    best=False
-                    items=sorted([(value, key) for key, value in cumil_confidence.items()], reverse=True)
-                    while best==False:
-                        try:
-                            best_place=items.pop(0)
-                            parents=[x['p'] for x in placement_hashes if best_place[1] in x['p']][0]
-                            idx=parents.index(best_place[1])
-
-                            if idx==0:
-                                tax_that_meets_threshold['placement'].append(best_place[1])
-                                tax_that_meets_threshold['confidence'].append(best_place[0])
-                                best=True
-                            else:
-                                if parents[idx-1] in tax_that_meets_threshold['placement']:
-                                    tax_that_meets_threshold['placement'].append(best_place[1])
-                                    tax_that_meets_threshold['confidence'].append(best_place[0])
-                                    best=True
-                                else:
-                                    continue
-                        except IndexError:
-                            break
-                else:
-                    best_place=max([(value, key) for key, value in list(cumil_confidence.items())])
-                    if best_place[0]>threshold:
-                        tax_that_meets_threshold['placement'].append(best_place[1])
-                        tax_that_meets_threshold['confidence'].append(best_place[0])
-
-            if tax_that_meets_threshold['placement']:
-                return tax_that_meets_threshold
+                    path.append(name_to_index[name])
+                except KeyError:
+                    name_to_index[name]=len(self._taxon_names)
+                    self._taxon_names.append(name)
+                    path.append(name_to_index[name])
+            self._lineage_paths[tax_id]=tuple(path)
+
+    def _reduce_paths(self, placement_hashes, threshold, resolve_placements):
+        ## Given a list of (lineage path, confidence) pairs, walk down the ranks
+        ## and find the deepest placement that can be trusted.
+        confidences=[x[1] for x in placement_hashes]
+        total_confidence=sum(confidences)
+        normalised_confidences=[x/total_confidence for x in confidences]
+        tax_that_meets_threshold={'placement':[],
+                                  'confidence':[]}
+
+        # The parent of each taxon, taken from the first lineage in which it
+        # appears.
+        parent_of={}
+        for path, _ in placement_hashes:
+            for idx, item in enumerate(path):
+                if item not in parent_of:
+                    parent_of[item]=(path[idx-1] if idx > 0 else None)
+
+        placed=set()
+        for i in range(0,max([len(x[0]) for x in placement_hashes])):
+            cumil_confidence={}
+            for idx, (path, _) in enumerate(placement_hashes):
+                if i < len(path):
+                    item=path[i]
+                    if item in cumil_confidence:
+                        cumil_confidence[item]+=normalised_confidences[idx]
+                    else:
+                        cumil_confidence[item]=normalised_confidences[idx]
+            if resolve_placements:
+                # Sort by confidence then name, as the name-keyed
+                # implementation did, to break ties identically.
+                items=sorted([(value, self._taxon_names[key], key) for key, value in cumil_confidence.items()],
+                             reverse=True)
+                for confidence, _, item in items:
+                    parent=parent_of[item]
+                    if parent is None or parent in placed:
+                        tax_that_meets_threshold['placement'].append(item)
+                        tax_that_meets_threshold['confidence'].append(confidence)
+                        placed.add(item)
+                        break
             else:
-                raise Exception("Programming error.")
-
-
-        def forcePlacement(placement_list, rank):
-            ranks=['kingdom', 'class', 'phylum', 'order', 'family', 'species']
-            rank_idx=ranks.index(rank)
-
-        def consolidatePlacements(placement_list, cutoff, lwr_idx, c_idx, resolve_placements, place_group):
-            seen={}
-            for placement in placement_list:
-                rank=placement[0]
-                confidence=placement[lwr_idx]
-                if placement[0] not in seen:
-                    try:
-                        taxonomy_string=self.taxonomy[rank]
-                    except KeyError:
-                        # TODO: Deal with null placements better.
-                        logging.warning("null placement encountered in group: %s" % ', '.join([x[0] for x in place_group]))
-                        continue
-                    seen[rank]={'c':confidence,
-                                'p':taxonomy_string}
-                else:
-                    seen[rank]['c']+=confidence
-
-            seen_items_0_1 = list(seen.items())[0][1]
-            if len(seen)==1 and seen_items_0_1['c']>=0.75: # If there is one entry in seen, and that entry has full confidence.
-                return {'placement': seen_items_0_1['p'],
-                        'confidence': [seen_items_0_1['c']]*len(seen_items_0_1['p'])} # Return that tax
-            elif len(seen)>1: # If there is more than one entry
-                return reduceTaxString(list(seen.values()), cutoff, resolve_placements)
+                best_place=max([(value, self._taxon_names[key], key) for key, value in cumil_confidence.items()])
+                if best_place[0]>threshold:
+                    tax_that_meets_threshold['placement'].append(best_place[2])
+                    tax_that_meets_threshold['confidence'].append(best_place[0])
+                    placed.add(best_place[2])
+
+        if tax_that_meets_threshold['placement']:
+            tax_that_meets_threshold['placement']=[self._taxon_names[x] for x in tax_that_meets_threshold['placement']]
+            return tax_that_meets_threshold
+        else:
+            raise Exception("Programming error.")
+
+    def _consolidate_placements(self, placement_key, cutoff, resolve_placements):
+        ## Find the best placement for a tuple of (classification,
+        ## like_weight_ratio) pairs. The result depends only on this tuple, and
+        ## the cutoff and resolve_placements settings, so memoise it.
+        cache_key=(placement_key, cutoff, resolve_placements)
+        try:
+            return self._placement_cache[cache_key]
+        except KeyError:
+            pass
+
+        seen={}
+        for rank, confidence in placement_key:
+            if rank not in seen:
+                seen[rank]=confidence
+            else:
+                seen[rank]+=confidence
+
+        if len(seen)==1:
+            rank, confidence=list(seen.items())[0]
+            if confidence>=0.75: # If there is one entry in seen, and that entry has full confidence.
+                taxonomy_string=self.taxonomy[rank]
+                best_place={'placement': taxonomy_string,
+                            'confidence': [confidence]*len(taxonomy_string)} # Return that tax
             else:
                 raise Exception("Programming Error: Classify; assignPlacement; consolidatePlacements")
+        elif len(seen)>1: # If there is more than one entry
+            best_place=self._reduce_paths([(self._lineage_paths[rank], confidence) for rank, confidence in seen.items()],
+                                          cutoff, resolve_placements)
+        else:
+            raise Exception("Programming Error: Classify; assignPlacement; consolidatePlacements")
+
+        self._placement_cache[cache_key]=best_place
+        return best_place
+
+    def assignPlacement(self, placement_json_path, cutoff, resolve_placements):
+        ## Function that reads in classification and returns a 'guppy classify'
+        ## like file
+        all_placements_reads={}
 
         placement_hash=json.load(open(placement_json_path)) # read in placement json
         try: # Search for the idx of the like field ratio and classification
@@ -114,7 +139,14 @@ class Classify:
             raise Exception('Fatal error in refpkg, classification or like_weight_ratio fields missing')
 
         for placement_group in placement_hash['placements']: # for each placement
-            best_place=consolidatePlacements(placement_group['p'], cutoff, lwr_idx, c_idx, resolve_placements, placement_group['nm']) # Find the best placement
+            placement_key=[]
+            for placement in placement_group['p']:
+                if placement[c_idx] in self.taxonomy:
+                    placement_key.append((placement[c_idx], placement[lwr_idx]))
+                else:
+                    # TODO: Deal with null placements better.
+                    logging.warning("null placement encountered in group: %s" % ', '.join([x[0] for x in placement_group['nm']]))
+            best_place=self._consolidate_placements(tuple(placement_key), cutoff, resolve_placements) # Find the best placement
             if best_place: # if it exists
                 reads=[x[0] for x in placement_group['nm']] # make a list of the reads assigned to that placement
                 for read in reads: # and for each read
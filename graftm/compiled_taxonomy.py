@@ -0,0 +1,269 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+class CompiledTaxonomy:
+    '''A taxtastic taxonomy and seqinfo pair compiled into a single binary file
+    which can be memory-mapped, so that it is loaded in constant time rather
+    than re-parsed on every run.
+
+    The file consists of a header followed by little-endian arrays:
+
+        magic             8 bytes, CompiledTaxonomy._MAGIC
+        metadata length   uint32
+        metadata          JSON (counts, source file stamps), padded to 8 bytes
+        string offsets    int64[num_strings+1] into the string blob
+        string blob       UTF-8 encoded, interned tax_ids and sequence names
+        taxon names       int32[num_taxa], index into the string table
+        taxon parents     int32[num_taxa], index of parent taxon, -1 for none
+        taxon depths      int32[num_taxa], 0 for Root
+        sequence names    int32[num_sequences], index into the string table
+        sequence taxa     int32[num_sequences], index of the taxon
+
+    Lineages are materialised lazily, once per taxon, and then shared by
+    every sequence assigned to that taxon.
+    '''
+
+    # Changed when the format or the way it is parsed changes, so that files
+    # compiled by earlier versions are regenerated
+    _MAGIC = b'GMTAXv2\0'
+    _SOURCE_STAMPS_KEY = 'sources'
+
+    def __init__(self, buffer, metadata, data_offset):
+        self._buffer = buffer
+        self.metadata = metadata
+        view = memoryview(buffer)
+        num_strings = metadata['num_strings']
+        num_taxa = metadata['num_taxa']
+        num_sequences = metadata['num_sequences']
+
+        offset = data_offset
+        self._string_offsets = view[offset:offset+8*(num_strings+1)].cast('q')
+        offset += 8*(num_strings+1)
+        self._strings_start = offset
+        offset += metadata['string_blob_length']
+        offset += -offset % 4
+        self._taxon_names = view[offset:offset+4*num_taxa].cast('i')
+        offset += 4*num_taxa
+        self._taxon_parents = view[offset:offset+4*num_taxa].cast('i')
+        offset += 4*num_taxa
+        self._taxon_depths = view[offset:offset+4*num_taxa].cast('i')
+        offset += 4*num_taxa
+        self._sequence_names = view[offset:offset+4*num_sequences].cast('i')
+        offset += 4*num_sequences
+        self._sequence_taxa = view[offset:offset+4*num_sequences].cast('i')
+
+        self._strings = {}
+        self._lineages = {}
+        self._taxon_index = None
+
+    @staticmethod
+    def _source_stamps(taxonomy_path, seqinfo_path):
+        stamps = []
+        for path in (taxonomy_path, seqinfo_path):
+            st = os.stat(path)
+            stamps.append([st.st_size, st.st_mtime_ns])
+        return stamps
+
+    @staticmethod
+    def compile(taxonomy_io, seqinfo_io, sources=None):
+        '''Parse a taxtastic taxonomy and seqinfo file, with the same
+        semantics as Getaxnseq.read_taxtastic_taxonomy_and_seqinfo, and return
+        the compiled representation as bytes. Lineages are read from the
+        non-empty rank columns, as per Classify.readRefpkgTax, so taxa with an
+        empty middle rank keep the ranks after it.
+
+        Parameters
+        ----------
+        taxonomy_io: io
+            open taxtastic taxonomy file
+        seqinfo_io: io
+            open taxtastic seqinfo file
+        sources: list or None
+            stamps of the source files, stored so staleness can be detected
+
+        Returns
+        -------
+        bytes
+        '''
+        strings = []
+        string_index = {}
+        def intern(s):
+            try:
+                return string_index[s]
+            except KeyError:
+                string_index[s] = len(strings)
+                strings.append(s)
+                return string_index[s]
+
+        taxon_names = array('i')
+        taxon_depths = array('i')
+        parent_names = []
+        taxon_to_index = {}
+        expected_number_of_fields = None
+        for line in taxonomy_io:
+            splits = line.strip().split(',')
+            if expected_number_of_fields is None:
+                expected_number_of_fields = len(splits)
+                continue #this is the header line
+            elif len(splits) != expected_number_of_fields:
+                raise Exception("Encountered error parsing taxonomy file, expected %i fields but found %i on line: %s" %
+                                (expected_number_of_fields, len(splits), line))
+            tax_id = splits[0]
+            # The lineage is made of the non-empty rank columns, as in
+            # Classify.readRefpkgTax, so an empty middle rank is skipped
+            # rather than ending the lineage
+            rank_ids = [s for s in splits[5:] if s]
+            taxon_to_index[tax_id] = len(taxon_names)
+            taxon_names.append(intern(tax_id))
+            taxon_depths.append(len(rank_ids))
+            parent_names.append(rank_ids[-2] if len(rank_ids) > 1 else None)
+
+        taxon_parents = array('i', [-1]*len(taxon_names))
+        for i, parent in enumerate(parent_names):
+            if parent is not None and parent in taxon_to_index:
+                taxon_parents[i] = taxon_to_index[parent]
+
+        sequence_names = array('i')
+        sequence_taxa = array('i')
+        for i, line in enumerate(seqinfo_io):
+            if i==0: continue #skip header line
+
+            splits = line.strip().split(',')
+            if len(splits) != 2:
+                raise Exception("Bad formatting of seqinfo file on this line: %s" % line)
+            sequence_names.append(intern(splits[0]))
+            sequence_taxa.append(taxon_to_index[splits[1]])
+
+        encoded = [s.encode('utf-8') for s in strings]
+        string_offsets = array('q', [0])
+        for e in encoded:
+            string_offsets.append(string_offsets[-1]+len(e))
+        blob = b''.join(encoded)
+
+        metadata = {'num_strings': len(strings),
+                    'num_taxa': len(taxon_names),
+                    'num_sequences': len(sequence_names),
+                    'string_blob_length': len(blob),
+                    CompiledTaxonomy._SOURCE_STAMPS_KEY: sources}
+        metadata_bytes = json.dumps(metadata).encode('utf-8')
+        metadata_bytes += b' ' * (-(len(CompiledTaxonomy._MAGIC)+4+len(metadata_bytes)) % 8)
+
+        chunks = [CompiledTaxonomy._MAGIC,
+                  struct.pack('<I', len(metadata_bytes)),
+                  metadata_bytes,
+                  string_offsets.tobytes(),
+                  blob,
+                  b'\0' * (-len(blob) % 4)]
+        for a in (taxon_names, taxon_parents, taxon_depths, sequence_names, sequence_taxa):
+            chunks.append(a.tobytes())
+        return b''.join(chunks)
+
+    @staticmethod
+    def _from_buffer(buffer):
+        magic_length = len(CompiledTaxonomy._MAGIC)
+        if bytes(buffer[:magic_length]) != CompiledTaxonomy._MAGIC:
+            raise Exception("Unexpected format of compiled taxonomy file")
+        metadata_length = struct.unpack('<I', buffer[magic_length:magic_length+4])[0]
+        metadata_start = magic_length+4
+        metadata = json.loads(bytes(buffer[metadata_start:metadata_start+metadata_length]).decode('utf-8'))
+        return CompiledTaxonomy(buffer, metadata, metadata_start+metadata_length)
+
+    @staticmethod
+    def load(compiled_path):
+        '''Memory-map a compiled taxonomy file and return a CompiledTaxonomy'''
+        with open(compiled_path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return CompiledTaxonomy._from_buffer(buffer)
+
+    @staticmethod
+    def acquire(taxonomy_path, seqinfo_path, compiled_path):
+        '''Return the CompiledTaxonomy of the given taxtastic files, loading it
+        from compiled_path if it is up to date, and otherwise (re-)generating
+        it there. If compiled_path cannot be written, the compiled taxonomy is
+        kept in memory only.'''
+        sources = CompiledTaxonomy._source_stamps(taxonomy_path, seqinfo_path)
+        if os.path.exists(compiled_path):
+            try:
+                compiled = CompiledTaxonomy.load(compiled_path)
+                if compiled.metadata[CompiledTaxonomy._SOURCE_STAMPS_KEY] == sources:
+                    return compiled
+                logging.debug("Compiled taxonomy %s is out of date, regenerating" % compiled_path)
+            except Exception as e:
+                logging.debug("Unable to read compiled taxonomy %s (%s), regenerating" % (compiled_path, e))
+
+        logging.debug("Compiling taxonomy from %s and %s" % (taxonomy_path, seqinfo_path))
+        with open(taxonomy_path) as tax:
+            with open(seqinfo_path) as seqinfo:
+                data = CompiledTaxonomy.compile(tax, seqinfo, sources)
+        try:
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(compiled_path)),
+                                             prefix='.graftm_taxonomy', delete=False) as f:
+                f.write(data)
+            os.replace(f.name, compiled_path)
+        except OSError as e:
+            logging.debug("Unable to write compiled taxonomy to %s (%s), keeping it in memory only" % (compiled_path, e))
+            return CompiledTaxonomy._from_buffer(data)
+        return CompiledTaxonomy.load(compiled_path)
+
+    def _string(self, i):
+        try:
+            return self._strings[i]
+        except KeyError:
+            s = bytes(self._buffer[self._strings_start+self._string_offsets[i]:
+                                   self._strings_start+self._string_offsets[i+1]]).decode('utf-8')
+            self._strings[i] = s
+            return s
+
+    def num_taxa(self):
+        return self.metadata['num_taxa']
+
+    def taxon_name(self, taxon):
+        '''Return the tax_id of the taxon with the given index'''
+        return self._string(self._taxon_names[taxon])
+
+    def taxon_index(self, tax_id):
+        '''Return the index of the taxon with the given tax_id'''
+        if self._taxon_index is None:
+            self._taxon_index = {self.taxon_name(i): i for i in range(self.num_taxa())}
+        return self._taxon_index[tax_id]
+
+    def lineage(self, taxon):
+        '''Return the lineage of the taxon with the given index, not including
+        Root, as a list of tax_ids. The same list object is returned for every
+        call, so it must not be modified.'''
+        try:
+            return self._lineages[taxon]
+        except KeyError:
+            pass
+        depth = self._taxon_depths[taxon]
+        if depth == 0:
+            lineage = []
+        else:
+            parent = self._taxon_parents[taxon]
+            if depth == 1:
+                lineage = [self.taxon_name(taxon)]
+            elif parent < 0:
+                raise KeyError(self.taxon_name(taxon))
+            else:
+                lineage = self.lineage(parent)[-(depth-1):]+[self.taxon_name(taxon)]
+        self._lineages[taxon] = lineage
+        return lineage
+
+    def taxonomy_hash(self):
+        '''Return a dictionary of sequence_name => taxonomy, where the taxonomy
+        is a list of tax_ids, as per
+        Getaxnseq.read_taxtastic_taxonomy_and_seqinfo. Sequences of the same
+        taxon share the same list.'''
+        return {self._string(self._sequence_names[i]): self.lineage(self._sequence_taxa[i])
+                for i in range(self.metadata['num_sequences'])}
+
+    def refpkg_taxonomy_hash(self):
+        '''Return a dictionary of tax_id => ['Root']+lineage for each taxon,
+        as per Classify.readRefpkgTax'''
+        return {self.taxon_name(i): ['Root']+self.lineage(i)
+                for i in range(self.num_taxa())}
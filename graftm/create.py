@@ -9,7 +9,6 @@ import extern
 import json
 import signal
 import re
-import itertools
 from dendropy import Tree
 
 from Bio import SeqIO
@@ -25,6 +24,10 @@ from graftm.graftm_package import GraftMPackageVersion3, GraftMPackage
 from graftm.decorator import Decorator
 from graftm.greengenes_taxonomy import GreenGenesTaxonomy
 from graftm.sequence_searcher import SequenceSearcher
+from graftm.task_graph import TaskGraph
+from graftm.package_tester import PackageTester
+
+class RerootingFailedException(Exception): pass
 
 class InsufficientGraftMPackageVersion(Exception):
     pass
@@ -32,6 +35,8 @@ class InsufficientGraftMPackageVersion(Exception):
 class Create:
     _PROTEIN_PACKAGE_TYPE = 'protein_package_type'
     _NUCLEOTIDE_PACKAGE_TYPE = 'nucleotide_package_type'
+    # hmmbuild --symfrac default
+    _HMMBUILD_MATCH_COLUMN_FRACTION = 0.5
 
     def __init__(self, commands):
         '''
@@ -195,20 +200,34 @@ class Create:
     def _check_aln_length(self, alignment):
         return len(list(SeqIO.parse(open(alignment, 'r'), 'fasta'))[0].seq)
 
-    def _build_tree(self, alignment, base, ptype, fasttree):
+    def _fasttree_command(self, fasttree, threads):
+        '''Return the command to run fasttree limited to the given number of
+        threads, or using all available threads if threads is None'''
+        if threads is None:
+            return fasttree
+        return "OMP_NUM_THREADS=%i %s" % (threads, fasttree)
+
+    def _build_tree(self, alignment, base, ptype, fasttree, starting_tree=None,
+                    threads=None):
         log_file = base + ".tre.log"
         tre_file = base + ".tre"
+        fasttree = self._fasttree_command(fasttree, threads)
+        # Optimise from a starting tree containing every sequence in the
+        # alignment rather than building the tree from scratch
+        intree = " -intree '%s'" % starting_tree if starting_tree else ""
         if ptype == Create._NUCLEOTIDE_PACKAGE_TYPE: # If it's a nucleotide sequence
-            cmd = "%s -quiet -gtr -nt -log %s -out %s %s" % (fasttree,
-                                                             log_file,
-                                                             tre_file,
-                                                             alignment)
+            cmd = "%s -quiet -gtr -nt%s -log %s -out %s %s" % (fasttree,
+                                                               intree,
+                                                               log_file,
+                                                               tre_file,
+                                                               alignment)
             extern.run(cmd)
         else: # Or if its an amino acid sequence
-            cmd = "%s -quiet -log %s -out %s %s" % (fasttree,
-                                                    log_file,
-                                                    tre_file,
-                                                    alignment)
+            cmd = "%s -quiet%s -log %s -out %s %s" % (fasttree,
+                                                      intree,
+                                                      log_file,
+                                                      tre_file,
+                                                      alignment)
             extern.run(cmd)
 
         self.the_trash += [log_file, tre_file]
@@ -263,7 +282,9 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
        )
                               )
 
-                exit(2)
+                # This runs in a step of the create TaskGraph, so raise
+                # rather than exit, letting the other steps finish first
+                raise RerootingFailedException()
 
 
             try:
@@ -333,7 +354,8 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
         return max_range
 
     def _generate_tree_log_file(self, tree, alignment, output_tree_file_path,
-                               output_log_file_path, residue_type, fasttree):
+                               output_log_file_path, residue_type, fasttree,
+                               threads=None):
         '''Generate the FastTree log file given a tree and the alignment that
         made that tree
 
@@ -341,6 +363,7 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
         -------
         Nothing. The log file as parameter is written as the log file.
         '''
+        fasttree = self._fasttree_command(fasttree, threads)
         if residue_type==Create._NUCLEOTIDE_PACKAGE_TYPE:
             cmd = "%s -quiet -gtr -nt -nome -mllen -intree '%s' -log %s -out %s %s" %\
                                        (fasttree, tree, output_log_file_path,
@@ -351,6 +374,58 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
                                         output_tree_file_path, alignment)
         extern.run(cmd)
 
+    def _insufficiently_aligned_sequences(self, alignment_file, excluded_names,
+                                          min_aligned_fraction):
+        '''Predict which sequences of an alignment would be insufficiently
+        aligned to an HMM built by hmmbuild from it, once the sequences in
+        excluded_names are removed. hmmbuild makes columns where at least
+        half of the sequences have a residue into match columns, so as
+        sequences are removed the match columns are recalculated, until no
+        more sequences cover min_aligned_fraction or less of them. hmmbuild
+        also weights sequences, so the prediction is not exact, and should be
+        checked against the HMM that is built.
+
+        Parameters
+        ----------
+        alignment_file: str
+            path to the aligned sequences in FASTA format
+        excluded_names: collection of str
+            names of sequences already removed
+        min_aligned_fraction: float
+            as per _check_reads_hit
+
+        Returns
+        -------
+        list of str: names of the further sequences to remove
+        '''
+        import numpy as np
+        names = []
+        aligned = []
+        with open(alignment_file) as f:
+            for name, seq, _ in SequenceIO().each(f):
+                names.append(name)
+                aligned.append(seq)
+        if not names:
+            return []
+        if len(set(len(seq) for seq in aligned)) != 1:
+            raise Exception("Alignment file appears to not be of uniform length")
+        residues = np.frombuffer(''.join(aligned).encode(), dtype=np.uint8)\
+            .reshape(len(names), len(aligned[0]))
+        residues = (residues != ord('-')) & (residues != ord('.'))
+
+        excluded_names = set(excluded_names)
+        initially_kept = np.array([name not in excluded_names for name in names])
+        kept = initially_kept.copy()
+        while kept.any():
+            match_columns = residues[kept].sum(axis=0) >= \
+                Create._HMMBUILD_MATCH_COLUMN_FRACTION * kept.sum()
+            min_length = int(min_aligned_fraction * match_columns.sum())
+            failing = kept & (residues[:, match_columns].sum(axis=1) <= min_length)
+            if not failing.any():
+                break
+            kept &= ~failing
+        return [name for name, removed in zip(names, initially_kept & ~kept) if removed]
+
     def _remove_sequences_from_alignment(self, sequence_names, input_alignment_file, output_alignment_file):
         '''Remove sequences from the alignment file that have names in
         sequence_names
@@ -479,26 +554,38 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
         None
         '''
         if package_type == Create._PROTEIN_PACKAGE_TYPE:
-            search_re = re.compile(r'([^ACDEFGHIKLMNPQRSTVWY\-X])',re.IGNORECASE)
+            standard_characters = 'ACDEFGHIKLMNPQRSTVWY-X'
             replace_char = 'X'
+            table = {}
         elif package_type == Create._NUCLEOTIDE_PACKAGE_TYPE:
-            search_re = re.compile(r'([^ATGC\-N])',re.IGNORECASE)
+            standard_characters = 'ATGC-N'
             replace_char = 'N'
+            # U is converted to T rather than being masked
+            table = {ord('U'): 'T', ord('u'): 't'}
+        standard_characters = set(standard_characters + standard_characters.lower())
+        standard_characters.update(chr(c) for c in table)
 
+        total_counts = {}
+        num_masked_sequences = 0
         for s in sequences:
-            if package_type == Create._NUCLEOTIDE_PACKAGE_TYPE:
-                s.seq = s.seq.replace('U','T')
-                s.seq = s.seq.replace('u','t')
-            newseq = s.seq
-            m = search_re.search(newseq)
-            while m:
+            strange_characters = set(s.seq).difference(standard_characters)
+            if strange_characters:
+                counts = dict((c, s.seq.count(c)) for c in sorted(strange_characters))
                 logging.warning(
-                    "Found a non-standard character in the "
-                    "sequence of %s: e.g. '%s'" % (
-                        s.name, m.group()))
-                newseq = newseq[:m.start()] + replace_char + newseq[(m.start()+1):]
-                m = search_re.search(newseq)
-            s.seq = newseq
+                    "Found non-standard characters in the sequence of %s, replacing them with %s: %s" % (
+                        s.name, replace_char,
+                        ", ".join("'%s' x%i" % (c, n) for c, n in counts.items())))
+                for c, n in counts.items():
+                    total_counts[c] = total_counts.get(c, 0) + n
+                num_masked_sequences += 1
+                sequence_table = dict(table)
+                sequence_table.update((ord(c), replace_char) for c in strange_characters)
+                s.seq = s.seq.translate(sequence_table)
+            elif table:
+                s.seq = s.seq.translate(table)
+        if num_masked_sequences > 0:
+            logging.warning("Replaced %i non-standard characters in %i sequences with %s" % (
+                sum(total_counts.values()), num_masked_sequences, replace_char))
 
     def _check_for_duplicate_sequence_names(self, fasta_file_path):
         """Test if the given fasta file contains sequences with duplicate
@@ -522,7 +609,7 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
             found_sequence_names.add(name)
         return False
 
-    def _test_package(self, package_path):
+    def _test_package(self, package_path, threads=1):
         '''Give a GraftM package a spin, and see if it works in reality with default
         parameters (i.e. pplacer). If it does not work, then raise an error.
 
@@ -530,21 +617,10 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
         ----------
         package_path: str
             path to graftm_package to be tested
+        threads: int
+            number of threads to use
         '''
-        pkg = GraftMPackage.acquire(package_path)
-        with tempfile.TemporaryDirectory() as graftM_graft_test_dir_name:
-            # Take a subset of sequences for testing
-            with tempfile.NamedTemporaryFile(suffix=".fa",mode='w') as tf:
-                seqio = SequenceIO()
-                with open(pkg.unaligned_sequence_database_path()) as f:
-                    seqio.write_fasta(
-                        itertools.islice(seqio.each_sequence(f), 10),
-                        tf)
-                tf.flush()
-                cmd = "graftM graft --forward %s --graftm_package %s --output_directory %s --force" %(
-                    tf.name, package_path, graftM_graft_test_dir_name)
-                extern.run(cmd)
-
+        PackageTester().test(package_path, threads=threads)
 
     def main(self, **kwargs):
         alignment = kwargs.pop('alignment',None)
@@ -641,65 +717,96 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
                                                     output_alignment)
         else:
             logging.info("Aligning sequences to create aligned FASTA file")
-            ptype, output_alignment = self._align_and_create_hmm(sequences, alignment, user_hmm,
-                                               align_hmm, output_alignment, threads)
+            if user_hmm:
+                ptype, output_alignment = self._align_and_create_hmm(sequences, alignment, user_hmm,
+                                                   align_hmm, output_alignment, threads)
+            else:
+                # Keep the mafft alignment, so the HMM can be rebuilt from it
+                # if sequences are removed below
+                mafft_alignment_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.mafft.faa')
+                tempfiles_to_close.append(mafft_alignment_fh)
+                mafft_alignment = mafft_alignment_fh.name
+                self._align_sequences(sequences, mafft_alignment, threads)
+                ptype = self._get_hmm_from_alignment(mafft_alignment,
+                                                     align_hmm,
+                                                     output_alignment)
 
         logging.info("Checking for incorrect or fragmented reads")
         with open(output_alignment) as f:
             insufficiently_aligned_sequences = self._check_reads_hit(
                 f, min_aligned_percent)
-        while len(insufficiently_aligned_sequences) > 0:
+        if len(insufficiently_aligned_sequences) > 0:
             logging.warning("One or more alignments do not span > %.2f %% of HMM" % (min_aligned_percent*100))
-            for s in insufficiently_aligned_sequences:
+            removed_names = set(insufficiently_aligned_sequences)
+            if user_hmm:
+                # The match columns of the HMM are fixed, so removing
+                # sequences does not change how much of the HMM the others
+                # cover, and the remaining alignment can be kept as is.
+                output_alignment_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.aln.faa')
+                tempfiles_to_close.append(output_alignment_fh)
+                num_sequences = self._remove_sequences_from_alignment(removed_names,
+                                                                      output_alignment,
+                                                                      output_alignment_fh.name)
+                output_alignment = output_alignment_fh.name
+                if alignment:
+                    filtered_alignment_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.aln.faa')
+                    tempfiles_to_close.append(filtered_alignment_fh)
+                    self._remove_sequences_from_alignment(removed_names,
+                                                          alignment,
+                                                          filtered_alignment_fh.name)
+                    alignment = filtered_alignment_fh.name
+            else:
+                # Removing sequences changes the match columns of the HMM
+                # built from the alignment, so that more sequences may then be
+                # insufficiently aligned. Predict which from the alignment
+                # itself, then check the prediction by rebuilding the HMM,
+                # without realigning the sequences.
+                hmm_source_alignment = alignment if alignment else mafft_alignment
+                while len(insufficiently_aligned_sequences) > 0:
+                    removed_names.update(insufficiently_aligned_sequences)
+                    removed_names.update(self._insufficiently_aligned_sequences(
+                        hmm_source_alignment, removed_names, min_aligned_percent))
+                    filtered_alignment_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.aln.faa')
+                    tempfiles_to_close.append(filtered_alignment_fh)
+                    num_sequences = self._remove_sequences_from_alignment(removed_names,
+                                                                          hmm_source_alignment,
+                                                                          filtered_alignment_fh.name)
+                    if num_sequences < 4:
+                        break
+                    logging.info("Rebuilding the HMM from the %i remaining sequences" % num_sequences)
+                    output_alignment_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.aln.faa')
+                    tempfiles_to_close.append(output_alignment_fh)
+                    output_alignment = output_alignment_fh.name
+                    ptype = self._get_hmm_from_alignment(filtered_alignment_fh.name,
+                                                         align_hmm,
+                                                         output_alignment)
+                    logging.info("Checking for incorrect or fragmented reads")
+                    with open(output_alignment) as f:
+                        insufficiently_aligned_sequences = self._check_reads_hit(
+                            f, min_aligned_percent)
+                if alignment:
+                    alignment = filtered_alignment_fh.name
+
+            for s in sorted(removed_names):
                 logging.warning("Insufficient alignment of %s, not including this sequence" % s)
-
-            sequences2_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.faa')
-            tempfiles_to_close.append(sequences2_fh)
-            sequences2 = sequences2_fh.name
-            num_sequences = self._remove_sequences_from_alignment(insufficiently_aligned_sequences,
-                                                                  sequences,
-                                                                  sequences2)
-            sequences = sequences2
-
             if alignment:
-                alignment2_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.aln.faa')
-                tempfiles_to_close.append(alignment2_fh)
-                alignment2 = alignment2_fh.name
-                num_sequences = self._remove_sequences_from_alignment(insufficiently_aligned_sequences,
-                                                                      alignment,
-                                                                      alignment2)
-                alignment = alignment2
-                for name in insufficiently_aligned_sequences:
+                for name in sorted(removed_names):
                     if rerooted_tree or rerooted_annotated_tree:
                         logging.warning('''Sequence %s in provided alignment does not meet the --min_aligned_percent cutoff. This sequence will be removed from the tree
 in the final GraftM package. If you are sure these sequences are correct, turn off the --min_aligned_percent cutoff, provide it with a 0 (e.g. --min_aligned_percent 0) ''' % name)
                     removed_sequence_names.append(name)
 
+            sequences2_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.faa')
+            tempfiles_to_close.append(sequences2_fh)
+            sequences2 = sequences2_fh.name
+            self._remove_sequences_from_alignment(removed_names,
+                                                  sequences,
+                                                  sequences2)
+            sequences = sequences2
 
-            logging.info("After removing %i insufficiently aligned sequences, left with %i sequences" % (len(insufficiently_aligned_sequences), num_sequences))
+            logging.info("After removing %i insufficiently aligned sequences, left with %i sequences" % (len(removed_names), num_sequences))
             if num_sequences < 4:
                 raise Exception("Too few sequences remaining in alignment after removing insufficiently aligned sequences: %i" % num_sequences)
-            else:
-                logging.info("Reconstructing the alignment and HMM from remaining sequences")
-                output_alignment_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.aln.faa')
-                tempfiles_to_close.append(output_alignment_fh)
-                output_alignment = output_alignment_fh.name
-                if not user_hmm:
-                    align_hmm_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='.hmm')
-                    tempfiles_to_close.append(align_hmm_fh)
-                    align_hmm = align_hmm_fh.name
-                ptype, output_alignment= self._align_and_create_hmm(sequences, alignment, user_hmm,
-                                                   align_hmm, output_alignment, threads)
-                logging.info("Checking for incorrect or fragmented reads")
-                insufficiently_aligned_sequences = self._check_reads_hit(open(output_alignment),
-                                                                         min_aligned_percent)
-        if not search_hmm_files:
-            search_hmm_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='_search.hmm')
-            tempfiles_to_close.append(search_hmm_fh)
-            search_hmm = search_hmm_fh.name
-            self._create_search_hmm(sequences, taxonomy_definition, search_hmm, dereplication_level, threads)
-            search_hmm_files = [search_hmm]
-
         # Make sure each sequence has been assigned a taxonomy:
         aligned_sequence_objects = seqio.read_fasta_file(output_alignment)
         unannotated = []
@@ -741,17 +848,42 @@ in the final GraftM package. If you are sure these sequences are correct, turn o
         sequences2 = sequences2_fh.name
 
 
-        # Create tree unless one was provided
-        if not rerooted_tree and not rerooted_annotated_tree and not unrooted_tree and not no_tree:
-            logging.debug("No tree provided")
-            logging.info("Building tree")
-            log_file, tre_file = self._build_tree(deduplicated_alignment_file,
-                                                  base, ptype,
-                                                  self.fasttree)
-            no_reroot = False
-        elif no_tree:
-            logging.info("Tree-less package requested")
+        # The remaining steps are run as a graph, so that the search HMM, the
+        # DIAMOND database and the tree and reference package, which only
+        # share inputs, are built at the same time.
+        graph = TaskGraph()
+        build_tree = not rerooted_tree and not rerooted_annotated_tree and \
+            not unrooted_tree and not no_tree
+        generate_tree_log = not no_tree and not build_tree and not tree_log
+        tree_uses_threads = build_tree or generate_tree_log
+        if not search_hmm_files and tree_uses_threads:
+            search_hmm_threads = max(1, threads // 2)
+            tree_threads = max(1, threads - search_hmm_threads)
         else:
+            search_hmm_threads = threads
+            tree_threads = threads
+
+        if not search_hmm_files:
+            search_hmm_fh = tempfile.NamedTemporaryFile(prefix='graftm', suffix='_search.hmm')
+            tempfiles_to_close.append(search_hmm_fh)
+            search_hmm = search_hmm_fh.name
+            search_hmm_files = [search_hmm]
+            graph.add('search_hmm',
+                      lambda: self._create_search_hmm(sequences, taxonomy_definition, search_hmm,
+                                                      dereplication_level, search_hmm_threads),
+                      threads=search_hmm_threads)
+
+        def create_tree():
+            # Create tree unless one was provided
+            if build_tree:
+                logging.debug("No tree provided")
+                logging.info("Building tree")
+                log_file, tre_file = self._build_tree(deduplicated_alignment_file,
+                                                      base, ptype,
+                                                      self.fasttree,
+                                                      threads=tree_threads)
+                return log_file, tre_file, False
+
             if rerooted_tree:
                 logging.debug("Found unannotated pre-rerooted tree file %s" % rerooted_tree)
                 tre_file=rerooted_tree
@@ -796,70 +928,85 @@ in the final GraftM package. If you are sure these sequences are correct, turn o
                     cleaner.write_fasttree_newick(tree, f)
                     f.flush()
                     self._generate_tree_log_file(f.name, deduplicated_alignment_file,
-                                                 tre_file, log_file, ptype, self.fasttree)
-
-        # Create tax and seqinfo .csv files
-        taxonomy_to_keep=[
-                          seq.name for seq in
-                                [x for x in [x[0] for x in deduplicated_arrays]
-                                 if x]
-                          ]
-        refpkg = "%s.refpkg" % output_gpkg_path
-        self.the_trash.append(refpkg)
-        if taxtastic_taxonomy and taxtastic_seqinfo:
-            logging.info("Creating reference package")
-            if no_tree:
-                refpkg = self._taxit_create_no_tree(base, deduplicated_alignment_file,
-                                            taxtastic_taxonomy, taxtastic_seqinfo,
-                                            refpkg)
-            else:
-                refpkg = self._taxit_create(base, deduplicated_alignment_file,
-                                            tre_file, log_file, taxtastic_taxonomy,
-                                            taxtastic_seqinfo, refpkg, no_reroot)
+                                                 tre_file, log_file, ptype, self.fasttree,
+                                                 threads=tree_threads)
+            return log_file, tre_file, no_reroot
+
+        if no_tree:
+            logging.info("Tree-less package requested")
         else:
-            gtns = Getaxnseq()
-            seq = base+"_seqinfo.csv"
-            tax = base+"_taxonomy.csv"
-            self.the_trash += [seq, tax]
-            if rerooted_annotated_tree:
-                logging.info("Building seqinfo and taxonomy file from input annotated tree")
-                taxonomy_definition = TaxonomyExtractor().taxonomy_from_annotated_tree(
-                    Tree.get(path=rerooted_annotated_tree, schema='newick'))
-            elif taxonomy:
-                logging.info("Building seqinfo and taxonomy file from input taxonomy")
-                taxonomy_definition = GreenGenesTaxonomy.read_file(taxonomy).taxonomy
+            graph.add('tree', create_tree,
+                      threads=tree_threads if tree_uses_threads else 1)
+
+        def create_refpkg():
+            if not no_tree:
+                log_file, tre_file, no_reroot = graph.result('tree')
+            # Create tax and seqinfo .csv files
+            taxonomy_to_keep=[
+                              seq.name for seq in
+                                    [x for x in [x[0] for x in deduplicated_arrays]
+                                     if x]
+                              ]
+            refpkg = "%s.refpkg" % output_gpkg_path
+            self.the_trash.append(refpkg)
+            if taxtastic_taxonomy and taxtastic_seqinfo:
+                logging.info("Creating reference package")
+                if no_tree:
+                    refpkg = self._taxit_create_no_tree(base, deduplicated_alignment_file,
+                                                taxtastic_taxonomy, taxtastic_seqinfo,
+                                                refpkg)
+                else:
+                    refpkg = self._taxit_create(base, deduplicated_alignment_file,
+                                                tre_file, log_file, taxtastic_taxonomy,
+                                                taxtastic_seqinfo, refpkg, no_reroot)
             else:
-                raise Exception("Programming error: Taxonomy is required somehow e.g. by --taxonomy or --rerooted_annotated_tree")
+                gtns = Getaxnseq()
+                seq = base+"_seqinfo.csv"
+                tax = base+"_taxonomy.csv"
+                self.the_trash += [seq, tax]
+                if rerooted_annotated_tree:
+                    logging.info("Building seqinfo and taxonomy file from input annotated tree")
+                    refpkg_taxonomy = TaxonomyExtractor().taxonomy_from_annotated_tree(
+                        Tree.get(path=rerooted_annotated_tree, schema='newick'))
+                elif taxonomy:
+                    logging.info("Building seqinfo and taxonomy file from input taxonomy")
+                    refpkg_taxonomy = GreenGenesTaxonomy.read_file(taxonomy).taxonomy
+                else:
+                    raise Exception("Programming error: Taxonomy is required somehow e.g. by --taxonomy or --rerooted_annotated_tree")
 
-            taxonomy_definition = {x:taxonomy_definition[x]
-                                   for x in taxonomy_definition
+                refpkg_taxonomy = {x:refpkg_taxonomy[x]
+                                   for x in refpkg_taxonomy
                                    if x in taxonomy_to_keep}
 
-            gtns.write_taxonomy_and_seqinfo_files(taxonomy_definition,
-                                                  tax,
-                                                  seq)
+                gtns.write_taxonomy_and_seqinfo_files(refpkg_taxonomy,
+                                                      tax,
+                                                      seq)
 
-            # Create the reference package
-            logging.info("Creating reference package")
-            if no_tree:
-                refpkg = self._taxit_create_no_tree(base, deduplicated_alignment_file,
-                                                    tax, seq, refpkg)
-            else:
-                refpkg = self._taxit_create(base, deduplicated_alignment_file,
-                                            tre_file, log_file, tax, seq, refpkg,
-                                            no_reroot)
-        if sequences:
+                # Create the reference package
+                logging.info("Creating reference package")
+                if no_tree:
+                    refpkg = self._taxit_create_no_tree(base, deduplicated_alignment_file,
+                                                        tax, seq, refpkg)
+                else:
+                    refpkg = self._taxit_create(base, deduplicated_alignment_file,
+                                                tre_file, log_file, tax, seq, refpkg,
+                                                no_reroot)
+            return refpkg
+
+        graph.add('refpkg', create_refpkg,
+                  dependencies=[] if no_tree else ['tree'])
+
+        if sequences and ptype == Create._PROTEIN_PACKAGE_TYPE:
             # Run diamond makedb
-            logging.info("Creating diamond database")
-            if ptype == Create._PROTEIN_PACKAGE_TYPE:
-                cmd = "diamond makedb --in '%s' -d '%s'" % (sequences, base)
+            def create_diamond_database():
+                logging.info("Creating diamond database")
+                cmd = "diamond makedb --threads 1 --in '%s' -d '%s'" % (sequences, base)
                 extern.run(cmd)
-                diamondb = '%s.dmnd' % base
-            elif ptype == Create._NUCLEOTIDE_PACKAGE_TYPE:
-                diamondb = None
-            else: raise Exception("Programming error")
-        else:
-            diamondb = None
+                return '%s.dmnd' % base
+            # diamond makedb uses all cores unless told otherwise
+            graph.add('diamond', create_diamond_database, threads=1)
+        elif sequences and ptype != Create._NUCLEOTIDE_PACKAGE_TYPE:
+            raise Exception("Programming error")
 
         if sequences:
             # Get range
@@ -867,24 +1014,33 @@ in the final GraftM package. If you are sure these sequences are correct, turn o
         else:
             max_range = self._define_range(alignment)
 
-        # Compile the gpkg
-        logging.info("Compiling gpkg")
+        def compile_gpkg():
+            # Compile the gpkg
+            logging.info("Compiling gpkg")
+            diamondb = graph.result('diamond') if 'diamond' in graph else None
+            GraftMPackageVersion3.compile(output_gpkg_path, graph.result('refpkg'),
+                                          align_hmm, diamondb, max_range, sequences,
+                                          search_hmm_files=search_hmm_files)
+        graph.add('compile', compile_gpkg,
+                  dependencies=[d for d in ['search_hmm', 'refpkg', 'diamond'] if d in graph])
+
+        # Test out the gpkg just to be sure.
+        if not no_tree:
+            def test_gpkg():
+                logging.info("Testing gpkg package works")
+                self._test_package(output_gpkg_path, threads)
+            graph.add('test', test_gpkg, dependencies=['compile'], threads=threads)
 
-        GraftMPackageVersion3.compile(output_gpkg_path, refpkg, align_hmm, diamondb,
-                                      max_range, sequences, search_hmm_files=search_hmm_files)
+        try:
+            graph.run(threads)
+        except RerootingFailedException:
+            graph.log_critical_path()
+            exit(2)
 
         logging.info("Cleaning up")
         self._cleanup(self.the_trash)
         for tf in tempfiles_to_close:
             tf.close()
 
-        # Test out the gpkg just to be sure.
-        #
-        # TODO: Use graftM through internal means rather than via extern. This
-        # requires some refactoring so that graft() can be called easily with
-        # sane defaults.
-        if not no_tree:
-            logging.info("Testing gpkg package works")
-            self._test_package(output_gpkg_path)
-
+        graph.log_critical_path()
         logging.info("Finished\n")
@@ -28,6 +28,19 @@ class ExternalProgramSuite:
                                               "FastTree"]
                                  }
 
+    # Programs found on the PATH in this process, so that repeated checks
+    # e.g. by each job of 'graftM serve' do not search the PATH again.
+    _found_programs = set()
+
+    @staticmethod
+    def _which(program):
+        if program in ExternalProgramSuite._found_programs:
+            return True
+        if extern.which(program):
+            ExternalProgramSuite._found_programs.add(program)
+            return True
+        return False
+
     def __init__(self, program_list):
         '''Given a list of executable names, check that they are available
         on the PATH, raising an exception otherwise
@@ -43,7 +56,7 @@ class ExternalProgramSuite:
             if program in ExternalProgramSuite.programs_to_possibilities:
                 check = [p for p in ExternalProgramSuite\
                                         .programs_to_possibilities[program]
-                         if extern.which(p)]
+                         if ExternalProgramSuite._which(p)]
                 if len(check)>1:
                     logging.warning("Program found with multiple commands: %s. \
 Arbitrarily selecting %s" % (' '.join(program_list), check[0]))
@@ -59,7 +72,7 @@ Arbitrarily selecting %s" % (' '.join(program_list), check[0]))
                 else:
                     uninstalled_programs.append(program)
             else:
-                if not extern.which(program):
+                if not ExternalProgramSuite._which(program):
                     uninstalled_programs.append(program)
 
         if any(uninstalled_programs):
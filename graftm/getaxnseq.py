@@ -121,8 +121,8 @@ class Getaxnseq:
 
         for taxon_id, tax_split in taxonomies.items():
             # Replace spaces with underscores e.g. 'Candidatus my_genus'
-            for idx, item in enumerate(tax_split):
-                tax_split[idx] = re.sub('\s+', '_', item.strip())
+            # (without modifying the input, whose lists may be shared)
+            tax_split = [re.sub('\s+', '_', item.strip()) for item in tax_split]
 
             # Remove 'empty' taxononomies e.g. 's__'
             tax_split = tc.remove_empty_ranks(tax_split)
@@ -2,7 +2,7 @@ import os
 
 class GraftMFiles:
     
-    def __init__(self, old_title, outdir, direction):
+    def __init__(self, old_title, outdir, direction, scratch_directory=None):
         if direction in ['forward', 'reverse', 'interleaved']:
             self.basename = os.path.join(direction, old_title + '_' + direction)
         elif direction == False:
@@ -11,6 +11,10 @@ class GraftMFiles:
             raise Exception('Programming Error.')   
          
         self.outdir = outdir
+        # Intermediate files that are removed before the run finishes, such
+        # as those of each sample and the combined alignment, are written
+        # here e.g. on local disk, rather than in the output directory
+        self.scratch_directory = scratch_directory if scratch_directory else outdir
     
     def search_otu_table(self):
         return os.path.join(self.outdir, "search_otu_table.txt")
@@ -29,65 +33,80 @@ class GraftMFiles:
     def read_tax_output_path(self, out_path):
         return os.path.join(self.outdir, out_path, "%s_read_tax.tsv" % out_path)
 
+    def subsample_statistics_path(self, out_path):
+        return os.path.join(self.outdir, out_path, "%s_subsample_statistics.json" % self.basename)
+
+    def read_tax_table_output_path(self):
+        return os.path.join(self.outdir, "read_tax.grt")
+
     def jplace_output_path(self):
         return "placements.jplace"
     
     def euk_free_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_euk_free.fa" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_euk_free.fa" % self.basename)
     
     def euk_contam_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_euk_contam.txt" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_euk_contam.txt" % self.basename)
     
     def summary_table_output_path(self, out_path):
         return os.path.join(self.outdir, out_path, "%s_count_table.txt" % self.basename)
     
     def krona_output_path(self):
         return os.path.join(self.outdir, "krona.html")
+
+    def profile_path(self):
+        return os.path.join(self.outdir, "profile.json")
+
+    def chrome_trace_path(self):
+        return os.path.join(self.outdir, "profile.trace.json")
+
+    def sample_sheet_results_path(self):
+        return os.path.join(self.outdir, "sample_sheet_results.tsv")
     
     def aligned_fasta_output_path(self, out_path):
         return os.path.join(self.outdir, out_path, "%s_hits.aln.fa" % self.basename)
 
     def orf_output_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_orf" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_orf" % self.basename)
 
     def orf_titles_output_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_orf.titles" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_orf.titles" % self.basename)
 
     def orf_fasta_output_path(self, out_path):
         return os.path.join(self.outdir, out_path, "%s_orf.fa" % self.basename)
 
     def conv_output_for_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_conv_for.faa" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_conv_for.faa" % self.basename)
     
     def output_for_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_for.faa" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_for.faa" % self.basename)
     
     def output_rev_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_rev.faa" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_rev.faa" % self.basename)
     
     def conv_output_rev_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_conv_rev.faa" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_conv_rev.faa" % self.basename)
     
     def comb_aln_fa(self):
-        return os.path.join(self.outdir, "combined_alignment.aln.fa")
+        return os.path.join(self.scratch_directory, "combined_alignment.aln.fa")
 
     def fa_output_path(self, out_path):
         return os.path.join(self.outdir, out_path, "%s_hits.fa" % self.basename)     
         
     def readnames_output_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_readnames.txt" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_readnames.txt" % self.basename)
     
     def sto_output_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s.sto" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s.sto" % self.basename)
 
     def basic_stats_path(self):
         return os.path.join(self.outdir, "basic_stats.txt")
 
     def for_aln_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_for_aln.fa" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_for_aln.fa" % self.basename)
         
     def rev_aln_path(self, out_path):
-        return os.path.join(self.outdir, out_path, "%s_rev_aln.fa" % self.basename)
+        return os.path.join(self.scratch_directory, out_path, "%s_rev_aln.fa" % self.basename)
     
     def combined_biom_output_path(self):
         return os.path.join(self.outdir, "graftm.biom")
@@ -98,5 +117,21 @@ class GraftMFiles:
     def expand_search_hmm_path(self):
         return os.path.join(self.outdir, "expand_search.hmm")
       
+    def intermediate_paths(self, out_path):
+        '''Return the paths of the intermediate files of a sample, which are
+        deleted once the sample has been searched and aligned'''
+        return [self.for_aln_path(out_path),
+                self.rev_aln_path(out_path),
+                self.conv_output_rev_path(out_path),
+                self.conv_output_for_path(out_path),
+                self.euk_free_path(out_path),
+                self.euk_contam_path(out_path),
+                self.readnames_output_path(out_path),
+                self.sto_output_path(out_path),
+                self.orf_titles_output_path(out_path),
+                self.orf_output_path(out_path),
+                self.output_for_path(out_path),
+                self.output_rev_path(out_path)]
+
     def base(self, out_path):
         return os.path.join(self.outdir, out_path, "%s" % self.basename)
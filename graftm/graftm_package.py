@@ -4,7 +4,9 @@ import shutil
 import logging
 import extern
 
-from graftm.getaxnseq import Getaxnseq
+from graftm.compiled_taxonomy import CompiledTaxonomy
+from graftm.package_manifest import PackageManifest
+from graftm.search_hmm_database import SearchHmmDatabase
 
 class InsufficientGraftMPackageException(Exception): pass
 
@@ -20,6 +22,10 @@ class GraftMPackage:
     '''
 
     _CONTENTS_FILE_NAME = 'CONTENTS.json'
+    # Generated on first use from the refpkg taxonomy, not listed in CONTENTS
+    _COMPILED_TAXONOMY_FILE_NAME = 'taxonomy.compiled'
+    # Generated on first use from the search HMMs, along with a sources file
+    _SEARCH_HMM_DATABASE_FILE_NAME = 'search_hmms.binary.hmm'
 
     # The key names are unlikely to change across package format versions,
     # so store them here in the superclass
@@ -35,6 +41,9 @@ class GraftMPackage:
 
     _CURRENT_VERSION = 3
 
+    # Packages loaded by preload(), returned by acquire() without re-reading
+    _preloaded_packages = {}
+
     _REQUIRED_KEYS = {'2': [
                              VERSION_KEY,
                              ALIGNMENT_HMM_KEY,
@@ -56,14 +65,27 @@ class GraftMPackage:
 
 
     @staticmethod
-    def acquire(graftm_package_path):
+    def acquire(graftm_package_path, validation=None, threads=1):
         '''Acquire a new graftm Package
 
         Parameters
         ----------
         graftm_output_path: str
             path to base directory of graftm
+        validation: str or None
+            if not None, one of PackageManifest.VALIDATION_MODES, and raise
+            CorruptGraftMPackageException if the package files do not match
+            the manifest written when it was compiled
+        threads: int
+            number of files to hash at once during full validation
         '''
+        try:
+            return GraftMPackage._preloaded_packages[os.path.realpath(graftm_package_path)]
+        except KeyError:
+            pass
+
+        if validation:
+            PackageManifest.validate(graftm_package_path, validation, threads)
 
         with open(os.path.join(
                 graftm_package_path,
@@ -87,6 +109,33 @@ class GraftMPackage:
         pkg.check_required_keys(GraftMPackage._REQUIRED_KEYS[str(v)])
         return pkg
 
+    @staticmethod
+    def preload(graftm_package_path, validation=None, threads=1):
+        '''Acquire a graftm package, read its taxonomy and work out its type,
+        and keep it so that later calls to acquire() with the same path return
+        the same object. This is used by long running processes that graft many
+        samples with the same packages.
+
+        Parameters
+        ----------
+        graftm_package_path: str
+            path to base directory of graftm package
+        validation: str or None
+            as per acquire()
+        threads: int
+            as per acquire()
+
+        Returns
+        -------
+        The preloaded GraftMPackage
+        '''
+        pkg = GraftMPackage.acquire(graftm_package_path, validation=validation, threads=threads)
+        pkg.compiled_taxonomy()
+        if pkg.version >= 3:
+            pkg.is_protein_package()
+        GraftMPackage._preloaded_packages[os.path.realpath(graftm_package_path)] = pkg
+        return pkg
+
     def check_universal_keys(self, version):
         h = self._contents_hash
         try:
@@ -159,6 +208,34 @@ class GraftMPackageVersion2(GraftMPackage):
         return os.path.join(self.reference_package_path(),
                             self._refpkg_contents()['files']['tree'])
 
+    def compiled_taxonomy_path(self):
+        return os.path.join(self._base_directory,
+                            GraftMPackage._COMPILED_TAXONOMY_FILE_NAME)
+
+    def compiled_taxonomy(self):
+        '''Return a CompiledTaxonomy of the refpkg taxonomy and seqinfo,
+        generating it inside the package the first time it is required, or
+        when the taxtastic files have changed. Cache the result for speed.'''
+        if not hasattr(self, '_compiled_taxonomy'):
+            self._compiled_taxonomy = CompiledTaxonomy.acquire(
+                self.taxtastic_taxonomy_path(),
+                self.taxtastic_seqinfo_path(),
+                self.compiled_taxonomy_path())
+        return self._compiled_taxonomy
+
+    def taxonomy_hash(self):
+        '''Read in the taxonomy and return as a hash of name: taxonomy,
+        where taxonomy is an array of strings. Sequences with the same
+        taxonomy share the same array, so it should not be modified.'''
+        return self.compiled_taxonomy().taxonomy_hash()
+
+    def search_hmm_database(self):
+        '''Return a SearchHmmDatabase of the search HMMs, stored inside the
+        package. It is only generated when acquired.'''
+        return SearchHmmDatabase(
+            self.search_hmm_paths(),
+            os.path.join(self._base_directory, GraftMPackage._SEARCH_HMM_DATABASE_FILE_NAME))
+
     @staticmethod
     def compile(output_package_path, refpkg_path, hmm_path, diamond_database_file, max_range,
                 trusted_cutoff=False, search_hmm_files=None):
@@ -234,6 +311,9 @@ class GraftMPackageVersion2(GraftMPackage):
                   'w') as f:
             json.dump(contents, f)
 
+        PackageManifest.write(output_package_path,
+                              exclude=[diamond_database_file_in_gpkg] if diamond_database_file else [])
+
 
 class GraftMPackageVersion3(GraftMPackageVersion2):
 
@@ -263,15 +343,6 @@ class GraftMPackageVersion3(GraftMPackageVersion2):
         os.rename(diamondb, self.diamond_database_path())
         return diamondb
 
-    def taxonomy_hash(self):
-        '''Read in the taxonomy and return as a hash of name: taxonomy,
-        where taxonomy is an array of strings.'''
-        gtns = Getaxnseq()
-        with open(self.taxtastic_taxonomy_path()) as tax:
-            with open(self.taxtastic_seqinfo_path()) as seqinfo:
-                return gtns.read_taxtastic_taxonomy_and_seqinfo(
-                    tax, seqinfo)
-
     @staticmethod
     def graftm_package_is_protein(graftm_package):
         '''Return true if this package is an Amino Acid alignment package, otherwise
@@ -382,3 +453,8 @@ class GraftMPackageVersion3(GraftMPackageVersion2):
                 output_package_path, GraftMPackage._CONTENTS_FILE_NAME),
                   'w') as f:
             json.dump(contents, f)
+
+        # The DIAMOND database is regenerated when archives are extracted, so
+        # its contents depend on the DIAMOND version and it is not listed
+        PackageManifest.write(output_package_path,
+                              exclude=[diamond_database_file_in_gpkg] if diamond_database_file else [])
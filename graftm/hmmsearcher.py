@@ -1,4 +1,6 @@
+import os
 import logging
+import tempfile
 import extern
 
 class NoInputSequencesException(Exception):
@@ -68,6 +70,64 @@ class HmmSearcher:
                 else:
                     raise e
 
+    def hmmsearch_database(self, input_pipe, database, output_files):
+        r"""Run a single hmmsearch with all the HMMs of a SearchHmmDatabase,
+        generating the same output files as hmmsearch() would. hmmsearch
+        reads the sequences again for each model, so they cannot be streamed
+        from stdin, and are written to a temporary file first. The hits are
+        then split by model into the output file of the HMM file each model
+        came from.
+
+        Parameters
+        ----------
+        input_pipe: String
+            as per hmmsearch()
+        database: SearchHmmDatabase
+            acquired database of the HMMs to search with
+        output_files: list of paths
+            output domtblout files, one for each of database.hmm_paths
+
+        Returns
+        -------
+        N/A
+
+        May raise an exception if hmmsearching went amiss"""
+        if len(database.hmm_paths) != len(output_files):
+            raise Exception("Programming error: number of supplied HMMs differs from the number of supplied output files")
+
+        with tempfile.TemporaryDirectory(prefix='graftm_hmmsearch') as tmp:
+            sequences = os.path.join(tmp, 'sequences.fa')
+            cmd = "%s > %s" % (input_pipe, sequences)
+            logging.debug("Running command: %s" % cmd)
+            extern.run(cmd)
+            if os.path.getsize(sequences) == 0:
+                raise NoInputSequencesException(cmd)
+
+            table = os.path.join(tmp, 'hits.domtblout')
+            cmd = "hmmsearch %s --cpu %s -o /dev/null --noali --domtblout %s %s %s" % (
+                self._extra_args, self._num_cpus, table, database.path, sequences)
+            logging.debug("Running command: %s" % cmd)
+            extern.run(cmd)
+            self._split_table(table, database.model_index, output_files)
+
+    def _split_table(self, table, model_index, output_files):
+        r"""Write each row of a domtblout table to output_files[i], where i is
+        model_index(name of the row's query model). Comment lines are written
+        to every output file."""
+        outputs = [open(path, 'w') for path in output_files]
+        try:
+            with open(table) as f:
+                for line in f:
+                    if line.startswith('#'):
+                        for out in outputs:
+                            out.write(line)
+                    else:
+                        # The query name is the fourth column
+                        outputs[model_index(line.split(None, 4)[3])].write(line)
+        finally:
+            for out in outputs:
+                out.close()
+
     def _munch_off_batch(self, queue):
         r"""Take a batch of sequences off the queue, and return pairs_to_run.
         The queue given as a parameter is affected
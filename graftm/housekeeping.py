@@ -174,7 +174,9 @@ following extensions: %s" % ' '.join(valid_extensions.keys()))
             if not os.path.isdir(args.graftm_package):
                 raise Exception("%s does not exist. Are you sure you provided the correct path?" % args.graftm_package)
             else:
-                gpkg = GraftMPackage.acquire(args.graftm_package)
+                gpkg = GraftMPackage.acquire(args.graftm_package,
+                                             validation=getattr(args, 'package_validation', None),
+                                             threads=args.threads)
                 if hasattr(args, 'search_hmm_files'): # If a hmm is specified, overwrite the one graftM package
                     setattr(args, 'aln_hmm_file', gpkg.alignment_hmm_path())
                     setattr(args, 'reference_package', gpkg.reference_package_path())
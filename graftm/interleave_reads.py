@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+'''Interleave the reads of forward and reverse FASTA files, writing the
+forward then reverse read of each pair to stdout, with /1 and /2 appended to
+their names. This module is run as a script in the shell pipelines built by
+UnpackRawReads, so only uses the standard library.'''
+
+import sys
+import argparse
+
+class MismatchedPairsException(Exception): pass
+
+class ReadInterleaver:
+    DIRECTION_SUFFIXES = (b'/1', b'/2')
+
+    @staticmethod
+    def each_record(input_io):
+        '''Iterate over (header_line, sequence_lines) of binary FASTA input'''
+        header = None
+        sequence_lines = []
+        for line in input_io:
+            if line.startswith(b'>'):
+                if header is not None:
+                    yield header, sequence_lines
+                header = line
+                sequence_lines = []
+            elif header is not None:
+                sequence_lines.append(line)
+        if header is not None:
+            yield header, sequence_lines
+
+    @staticmethod
+    def _tag(header, suffix):
+        '''Return the read name without any direction suffix, and the header
+        line with the given direction suffix'''
+        fields = header[1:].rstrip(b'\r\n').split(None, 1)
+        name = fields[0] if fields else b''
+        if name.endswith(ReadInterleaver.DIRECTION_SUFFIXES[0]) or \
+                name.endswith(ReadInterleaver.DIRECTION_SUFFIXES[1]):
+            name = name[:-2]
+        tagged = b'>' + name + suffix
+        if len(fields) > 1:
+            tagged += b' ' + fields[1]
+        return name, tagged + b'\n'
+
+    def interleave(self, forward_io, reverse_io, output_io):
+        '''Write the interleaved reads, returning the number of pairs. Raise
+        MismatchedPairsException if the files do not contain the same reads
+        in the same order.'''
+        forward_suffix, reverse_suffix = ReadInterleaver.DIRECTION_SUFFIXES
+        forward_records = self.each_record(forward_io)
+        reverse_records = self.each_record(reverse_io)
+        num_pairs = 0
+        for forward in forward_records:
+            reverse = next(reverse_records, None)
+            if reverse is None:
+                raise MismatchedPairsException("There are more forward reads than reverse reads")
+            forward_name, forward_header = self._tag(forward[0], forward_suffix)
+            reverse_name, reverse_header = self._tag(reverse[0], reverse_suffix)
+            if forward_name != reverse_name:
+                raise MismatchedPairsException("Forward read %s is paired with reverse read %s, the reads must be in the same order in both files" % (
+                    forward_name.decode(errors='replace'), reverse_name.decode(errors='replace')))
+            output_io.write(forward_header)
+            output_io.writelines(forward[1])
+            output_io.write(reverse_header)
+            output_io.writelines(reverse[1])
+            num_pairs += 1
+        if next(reverse_records, None) is not None:
+            raise MismatchedPairsException("There are more reverse reads than forward reads")
+        return num_pairs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('forward', help='FASTA file of forward reads')
+    parser.add_argument('reverse', help='FASTA file of reverse reads')
+    args = parser.parse_args()
+
+    with open(args.forward, 'rb') as forward, open(args.reverse, 'rb') as reverse:
+        try:
+            ReadInterleaver().interleave(forward, reverse, sys.stdout.buffer)
+        except MismatchedPairsException as e:
+            sys.stderr.write("Error interleaving %s and %s: %s\n" % (args.forward, args.reverse, e))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
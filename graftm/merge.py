@@ -0,0 +1,171 @@
+import os
+import logging
+from collections import Counter
+
+from graftm.graftm_output_paths import GraftMFiles
+from graftm.housekeeping import HouseKeeping
+from graftm.sample_sheet import SampleSheetRunner
+from graftm.read_taxonomy_table import ReadTaxonomyTable, ReadTaxonomyTableReader
+
+class MergeDefaultOptions:
+    force = False
+    max_samples_for_krona = None
+
+class Merger:
+    '''Combine the results of graft runs into a single OTU table, biom file
+    and krona plot, as if the samples had been run together. Inputs are read
+    one at a time, and only the count of each taxonomy in each sample is
+    kept, so many thousands of samples can be merged.
+
+    Each input is one of:
+
+        a read_tax file (ending in '_read_tax.tsv') of a single sample
+        a read taxonomy table (ending in '.grt') of one or more samples
+        a combined_count_table.txt of one or more samples
+        a graft output directory, in which case its combined_count_table.txt
+            is used, or if it was run with --sample_sheet, the output of each
+            sample that succeeded, named as in the sample sheet
+    '''
+
+    READ_TAX_SUFFIX = '_read_tax.tsv'
+
+    def each_input_file(self, path):
+        '''Yield (file, sample_name) for each read_tax or count table file of
+        an input path. sample_name is the name given to the sample in a
+        sample sheet, or None if the names in the file are to be used.'''
+        if not os.path.isdir(path):
+            if not os.path.isfile(path):
+                raise Exception("Input %s does not appear to exist" % path)
+            yield path, None
+            return
+
+        gmf = GraftMFiles('', path, False)
+        if os.path.isfile(gmf.sample_sheet_results_path()):
+            with open(gmf.sample_sheet_results_path()) as f:
+                header = f.readline().rstrip("\n").split("\t")
+                sample_column = header.index('sample')
+                status_column = header.index('status')
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if fields[status_column] == SampleSheetRunner.SUCCEEDED_STATUS:
+                        # Each sample's table is named after its reads file,
+                        # which may be shared by other samples of the sheet
+                        sample_name = fields[sample_column]
+                        for p, _ in self.each_input_file(os.path.join(path, sample_name)):
+                            yield p, sample_name
+        elif os.path.isfile(gmf.combined_summary_table_output_path()):
+            yield gmf.combined_summary_table_output_path(), None
+        else:
+            raise Exception("No count table found in graft output directory %s" % path)
+
+    @staticmethod
+    def _parse_taxonomy(taxonomy_string):
+        return taxonomy_string.split('; ') if taxonomy_string else []
+
+    def _add_read_tax_file(self, accumulator, path):
+        sample_name = os.path.basename(path)[:-len(Merger.READ_TAX_SUFFIX)]
+        # Count distinct taxonomies rather than keeping each read
+        counts = Counter()
+        with open(path) as f:
+            for line in f:
+                counts[line.rstrip("\n").split("\t", 1)[1]] += 1
+        sample_index = accumulator.add_sample(sample_name)
+        for taxonomy_string, count in counts.items():
+            accumulator.add(sample_index, self._parse_taxonomy(taxonomy_string), count)
+        return [sample_name]
+
+    def _add_read_taxonomy_table(self, accumulator, path):
+        reader = ReadTaxonomyTableReader(path)
+        for sample_name in reader.sample_names():
+            sample_index = accumulator.add_sample(sample_name)
+            for taxonomy, count in reader.taxonomy_counts(sample_name).items():
+                accumulator.add(sample_index, list(taxonomy), count)
+        return reader.sample_names()
+
+    def _add_count_table(self, accumulator, path, sample_name=None):
+        with open(path) as f:
+            header = f.readline().rstrip("\n").split("\t")
+            if len(header) < 2 or header[0] != '#ID' or header[-1] != 'ConsensusLineage':
+                raise Exception("Unexpected header in count table %s" % path)
+            if sample_name is not None:
+                if len(header) != 3:
+                    raise Exception("Expected a single sample in count table %s of sample %s" % (path, sample_name))
+                header[1] = sample_name
+            sample_indices = [accumulator.add_sample(name) for name in header[1:-1]]
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != len(header):
+                    raise Exception("Unexpected number of fields in count table %s on line: %s" % (path, line))
+                taxonomy = self._parse_taxonomy(fields[-1])
+                for sample_index, count in zip(sample_indices, fields[1:-1]):
+                    if count != '0':
+                        accumulator.add(sample_index, taxonomy, int(count))
+        return header[1:-1]
+
+    def merge(self, inputs, output_directory, **kwargs):
+        '''Merge the inputs, writing the combined count table, biom file and
+        krona plot into output_directory.
+
+        Parameters
+        ----------
+        inputs: iterable of str
+            paths to read_tax files, read taxonomy tables, count tables or
+            graft output directories
+        output_directory: str
+            directory to create
+        kwargs:
+            force: bool
+                overwrite output_directory if it exists
+            max_samples_for_krona: int or None
+                do not create a krona plot if there are more samples than
+                this. None for no limit
+
+        Returns
+        -------
+        OtuTableAccumulator of the merged counts
+        '''
+        force = kwargs.pop('force', MergeDefaultOptions.force)
+        max_samples_for_krona = kwargs.pop('max_samples_for_krona', MergeDefaultOptions.max_samples_for_krona)
+        if len(kwargs) > 0:
+            raise Exception("Unexpected arguments detected: %s" % kwargs)
+        # biom and numpy are slow to import, so only import them when needed
+        from biom.util import biom_open
+        from graftm.summarise import Stats_And_Summary, OtuTableAccumulator
+
+        accumulator = OtuTableAccumulator()
+        seen_sample_names = set()
+        for input_path in inputs:
+            for path, sample_name in self.each_input_file(input_path):
+                logging.debug("Reading %s" % path)
+                if path.endswith(Merger.READ_TAX_SUFFIX):
+                    sample_names = self._add_read_tax_file(accumulator, path)
+                elif path.endswith(ReadTaxonomyTable.SUFFIX):
+                    sample_names = self._add_read_taxonomy_table(accumulator, path)
+                else:
+                    sample_names = self._add_count_table(accumulator, path, sample_name)
+                for name in sample_names:
+                    if name in seen_sample_names:
+                        raise Exception("Sample %s was found more than once, in %s and an earlier input" % (name, path))
+                    seen_sample_names.add(name)
+        logging.info("Read %i OTUs from %i samples" % (accumulator.num_otus(), len(accumulator.sample_names)))
+
+        HouseKeeping().make_working_directory(output_directory, force)
+        gmf = GraftMFiles('', output_directory, False)
+        s = Stats_And_Summary()
+        logging.info('Writing summary table')
+        with open(gmf.combined_summary_table_output_path(), 'w') as f:
+            s.write_tabular_otu_table_rows(accumulator.sample_names, accumulator.each_row(), f)
+
+        logging.info('Writing biom file')
+        with biom_open(gmf.combined_biom_output_path(), 'w') as f:
+            biom_successful = s.write_accumulated_biom(accumulator, f, 'GraftM merge')
+        if not biom_successful:
+            os.remove(gmf.combined_biom_output_path())
+
+        if max_samples_for_krona is not None and \
+                len(accumulator.sample_names) > max_samples_for_krona:
+            logging.warning("Skipping creation of Krona diagram since there are too many input samples. The maximum can be overridden using --max_samples_for_krona")
+        else:
+            logging.info('Building summary krona plot')
+            s.write_accumulated_krona_plot(accumulator, gmf.krona_output_path())
+        return accumulator
@@ -0,0 +1,179 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+class CorruptGraftMPackageException(Exception): pass
+
+class PackageManifest:
+    '''A list of the files in a GraftM package along with their sizes and
+    blake2b checksums, written when the package is compiled. It allows
+    packages that have been corrupted or only partially copied to be detected
+    before they are used, rather than failing part way through a run.
+
+    Files generated from the others after the package is compiled, such as
+    the compiled taxonomy, and the DIAMOND database, which is regenerated
+    when a package is extracted from an archive, are not listed.
+
+    There are two levels of validation. Quick validation checks that each
+    file exists and has the expected size. Full validation also checks each
+    checksum, and records the size and modification time of the files that
+    passed in a cache file in the package (or in memory if the package cannot
+    be written to), so that they are not hashed again until they change.'''
+
+    FILE_NAME = 'MANIFEST.json'
+    _VALIDATION_CACHE_FILE_NAME = '.graftm_validated.json'
+    _VERSION = 1
+    _ALGORITHM = 'blake2b'
+
+    NO_VALIDATION = 'none'
+    QUICK_VALIDATION = 'quick'
+    FULL_VALIDATION = 'full'
+    VALIDATION_MODES = [NO_VALIDATION, QUICK_VALIDATION, FULL_VALIDATION]
+
+    # Validation caches of packages that could not be written to, by path
+    _memory_caches = {}
+
+    @staticmethod
+    def checksum(path):
+        '''Return the blake2b hex digest of the file at path'''
+        h = hashlib.blake2b()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def _stamp(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    @staticmethod
+    def write(package_path, exclude=None, threads=1):
+        '''Write the manifest of all files in a package directory.
+
+        Parameters
+        ----------
+        package_path: str
+            path to the package
+        exclude: list of str
+            paths relative to package_path of files not to list
+        threads: int
+            number of files to hash at once
+        '''
+        excluded = set([PackageManifest.FILE_NAME,
+                        PackageManifest._VALIDATION_CACHE_FILE_NAME])
+        if exclude:
+            excluded.update(exclude)
+        paths = []
+        for directory, _, filenames in os.walk(package_path):
+            for filename in filenames:
+                relative_path = os.path.relpath(os.path.join(directory, filename), package_path)
+                if relative_path not in excluded:
+                    paths.append(relative_path)
+        paths.sort()
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            checksums = list(pool.map(
+                lambda p: PackageManifest.checksum(os.path.join(package_path, p)), paths))
+        manifest = {'version': PackageManifest._VERSION,
+                    'algorithm': PackageManifest._ALGORITHM,
+                    'files': dict(
+                        (path, {'size': os.path.getsize(os.path.join(package_path, path)),
+                                'checksum': checksum})
+                        for path, checksum in zip(paths, checksums))}
+        with open(os.path.join(package_path, PackageManifest.FILE_NAME), 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    @staticmethod
+    def validate(package_path, mode, threads=1):
+        '''Raise CorruptGraftMPackageException if the files of a package do not
+        match its manifest. Packages without a manifest are not checked.
+
+        Parameters
+        ----------
+        package_path: str
+            path to the package
+        mode: str
+            one of VALIDATION_MODES
+        threads: int
+            number of files to hash at once during full validation
+        '''
+        if mode not in PackageManifest.VALIDATION_MODES:
+            raise Exception("Unexpected package validation mode: %s" % mode)
+        if mode == PackageManifest.NO_VALIDATION:
+            return
+        manifest_path = os.path.join(package_path, PackageManifest.FILE_NAME)
+        if not os.path.exists(manifest_path):
+            logging.debug("No manifest found in GraftM package %s, not validating it" % package_path)
+            return
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['version'] != PackageManifest._VERSION:
+            raise CorruptGraftMPackageException("Unsupported manifest version %s in GraftM package %s" % (
+                manifest['version'], package_path))
+
+        logging.debug("Validating GraftM package %s (%s)" % (package_path, mode))
+        errors = []
+        stamps = {}
+        for path, entry in manifest['files'].items():
+            full_path = os.path.join(package_path, path)
+            if not os.path.isfile(full_path):
+                errors.append("%s is missing" % path)
+                continue
+            stamps[path] = PackageManifest._stamp(full_path)
+            if stamps[path][0] != entry['size']:
+                errors.append("%s is %i bytes, expected %i" % (path, stamps[path][0], entry['size']))
+        if not errors and mode == PackageManifest.FULL_VALIDATION:
+            errors = PackageManifest._validate_checksums(package_path, manifest, stamps, threads)
+        if errors:
+            raise CorruptGraftMPackageException(
+                "GraftM package %s appears to be corrupt or incompletely copied: %s" % (
+                    package_path, ", ".join(errors)))
+
+    @staticmethod
+    def _validate_checksums(package_path, manifest, stamps, threads):
+        '''Return a list of errors for the files whose checksum does not match
+        the manifest, skipping those unchanged since they were last
+        validated.'''
+        cache_path = os.path.join(package_path, PackageManifest._VALIDATION_CACHE_FILE_NAME)
+        manifest_stamp = PackageManifest._stamp(os.path.join(package_path, PackageManifest.FILE_NAME))
+        cache = PackageManifest._memory_caches.get(os.path.realpath(package_path))
+        if cache is None and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    cache = json.load(f)
+            except ValueError:
+                cache = None
+        if cache is None or cache.get('manifest') != manifest_stamp:
+            cache = {'manifest': manifest_stamp, 'files': {}}
+
+        to_check = [path for path in manifest['files']
+                    if cache['files'].get(path) != stamps[path]]
+        if not to_check:
+            logging.debug("All files of GraftM package %s were validated previously" % package_path)
+            return []
+
+        logging.info("Checking the integrity of %i files of GraftM package %s" % (len(to_check), package_path))
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            checksums = list(pool.map(
+                lambda p: PackageManifest.checksum(os.path.join(package_path, p)), to_check))
+        errors = []
+        for path, checksum in zip(to_check, checksums):
+            if checksum == manifest['files'][path]['checksum']:
+                cache['files'][path] = stamps[path]
+            else:
+                errors.append("%s does not match its checksum" % path)
+                cache['files'].pop(path, None)
+
+        try:
+            with tempfile.NamedTemporaryFile('w', dir=package_path, prefix='.graftm_validated',
+                                             delete=False) as f:
+                json.dump(cache, f)
+            os.replace(f.name, cache_path)
+        except OSError as e:
+            logging.debug("Unable to write validation cache to %s (%s), keeping it in memory only" % (cache_path, e))
+            PackageManifest._memory_caches[os.path.realpath(package_path)] = cache
+        return errors
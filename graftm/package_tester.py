@@ -0,0 +1,138 @@
+import os
+import logging
+import argparse
+import itertools
+import tempfile
+
+from graftm.graftm_package import GraftMPackage
+from graftm.graftm_output_paths import GraftMFiles
+from graftm.housekeeping import HouseKeeping
+from graftm.sequence_io import SequenceIO
+from graftm.sequence_searcher import SequenceSearcher
+from graftm.unpack_sequences import UnpackRawReads
+from graftm.clusterer import Clusterer
+from graftm.pplacer import Pplacer
+from graftm.profiler import Profiler
+
+class PackageTesterDefaultOptions:
+    num_sequences = 10
+    threads = 1
+
+class PackageTester:
+    '''Check that a GraftM package works by running some of its own sequences
+    through the search, align and place steps of the graft pipeline, in this
+    process and with the default graft parameters. Summary tables and krona
+    plots are not generated.'''
+
+    SEARCH_STEP = 'search'
+    ALIGN_STEP = 'align'
+    PLACE_STEP = 'place'
+    STEPS = [SEARCH_STEP, ALIGN_STEP, PLACE_STEP]
+
+    # Defaults of 'graftM graft'
+    _EVALUE = '1e-5'
+    _MIN_ORF_LENGTH = 96
+    _PLACEMENTS_CUTOFF = 0.75
+    _MIN_ALIGNED_FILTER_FOR_NUCLEOTIDE_PACKAGES = 95
+    _MIN_ALIGNED_FILTER_FOR_AMINO_ACID_PACKAGES = 30
+
+    _PROTEIN_PIPELINE = 'P'
+    _NUCLEOTIDE_PIPELINE = 'D'
+    _TEST_SEQUENCES_NAME = 'graftm_package_test'
+
+    def test(self, package_path, **kwargs):
+        '''Run the test, raising an exception if any step fails.
+
+        Parameters
+        ----------
+        package_path: str
+            path to the GraftM package to test
+        kwargs:
+            num_sequences: int
+                number of sequences of the package to use
+            threads: int
+                number of threads to use for searching and placing
+
+        Returns
+        -------
+        dict of step name to the wall time it took in seconds
+        '''
+        num_sequences = kwargs.pop('num_sequences', PackageTesterDefaultOptions.num_sequences)
+        threads = kwargs.pop('threads', PackageTesterDefaultOptions.threads)
+        if len(kwargs) > 0:
+            raise Exception("Unexpected arguments detected: %s" % kwargs)
+
+        gpkg = GraftMPackage.acquire(package_path)
+        hk = HouseKeeping()
+        pipeline, trusted_cutoff = hk.setpipe(gpkg.alignment_hmm_path())
+        evalue = '--cut_tc' if trusted_cutoff else PackageTester._EVALUE
+        if pipeline == PackageTester._NUCLEOTIDE_PIPELINE:
+            filter_minimum = PackageTester._MIN_ALIGNED_FILTER_FOR_NUCLEOTIDE_PACKAGES
+        else:
+            filter_minimum = PackageTester._MIN_ALIGNED_FILTER_FOR_AMINO_ACID_PACKAGES
+        searcher = SequenceSearcher(gpkg.search_hmm_paths(), gpkg.alignment_hmm_path(),
+                                    search_hmm_database=gpkg.search_hmm_database())
+        profiler = Profiler(package=package_path)
+
+        with tempfile.TemporaryDirectory(prefix='graftm_package_test') as output_directory:
+            base = PackageTester._TEST_SEQUENCES_NAME
+            test_sequences = os.path.join(output_directory, base+'.fa')
+            seqio = SequenceIO()
+            with open(gpkg.unaligned_sequence_database_path()) as f:
+                with open(test_sequences, 'w') as out:
+                    seqio.write_fasta(
+                        itertools.islice(seqio.each_sequence(f), num_sequences), out)
+            os.mkdir(os.path.join(output_directory, base))
+            files = GraftMFiles(base, output_directory, False)
+            unpack = UnpackRawReads(test_sequences)
+
+            with profiler.activate():
+                with profiler.stage(PackageTester.SEARCH_STEP):
+                    if pipeline == PackageTester._PROTEIN_PIPELINE:
+                        result, complement_information = searcher.aa_db_search(
+                            files, base, unpack, HouseKeeping.HMMSEARCH_SEARCH_METHOD,
+                            gpkg.maximum_range(), threads, evalue,
+                            PackageTester._MIN_ORF_LENGTH, None,
+                            gpkg.diamond_database_path(), '')
+                    else:
+                        result, complement_information = searcher.nt_db_search(
+                            files, base, unpack, False, HouseKeeping.HMMSEARCH_SEARCH_METHOD,
+                            gpkg.maximum_range(), threads, evalue)
+
+                if not result.hit_fasta() or os.path.getsize(result.hit_fasta()) == 0:
+                    logging.warning("None of the %i sequences used to test GraftM package %s were found by searching it" % (
+                        num_sequences, package_path))
+                    return self._timings(profiler)
+
+                aligned = files.aligned_fasta_output_path(base)
+                with profiler.stage(PackageTester.ALIGN_STEP):
+                    searcher.align(result.hit_fasta(), aligned, complement_information,
+                                   pipeline, filter_minimum)
+                if not os.path.exists(aligned):
+                    with open(aligned, 'w'):
+                        pass
+
+                with profiler.stage(PackageTester.PLACE_STEP):
+                    clusterer = Clusterer()
+                    seqs_list = clusterer.cluster([aligned], False)
+                    placement_options = argparse.Namespace(
+                        keep_intermediates=False,
+                        threads=threads,
+                        placements_cutoff=PackageTester._PLACEMENTS_CUTOFF)
+                    assignments = Pplacer(gpkg.reference_package_path()).place(
+                        False, seqs_list, False,
+                        GraftMFiles('', output_directory, False),
+                        placement_options, result.slash_endings,
+                        gpkg.compiled_taxonomy(), clusterer)
+                    assignments = clusterer.uncluster_annotations(assignments, False)
+
+        num_placed = sum(len(a) for a in assignments.values())
+        logging.debug("Placed %i sequences when testing GraftM package %s" % (num_placed, package_path))
+        return self._timings(profiler)
+
+    def _timings(self, profiler):
+        timings = dict((step, profiler.total_wall_seconds(step))
+                       for step in PackageTester.STEPS)
+        logging.info("Time taken by each step of the package test: %s" % ", ".join(
+            "%s %ss" % (step, timings[step]) for step in PackageTester.STEPS))
+        return timings
@@ -0,0 +1,99 @@
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+class ParallelGzipWriterDefaultOptions:
+    threads = 1
+    compresslevel = 9
+    block_size = 1 << 20
+
+class ParallelGzipWriter:
+    '''A write-only file object which gzip compresses the data written to it
+    using several threads. The data is split into blocks which are each
+    compressed as a separate gzip member, as pigz --independent does, so the
+    output can be read by gzip, pigz and Python's gzip and tarfile modules.
+    zlib releases the GIL while compressing, so blocks are compressed in
+    parallel. At most two blocks per thread are held in memory at once.'''
+
+    def __init__(self, fileobj, **kwargs):
+        '''
+        Parameters
+        ----------
+        fileobj: file object
+            binary file to write the compressed data to, which is not closed
+            by close()
+        kwargs:
+            threads: int
+                number of blocks to compress at once
+            compresslevel: int
+                zlib compression level, 1-9
+            block_size: int
+                number of uncompressed bytes in each gzip member
+        '''
+        threads = kwargs.pop('threads', ParallelGzipWriterDefaultOptions.threads)
+        compresslevel = kwargs.pop('compresslevel', ParallelGzipWriterDefaultOptions.compresslevel)
+        block_size = kwargs.pop('block_size', ParallelGzipWriterDefaultOptions.block_size)
+        if len(kwargs) > 0:
+            raise Exception("Unexpected arguments detected: %s" % kwargs)
+        self._fileobj = fileobj
+        self._compresslevel = compresslevel
+        self._block_size = block_size
+        self._max_pending = 2*threads
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._pending = []
+        self._num_blocks = 0
+        self._buffer = bytearray()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _compress(self, block):
+        # wbits of 31 gives a gzip header and trailer
+        compressor = zlib.compressobj(self._compresslevel, zlib.DEFLATED, 31)
+        return compressor.compress(block) + compressor.flush()
+
+    def _submit(self, block):
+        self._num_blocks += 1
+        self._pending.append(self._pool.submit(self._compress, block))
+        # Write out finished blocks in order, waiting for the oldest when too
+        # many are held in memory.
+        while self._pending and (len(self._pending) > self._max_pending or self._pending[0].done()):
+            self._fileobj.write(self._pending.pop(0).result())
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed ParallelGzipWriter")
+        view = memoryview(data).cast('B')
+        length = len(view)
+        if self._buffer:
+            needed = self._block_size - len(self._buffer)
+            self._buffer += view[:needed]
+            view = view[needed:]
+            if len(self._buffer) < self._block_size:
+                return length
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        while len(view) >= self._block_size:
+            self._submit(bytes(view[:self._block_size]))
+            view = view[self._block_size:]
+        self._buffer += view
+        return length
+
+    def close(self):
+        if self.closed: return
+        try:
+            if self._buffer or self._num_blocks == 0:
+                # Always write at least one member, so empty input gives a
+                # valid gzip file
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            for future in self._pending:
+                self._fileobj.write(future.result())
+            self._pending = []
+            self._fileobj.flush()
+        finally:
+            self._pool.shutdown()
+            self.closed = True
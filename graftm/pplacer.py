@@ -6,10 +6,9 @@ import re
 
 from Bio import SeqIO
 
-from graftm.timeit import Timer
+from graftm.profiler import Profiler
 from graftm.classify import Classify
 from graftm.housekeeping import HouseKeeping
-T=Timer()
 
 
 class Pplacer:
@@ -141,7 +140,6 @@ class Pplacer:
             with open(alias_hash[alias_idx]['output_path'], 'w') as output_io:
                 json.dump(output, output_io, ensure_ascii=False, indent=3, separators=(',', ': '))
 
-    @T.timeit
     def place(self, reverse_pipe, seqs_list, resolve_placements, files, args,
               slash_endings, tax_descr, clusterer):
         '''
@@ -172,13 +170,15 @@ class Pplacer:
             dictionary of reads and their trusted placements
         '''
         trusted_placements = {}
-        files_to_delete = []
-        # Merge the alignments so they can all be placed at once.
+        # Merge the alignments so they can all be placed at once. Each
+        # intermediate is removed as soon as it is no longer needed.
         alias_hash = self.alignment_merger(seqs_list, files.comb_aln_fa())
-        files_to_delete += seqs_list
-        files_to_delete.append(files.comb_aln_fa())
+        if not args.keep_intermediates:
+            self.hk.delete(seqs_list)
         if os.path.getsize(files.comb_aln_fa()) == 0:
             logging.debug("Combined alignment file has 0 size, not running pplacer")
+            if not args.keep_intermediates:
+                self.hk.delete([files.comb_aln_fa()])
             to_return = {}
             for idx, file in enumerate(seqs_list):
                 base_file=os.path.basename(file).replace('_forward_hits.aln.fa', '')
@@ -186,17 +186,19 @@ class Pplacer:
             return to_return
 
         # Run pplacer on merged file
-        jplace = self.pplacer(files.jplace_output_path(), args.output_directory, files.comb_aln_fa(), args.threads)
-        files_to_delete.append(jplace)
+        jplace = self.pplacer(files.jplace_output_path(), files.scratch_directory, files.comb_aln_fa(), args.threads)
+        if not args.keep_intermediates:
+            self.hk.delete([files.comb_aln_fa()])
         logging.info("Placements finished")
 
         #Read the json of refpkg
         logging.info("Reading classifications")
-        classifications=Classify(tax_descr).assignPlacement(
-                                                           jplace,
-                                                           args.placements_cutoff,
-                                                           resolve_placements
-                                                           )
+        with Profiler.current_stage('classify'):
+            classifications=Classify(tax_descr).assignPlacement(
+                                                               jplace,
+                                                               args.placements_cutoff,
+                                                               resolve_placements
+                                                               )
         logging.info("Reads classified")
         # If the reverse pipe has been specified, run the comparisons between the two pipelines. If not then just return.
 
@@ -239,7 +241,8 @@ class Pplacer:
         self.write_jplace(jplace_json,
                           alias_hash)
 
-        self.hk.delete(files_to_delete)# Remove combined split, not really useful
+        if not args.keep_intermediates:
+            self.hk.delete([jplace])# Remove combined split, not really useful
 
         return trusted_placements
 
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import logging
+import resource
+import threading
+import contextlib
+import contextvars
+
+import extern
+
+class Profiler:
+    '''Record the resources used by each stage of a pipeline, and by each
+    external command run through extern.run while a stage is running.
+
+    Each record holds the wall time, the CPU time of graftM itself and of the
+    commands it ran, the peak resident set size of graftM and of its
+    commands, and the bytes read and written. Records are tagged with the
+    name of the stage and any tags given to the Profiler or to the stage, e.g.
+    the sample and the GraftM package.
+
+    prof = Profiler(package='my.gpkg')
+    with prof.activate():
+        with prof.stage('search', sample='sample1'):
+            extern.run('hmmsearch ...')
+    prof.write_json('profile.json')
+
+    CPU time, memory and I/O are measured for the whole process, so when
+    several profilers are active in different threads at once (e.g. with
+    'graftM serve') the records of overlapping stages include each other's
+    usage. Peak RSS is the high water mark of the process, or of its largest
+    reaped child, at the end of the stage, as reported by getrusage.
+    '''
+
+    STAGE_KIND = 'stage'
+    COMMAND_KIND = 'command'
+
+    _current = contextvars.ContextVar('graftm_profiler', default=None)
+    _original_extern_run = None
+    _install_lock = threading.Lock()
+
+    def __init__(self, **tags):
+        self.tags = tags
+        self.records = []
+        self._tag_stack = [{}]
+        self._start = time.perf_counter()
+        self._start_epoch = time.time()
+
+    @staticmethod
+    def _install():
+        '''Wrap extern.run so that commands run while a profiler is active are
+        recorded. This only needs to be done once per process.'''
+        with Profiler._install_lock:
+            if Profiler._original_extern_run is None:
+                Profiler._original_extern_run = extern.run
+                extern.run = Profiler._profiled_extern_run
+
+    @staticmethod
+    def _profiled_extern_run(command, *args, **kwargs):
+        profiler = Profiler._current.get()
+        if profiler is None:
+            return Profiler._original_extern_run(command, *args, **kwargs)
+        with profiler.command(command):
+            return Profiler._original_extern_run(command, *args, **kwargs)
+
+    @contextlib.contextmanager
+    def activate(self):
+        '''Record external commands run in this thread with this profiler
+        while the context is open.'''
+        Profiler._install()
+        token = Profiler._current.set(self)
+        try:
+            yield self
+        finally:
+            Profiler._current.reset(token)
+
+    @staticmethod
+    def current_stage(name, **tags):
+        '''Return a context recording a stage with the profiler active in
+        this thread, or one that does nothing if there is none. This allows
+        stages to be recorded without passing the profiler around.'''
+        profiler = Profiler._current.get()
+        if profiler is None:
+            return contextlib.nullcontext()
+        return profiler.stage(name, **tags)
+
+    @staticmethod
+    def _io_bytes():
+        '''Return bytes read and written by this process so far, including
+        those of reaped children.'''
+        try:
+            counters = {}
+            with open('/proc/self/io') as f:
+                for line in f:
+                    key, value = line.split(':')
+                    counters[key] = int(value)
+            return counters['rchar'], counters['wchar']
+        except (OSError, KeyError, ValueError):
+            # Fall back to block counts where /proc is not available
+            usage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+            return sum(u.ru_inblock for u in usage)*512, sum(u.ru_oublock for u in usage)*512
+
+    def _snapshot(self):
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        read_bytes, write_bytes = Profiler._io_bytes()
+        return {'time': time.perf_counter(),
+                'cpu': own.ru_utime+own.ru_stime,
+                'children_cpu': children.ru_utime+children.ru_stime,
+                'peak_rss': own.ru_maxrss,
+                'children_peak_rss': children.ru_maxrss,
+                'read_bytes': read_bytes,
+                'write_bytes': write_bytes}
+
+    @contextlib.contextmanager
+    def _record(self, kind, name, tags, extra):
+        before = self._snapshot()
+        failed = True
+        try:
+            yield
+            failed = False
+        except SystemExit as e:
+            # graft exits with status 0 when stopping early on purpose
+            failed = e.code not in (None, 0)
+            raise
+        finally:
+            after = self._snapshot()
+            record = {'kind': kind,
+                      'name': name,
+                      'tags': tags,
+                      'start_seconds': round(before['time']-self._start, 6),
+                      'wall_seconds': round(after['time']-before['time'], 6),
+                      'cpu_seconds': round(after['cpu']-before['cpu'], 6),
+                      'children_cpu_seconds': round(after['children_cpu']-before['children_cpu'], 6),
+                      'peak_rss_kb': after['peak_rss'],
+                      'children_peak_rss_kb': after['children_peak_rss'],
+                      'read_bytes': after['read_bytes']-before['read_bytes'],
+                      'write_bytes': after['write_bytes']-before['write_bytes'],
+                      'thread': threading.get_ident(),
+                      'failed': failed}
+            record.update(extra)
+            self.records.append(record)
+
+    @contextlib.contextmanager
+    def stage(self, name, **tags):
+        '''Record a stage of the pipeline. Tags of enclosing stages are
+        inherited, and the stage name is recorded as the 'stage' tag of
+        commands run within it.'''
+        stage_tags = dict(self._tag_stack[-1])
+        stage_tags.update(tags)
+        stage_tags['stage'] = name
+        self._tag_stack.append(stage_tags)
+        try:
+            with self._record(Profiler.STAGE_KIND, name, dict(self.tags, **stage_tags), {}):
+                yield
+        finally:
+            self._tag_stack.pop()
+
+    def command(self, command):
+        '''Record the running of an external command.'''
+        name = command.split()[0] if command.split() else command
+        return self._record(Profiler.COMMAND_KIND, name,
+                            dict(self.tags, **self._tag_stack[-1]),
+                            {'command': command})
+
+    def total_wall_seconds(self, stage_name):
+        '''Return the wall time of all stages with the given name, rounded to
+        hundredths of a second, or 'n/a' if there were none.'''
+        times = [r['wall_seconds'] for r in self.records
+                 if r['kind'] == Profiler.STAGE_KIND and r['name'] == stage_name]
+        if not times:
+            return 'n/a'
+        return round(sum(times), 2)
+
+    def write_json(self, path):
+        '''Write all records as JSON to path.'''
+        with open(path, 'w') as f:
+            json.dump({'tags': self.tags,
+                       'start_time': self._start_epoch,
+                       'pid': os.getpid(),
+                       'records': sorted(self.records, key=lambda r: r['start_seconds'])},
+                      f, indent=1)
+
+    def write_chrome_trace(self, path):
+        '''Write all records to path in the Trace Event Format, which can be
+        viewed in chrome://tracing or https://ui.perfetto.dev'''
+        events = []
+        for record in self.records:
+            args = dict(record['tags'])
+            for key in ('cpu_seconds', 'children_cpu_seconds', 'peak_rss_kb',
+                        'children_peak_rss_kb', 'read_bytes', 'write_bytes',
+                        'failed', 'command'):
+                if key in record:
+                    args[key] = record[key]
+            events.append({'name': record['name'],
+                           'cat': record['kind'],
+                           'ph': 'X',
+                           'ts': int(record['start_seconds']*1e6),
+                           'dur': int(record['wall_seconds']*1e6),
+                           'pid': os.getpid(),
+                           'tid': record['thread'],
+                           'args': args})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events}, f)
+        logging.debug("Wrote chrome trace to %s" % path)
@@ -0,0 +1,251 @@
+import io
+import sys
+import json
+import zlib
+import struct
+from array import array
+from collections import Counter
+
+class ReadTaxonomyTableFormatError(Exception):
+    pass
+
+class ReadTaxonomyTable:
+    '''A compact, columnar store of the taxonomy assigned to each read of one
+    or more samples, used as an alternative to writing one _read_tax.tsv file
+    per sample. Each distinct lineage is stored once, and each read refers to
+    its lineage by number.
+
+    The file is laid out as follows, with all integers little endian:
+
+        magic             8 bytes, 'GRAFTMRT'
+        then for each sample, in the order they were added:
+            read names    zlib compressed, newline separated UTF-8
+            lineage ids   one unsigned 32 bit integer per read, being the
+                          index of the read's lineage in the lineage list
+        index             UTF-8 JSON object (see below)
+        index length      unsigned 64 bit integer
+        magic             8 bytes, 'GRAFTMRT'
+
+    The index is written last, so that samples can be written one at a time
+    without holding them all in memory. It has the keys:
+
+        version           format version, currently 1
+        lineages          list of lineages, each a list of taxon names
+        samples           list of objects, one per sample, with keys 'name',
+                          'num_reads', 'names_offset', 'names_length',
+                          'ids_offset' and 'ids_length' giving the location of
+                          the sample's columns in the file, in bytes
+
+    Counting the reads of a sample or finding the reads of a taxon only
+    requires reading the lineage ids, not the (much larger) read names.
+    '''
+
+    MAGIC = b'GRAFTMRT'
+    VERSION = 1
+    SUFFIX = '.grt'
+    _LENGTH_FORMAT = '<Q'
+    _ID_TYPECODE = 'I'
+
+class ReadTaxonomyTableWriter:
+    '''Write a ReadTaxonomyTable one sample at a time. Use as a context
+    manager, or call close() once all samples have been added.'''
+
+    def __init__(self, path):
+        self._path = path
+        self._io = open(path, 'wb')
+        self._io.write(ReadTaxonomyTable.MAGIC)
+        self._lineage_ids = {}
+        self._lineages = []
+        self._samples = []
+        self._sample_names = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_sample(self, sample_name, placements):
+        '''Add the read taxonomies of a sample.
+
+        Parameters
+        ----------
+        sample_name: str
+            name of the sample, which must not have been added before
+        placements: dict
+            read name to taxonomy, as a list of taxon names
+        '''
+        if sample_name in self._sample_names:
+            raise Exception("Sample %s was added to %s more than once" % (sample_name, self._path))
+        self._sample_names.add(sample_name)
+        lineage_ids = self._lineage_ids
+        ids = array(ReadTaxonomyTable._ID_TYPECODE)
+        names = []
+        for read_name, taxonomy in placements.items():
+            if "\n" in read_name:
+                raise Exception("Read names cannot contain newlines: %s" % read_name)
+            key = tuple(taxonomy)
+            lineage_id = lineage_ids.get(key)
+            if lineage_id is None:
+                lineage_id = len(self._lineages)
+                lineage_ids[key] = lineage_id
+                self._lineages.append(list(key))
+            ids.append(lineage_id)
+            names.append(read_name)
+        if ids.itemsize != 4:
+            raise Exception("Programming error: unexpected lineage id size %i" % ids.itemsize)
+        if sys.byteorder == 'big':
+            ids.byteswap()
+
+        names_bytes = zlib.compress("\n".join(names).encode('utf8'))
+        sample = {'name': sample_name,
+                  'num_reads': len(ids),
+                  'names_offset': self._io.tell(),
+                  'names_length': len(names_bytes)}
+        self._io.write(names_bytes)
+        sample['ids_offset'] = self._io.tell()
+        ids_bytes = ids.tobytes()
+        sample['ids_length'] = len(ids_bytes)
+        self._io.write(ids_bytes)
+        self._samples.append(sample)
+
+    def close(self):
+        if self._io is None: return
+        index = json.dumps({'version': ReadTaxonomyTable.VERSION,
+                            'lineages': self._lineages,
+                            'samples': self._samples}).encode('utf8')
+        self._io.write(index)
+        self._io.write(struct.pack(ReadTaxonomyTable._LENGTH_FORMAT, len(index)))
+        self._io.write(ReadTaxonomyTable.MAGIC)
+        self._io.close()
+        self._io = None
+
+class ReadTaxonomyTableReader:
+    '''Query a file written by ReadTaxonomyTableWriter. Only the index is read
+    when the file is opened; the columns of each sample are read as they are
+    needed.'''
+
+    def __init__(self, path):
+        self._path = path
+        footer_length = struct.calcsize(ReadTaxonomyTable._LENGTH_FORMAT) + len(ReadTaxonomyTable.MAGIC)
+        with open(path, 'rb') as f:
+            if f.read(len(ReadTaxonomyTable.MAGIC)) != ReadTaxonomyTable.MAGIC:
+                raise ReadTaxonomyTableFormatError("%s does not appear to be a GraftM read taxonomy table" % path)
+            f.seek(0, io.SEEK_END)
+            file_length = f.tell()
+            if file_length < len(ReadTaxonomyTable.MAGIC) + footer_length:
+                raise ReadTaxonomyTableFormatError("%s appears to be truncated" % path)
+            f.seek(file_length - footer_length)
+            footer = f.read(footer_length)
+            if footer[-len(ReadTaxonomyTable.MAGIC):] != ReadTaxonomyTable.MAGIC:
+                raise ReadTaxonomyTableFormatError("%s appears to be truncated" % path)
+            index_length = struct.unpack(ReadTaxonomyTable._LENGTH_FORMAT,
+                                         footer[:-len(ReadTaxonomyTable.MAGIC)])[0]
+            f.seek(file_length - footer_length - index_length)
+            index = json.loads(f.read(index_length).decode('utf8'))
+        if index['version'] != ReadTaxonomyTable.VERSION:
+            raise ReadTaxonomyTableFormatError("Unsupported read taxonomy table version %s in %s" % (
+                index['version'], path))
+        self.lineages = index['lineages']
+        self._samples = index['samples']
+        self._sample_indices = dict((s['name'], i) for i, s in enumerate(self._samples))
+
+    def sample_names(self):
+        return [s['name'] for s in self._samples]
+
+    def num_reads(self, sample_name):
+        return self._sample(sample_name)['num_reads']
+
+    def _sample(self, sample_name):
+        try:
+            return self._samples[self._sample_indices[sample_name]]
+        except KeyError:
+            raise Exception("Sample %s not found in %s" % (sample_name, self._path))
+
+    def _read(self, f, offset, length):
+        f.seek(offset)
+        data = f.read(length)
+        if len(data) != length:
+            raise ReadTaxonomyTableFormatError("%s appears to be truncated" % self._path)
+        return data
+
+    def _lineage_ids(self, f, sample):
+        ids = array(ReadTaxonomyTable._ID_TYPECODE)
+        ids.frombytes(self._read(f, sample['ids_offset'], sample['ids_length']))
+        if sys.byteorder == 'big':
+            ids.byteswap()
+        return ids
+
+    def _read_names(self, f, sample):
+        if sample['num_reads'] == 0:
+            return []
+        return zlib.decompress(self._read(f, sample['names_offset'], sample['names_length'])).decode('utf8').split("\n")
+
+    def each_read(self, sample_names=None):
+        '''Iterate over the reads of the given samples, or of all samples if
+        sample_names is None, yielding (sample_name, read_name, taxonomy)
+        where taxonomy is a list of taxon names.'''
+        if sample_names is None:
+            sample_names = self.sample_names()
+        with open(self._path, 'rb') as f:
+            for sample_name in sample_names:
+                sample = self._sample(sample_name)
+                ids = self._lineage_ids(f, sample)
+                for read_name, lineage_id in zip(self._read_names(f, sample), ids):
+                    yield sample_name, read_name, self.lineages[lineage_id]
+
+    def read_taxonomies(self, sample_name):
+        '''Return a dict of read name to taxonomy of a sample, in the same
+        form as was given to ReadTaxonomyTableWriter.add_sample'''
+        return dict((read_name, taxonomy) for _, read_name, taxonomy in self.each_read([sample_name]))
+
+    def taxonomy_counts(self, sample_name):
+        '''Return a Counter of the number of reads assigned to each taxonomy
+        (as a tuple) in a sample, without reading the read names.'''
+        with open(self._path, 'rb') as f:
+            counts = Counter(self._lineage_ids(f, self._sample(sample_name)))
+        return Counter(dict((tuple(self.lineages[i]), count) for i, count in counts.items()))
+
+    def _matching_lineage_ids(self, taxonomy):
+        taxonomy = list(taxonomy)
+        return set(i for i, lineage in enumerate(self.lineages)
+                   if lineage[:len(taxonomy)] == taxonomy)
+
+    def each_read_in_taxon(self, taxonomy, sample_names=None):
+        '''Iterate over the reads assigned to the given taxon or any taxon
+        below it, yielding (sample_name, read_name, taxonomy) as each_read
+        does. Read names are only decompressed for samples with at least one
+        matching read.
+
+        Parameters
+        ----------
+        taxonomy: list of str
+            lineage of the taxon e.g. ['Root','k__Bacteria','p__Firmicutes']
+        sample_names: list of str
+            samples to search, or None for all samples
+        '''
+        matching = self._matching_lineage_ids(taxonomy)
+        if sample_names is None:
+            sample_names = self.sample_names()
+        if not matching:
+            return
+        with open(self._path, 'rb') as f:
+            for sample_name in sample_names:
+                sample = self._sample(sample_name)
+                ids = self._lineage_ids(f, sample)
+                if not any(i in matching for i in ids):
+                    continue
+                for read_name, lineage_id in zip(self._read_names(f, sample), ids):
+                    if lineage_id in matching:
+                        yield sample_name, read_name, self.lineages[lineage_id]
+
+    def taxon_counts(self, taxonomy):
+        '''Return a dict of sample name to the number of reads assigned to the
+        given taxon or any taxon below it, for each sample.'''
+        matching = self._matching_lineage_ids(taxonomy)
+        counts = {}
+        with open(self._path, 'rb') as f:
+            for sample in self._samples:
+                counts[sample['name']] = sum(1 for i in self._lineage_ids(f, sample) if i in matching) \
+                    if matching else 0
+        return counts
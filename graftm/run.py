@@ -8,28 +8,22 @@ import shutil
 from graftm.sequence_search_results import SequenceSearchResult
 from graftm.graftm_output_paths import GraftMFiles
 from graftm.search_table import SearchTableWriter
-from graftm.sequence_searcher import SequenceSearcher
 from graftm.hmmsearcher import NoInputSequencesException
 from graftm.housekeeping import HouseKeeping
-from graftm.summarise import Stats_And_Summary
-from graftm.pplacer import Pplacer
-from graftm.create import Create
-from graftm.update import Update
 from graftm.unpack_sequences import UnpackRawReads
 from graftm.graftm_package import GraftMPackage
-from graftm.expand_searcher import ExpandSearcher
 from graftm.diamond import Diamond
-from graftm.getaxnseq import Getaxnseq
 from graftm.sequence_io import SequenceIO
-from graftm.timeit import Timer
+from graftm.profiler import Profiler
 from graftm.clusterer import Clusterer
-from graftm.decorator import Decorator
 from graftm.external_program_suite import ExternalProgramSuite
 from graftm.archive import Archive
-from graftm.decoy_filter import DecoyFilter
-from biom.util import biom_open
+from graftm.server import GraftMServer
+from graftm.read_taxonomy_table import ReadTaxonomyTableWriter
+# Modules which import biom, numpy, Bio or dendropy take most of the start up
+# time, so they are imported only by the subcommands that need them. See
+# test/test_startup.py
 
-T=Timer()
 
 class UnrecognisedSuffixError(Exception):
     pass
@@ -47,10 +41,18 @@ class Run:
     MIN_ALIGNED_FILTER_FOR_NUCLEOTIDE_PACKAGES = 95
     MIN_ALIGNED_FILTER_FOR_AMINO_ACID_PACKAGES = 30
 
-    DEFAULT_MAX_SAMPLES_FOR_KRONA = 100
+    # No limit, since large numbers of samples are split across several plots
+    DEFAULT_MAX_SAMPLES_FOR_KRONA = None
+
+    TSV_READ_TAX_FORMAT = 'tsv'
+    COMPACT_READ_TAX_FORMAT = 'compact'
+    READ_TAX_FORMATS = [TSV_READ_TAX_FORMAT, COMPACT_READ_TAX_FORMAT]
 
     NO_ORFS_EXITSTATUS = 128
 
+    GRAFT_PROGRAMS = ['orfm', 'nhmmer', 'hmmsearch', 'mfqe', 'pplacer',
+                      'ktImportText', 'diamond']
+
     def __init__(self, args):
         self.args = args
         self.setattributes(self.args)
@@ -58,11 +60,26 @@ class Run:
     def setattributes(self, args):
 
         self.hk = HouseKeeping()
-        self.s = Stats_And_Summary()
-        if args.subparser_name == 'graft':
-            commands = ExternalProgramSuite(['orfm', 'nhmmer', 'hmmsearch',
-                                             'mfqe', 'pplacer',
-                                             'ktImportText', 'diamond'])
+        if args.subparser_name == 'graft' and args.sample_sheet:
+            # Each sample is set up separately when it is run
+            if args.forward or args.reverse or args.interleaved:
+                logging.error("--sample_sheet cannot be used with --forward, --reverse or --interleaved")
+                exit(1)
+
+        elif args.subparser_name == 'graft':
+            if args.interleave_pairs:
+                if not args.reverse:
+                    logging.error("--interleave_pairs requires --reverse reads")
+                    exit(1)
+                if args.no_merge_reads or args.assignment_method == Run.DIAMOND_TAXONOMIC_ASSIGNMENT:
+                    logging.error("--interleave_pairs cannot be used with --no_merge_reads or --assignment_method %s" % Run.DIAMOND_TAXONOMIC_ASSIGNMENT)
+                    exit(1)
+            from graftm.sequence_searcher import SequenceSearcher
+            from graftm.summarise import Stats_And_Summary
+            from graftm.pplacer import Pplacer
+
+            self.s = Stats_And_Summary()
+            commands = ExternalProgramSuite(Run.GRAFT_PROGRAMS)
             self.hk.set_attributes(self.args)
             self.hk.set_euk_hmm(self.args)
             if args.euk_check:self.args.search_hmm_files.append(self.args.euk_hmm_file)
@@ -75,6 +92,7 @@ class Run:
 
 
         elif self.args.subparser_name == "create":
+            from graftm.create import Create
             commands = ExternalProgramSuite(['taxit', 'FastTreeMP',
                                              'hmmalign', 'mafft'])
             self.create = Create(commands)
@@ -82,8 +100,9 @@ class Run:
 
 
 
-    def summarise(self, base_list, trusted_placements, reverse_pipe, times,
-                  hit_read_count_list, max_samples_for_krona):
+    def summarise(self, base_list, trusted_placements, times,
+                  hit_read_count_list, max_samples_for_krona,
+                  subsample_statistics=None):
         '''
         summarise - write summary information to file, including otu table, biom
                     file, krona plot, and timing information
@@ -96,8 +115,6 @@ class Run:
         trusted_placements : dict
             dictionary of placements with entry as the key, a taxonomy string
             as the value
-        reverse_pipe : bool
-            True = run reverse pipe, False = run normal pipeline
         times : array
             list of the recorded times for each step in the pipeline in the
             format: [search_step_time, alignment_step_time, placement_step_time]
@@ -106,22 +123,27 @@ class Run:
             pipeline, each two entries, the first being the number of putative
             eukaryotic reads (when searching 16S), the second being the number
             of hits aligned and placed in the tree.
-        max_samples_for_krona: int
+        max_samples_for_krona: int or None
             If the number of files processed is greater than this number, then
-            do not generate a krona diagram.
+            do not generate a krona diagram. None for no limit.
+        subsample_statistics: dict
+            base to the output of UnpackRawReads.subsample_statistics() for
+            the sample, when --read_fraction or --max_reads were given
         Returns
         -------
         '''
+        from biom.util import biom_open
 
         # Summary steps.
-        placements_list = []
-        for base in base_list:
-            # First assign the hash that contains all of the trusted placements
-            # to a variable to it can be passed to otu_builder, to be written
-            # to a file. :)
-            placements = trusted_placements[base]
-            self.s.readTax(placements, GraftMFiles(base, self.args.output_directory, False).read_tax_output_path(base))
-            placements_list.append(placements)
+        placements_list = [trusted_placements[base] for base in base_list]
+        if self.args.read_tax_format == Run.COMPACT_READ_TAX_FORMAT:
+            logging.info('Writing read taxonomy table')
+            with ReadTaxonomyTableWriter(self.gmf.read_tax_table_output_path()) as writer:
+                for base, placements in zip(base_list, placements_list):
+                    writer.add_sample(base, placements)
+        else:
+            for base, placements in zip(base_list, placements_list):
+                self.s.readTax(placements, GraftMFiles(base, self.args.output_directory, False).read_tax_output_path(base))
 
         #Generate coverage table
         #logging.info('Building coverage table for %s' % base)
@@ -130,78 +152,112 @@ class Run:
         #                         self.gmf.coverage_table_path(base),
         #                         summary_dict[base]['read_length'])
 
+        # Count each taxonomy in each sample once, sparsely, and write each
+        # of the summaries from those counts
+        otu_table = self.s.accumulate(placements_list, base_list)
+
         logging.info('Writing summary table')
         with open(self.gmf.combined_summary_table_output_path(), 'w') as f:
-            self.s.write_tabular_otu_table(base_list, placements_list, f)
+            self.s.write_tabular_otu_table_rows(base_list, otu_table.each_row(), f)
 
         logging.info('Writing biom file')
         with biom_open(self.gmf.combined_biom_output_path(), 'w') as f:
-            biom_successful = self.s.write_biom(base_list, placements_list, f)
+            biom_successful = self.s.write_accumulated_biom(otu_table, f, 'GraftM graft')
         if not biom_successful:
             os.remove(self.gmf.combined_biom_output_path())
 
         logging.info('Building summary krona plot')
-        if len(base_list) > max_samples_for_krona:
+        if max_samples_for_krona is not None and len(base_list) > max_samples_for_krona:
             logging.warn("Skipping creation of Krona diagram since there are too many input files. The maximum can be overridden using --max_samples_for_krona")
         else:
-            self.s.write_krona_plot(base_list, placements_list, self.gmf.krona_output_path())
+            self.s.write_accumulated_krona_plot(otu_table, self.gmf.krona_output_path())
 
         # Basic statistics
         placed_reads=[len(trusted_placements[base]) for base in base_list]
+        if subsample_statistics:
+            subsample_statistics = [subsample_statistics.get(base) for base in base_list]
         self.s.build_basic_statistics(times, hit_read_count_list, placed_reads, \
-                                      base_list, self.gmf.basic_stats_path())
-
-        # Delete unnecessary files
-        logging.info('Cleaning up')
-        for base in base_list:
-            directions = ['forward', 'reverse']
-            if reverse_pipe:
-                for i in range(0,2):
-                    self.gmf = GraftMFiles(base, self.args.output_directory, directions[i])
-                    self.hk.delete([self.gmf.for_aln_path(base),
-                                    self.gmf.rev_aln_path(base),
-                                    self.gmf.conv_output_rev_path(base),
-                                    self.gmf.conv_output_for_path(base),
-                                    self.gmf.euk_free_path(base),
-                                    self.gmf.euk_contam_path(base),
-                                    self.gmf.readnames_output_path(base),
-                                    self.gmf.sto_output_path(base),
-                                    self.gmf.orf_titles_output_path(base),
-                                    self.gmf.orf_output_path(base),
-                                    self.gmf.output_for_path(base),
-                                    self.gmf.output_rev_path(base)])
-            else:
-                self.gmf = GraftMFiles(base, self.args.output_directory, False)
-                self.hk.delete([self.gmf.for_aln_path(base),
-                                self.gmf.rev_aln_path(base),
-                                self.gmf.conv_output_rev_path(base),
-                                self.gmf.conv_output_for_path(base),
-                                self.gmf.euk_free_path(base),
-                                self.gmf.euk_contam_path(base),
-                                self.gmf.readnames_output_path(base),
-                                self.gmf.sto_output_path(base),
-                                self.gmf.orf_titles_output_path(base),
-                                self.gmf.orf_output_path(base),
-                                self.gmf.output_for_path(base),
-                                self.gmf.output_rev_path(base)])
+                                      base_list, self.gmf.basic_stats_path(),
+                                      subsample_statistics=subsample_statistics)
 
         logging.info('Done, thanks for using graftM!\n')
 
     def graft(self):
+        if self.args.sample_sheet:
+            self._graft_sample_sheet()
+            return
+
         # The Graft pipeline:
         # Searches for reads using hmmer, and places them in phylogenetic
         # trees to derive a community structure.
+        # Each stage, and each external command, is recorded by self.profiler
+        # and written to the output directory at the end of the run.
+        self.profiler = Profiler(package=self.args.graftm_package)
+        self._profile_output_directory = None
+        # Intermediate files go in a directory of their own in the scratch
+        # directory, so that concurrent runs do not collide. When they are
+        # being kept, they are written to the output directory instead.
+        if self.args.scratch_directory and not self.args.keep_intermediates:
+            self._scratch_directory = tempfile.mkdtemp(prefix='graftm_scratch_',
+                                                       dir=self.args.scratch_directory)
+            logging.debug("Writing intermediate files to %s" % self._scratch_directory)
+        else:
+            self._scratch_directory = None
+        try:
+            with self.profiler.activate():
+                with self.profiler.stage('graft'):
+                    self._graft()
+        finally:
+            if self._scratch_directory:
+                shutil.rmtree(self._scratch_directory, ignore_errors=True)
+            # Only once the output directory has been set up for this run
+            if self._profile_output_directory:
+                gmf = GraftMFiles('', self.args.output_directory, False)
+                self.profiler.write_json(gmf.profile_path())
+                if self.args.profile_trace:
+                    self.profiler.write_chrome_trace(gmf.chrome_trace_path())
+
+    def _delete_intermediates(self, graftm_files, base):
+        '''Delete the intermediate files of a sample once it has been searched
+        and aligned, unless they are being kept'''
+        if not self.args.keep_intermediates:
+            self.hk.delete(graftm_files.intermediate_paths(base))
+
+    def _graft_sample_sheet(self):
+        # Run the graft pipeline on each sample of the sample sheet
+        # separately, carrying on when one fails.
+        from graftm.sample_sheet import SampleSheet, SampleSheetRunner
+
+        num_succeeded, num_failed = SampleSheetRunner(
+            self.args, workers=self.args.workers).run(
+                SampleSheet(self.args.sample_sheet),
+                self.args.output_directory,
+                force=self.args.force)
+        if num_failed > 0:
+            logging.error("%i of %i samples failed, see %s" % (
+                num_failed, num_succeeded+num_failed,
+                GraftMFiles('', self.args.output_directory, False).sample_sheet_results_path()))
+            exit(1)
+
+    def _graft(self):
+        from graftm.expand_searcher import ExpandSearcher
+        from graftm.decoy_filter import DecoyFilter
+
         if self.args.graftm_package:
             gpkg = GraftMPackage.acquire(self.args.graftm_package)
+            # Search with all of the package's HMMs in one process
+            self.ss.search_hmm_database = gpkg.search_hmm_database()
         else:
             gpkg = None
 
         REVERSE_PIPE        = (True if self.args.reverse else False)
         INTERLEAVED         = (True if self.args.interleaved else False)
+        INTERLEAVE_PAIRS    = REVERSE_PIPE and self.args.interleave_pairs
         base_list           = []
         seqs_list           = []
         search_results      = []
         hit_read_count_list = []
+        subsample_statistics = {}
         db_search_results   = []
 
 
@@ -256,6 +312,7 @@ class Run:
         logging.debug('Creating working directory: %s' % self.args.output_directory)
         self.hk.make_working_directory(self.args.output_directory,
                                        self.args.force)
+        self._profile_output_directory = self.args.output_directory
 
         # Set pipeline and evalue by checking HMM format
         if self.args.search_only:
@@ -301,10 +358,12 @@ class Run:
                             else os.path.join(self.args.output_directory, "expand_search")
                             )
 
-            if boots.generate_expand_search_database_from_contigs(
+            with self.profiler.stage('expand_search'):
+                expanded = boots.generate_expand_search_database_from_contigs(
                                      self.args.expand_search_contigs,
                                      new_database,
-                                     self.args.search_method):
+                                     self.args.search_method)
+            if expanded:
                 if self.args.search_method == self.hk.HMMSEARCH_SEARCH_METHOD:
                     self.ss.search_hmm.append(new_database)
                 else:
@@ -331,8 +390,10 @@ class Run:
                                     self.args.input_sequence_type,
                                     INTERLEAVED)
 
-            # Set the basename, and make an entry to the summary table.
-            base = unpack.basename()
+            # Set the basename, and make an entry to the summary table. Samples
+            # from a sample sheet are named by the sheet, since the files of
+            # different samples may share a basename.
+            base = getattr(self.args, 'sample_name', None) or unpack.basename()
             pair_direction = ['forward', 'reverse']
             logging.info("Working on %s" % base)
 
@@ -341,11 +402,15 @@ class Run:
                                                         base),
                                            self.args.force)
 
+            reverse_read_file = None
+            if INTERLEAVE_PAIRS:
+                # Search, extract and align both files of the pair together,
+                # as a single interleaved stream
+                reverse_read_file = pair[1]
+                pair = [pair[0], None]
+
             # for each of the paired end read files
             for read_file in pair:
-                unpack = UnpackRawReads(read_file,
-                                        self.args.input_sequence_type,
-                                        INTERLEAVED)
                 if read_file is None:
                     # placeholder for interleaved (second file is None)
                     continue
@@ -361,7 +426,8 @@ class Run:
                     logging.info("Working on %s reads" % direction)
                     self.gmf = GraftMFiles(base,
                                            self.args.output_directory,
-                                           direction)
+                                           direction,
+                                           scratch_directory=self._scratch_directory)
                     self.hk.make_working_directory(os.path.join(self.args.output_directory,
                                                                 base,
                                                                 direction),
@@ -370,24 +436,36 @@ class Run:
                     direction = False
                     self.gmf = GraftMFiles(base,
                                            self.args.output_directory,
-                                           direction)
+                                           direction,
+                                           scratch_directory=self._scratch_directory)
+                if self._scratch_directory:
+                    os.makedirs(os.path.dirname(self.gmf.sto_output_path(base)), exist_ok=True)
+
+                unpack = UnpackRawReads(read_file,
+                                        self.args.input_sequence_type,
+                                        INTERLEAVED,
+                                        reverse_read_file=reverse_read_file,
+                                        read_fraction=self.args.read_fraction,
+                                        max_reads=self.args.max_reads,
+                                        subsample_statistics_path=self.gmf.subsample_statistics_path(base))
 
                 if self.args.type == self.PIPELINE_AA:
                     logging.debug("Running protein pipeline")
                     try:
-                        search_time, (result, complement_information) = self.ss.aa_db_search(
-                            self.gmf,
-                            base,
-                            unpack,
-                            first_search_method,
-                            maximum_range,
-                            self.args.threads,
-                            self.args.evalue,
-                            self.args.min_orf_length,
-                            self.args.restrict_read_length,
-                            diamond_db,
-                            self.args.diamond_performance_parameters,
-                        )
+                        with self.profiler.stage('search', sample=base, direction=direction):
+                            result, complement_information = self.ss.aa_db_search(
+                                self.gmf,
+                                base,
+                                unpack,
+                                first_search_method,
+                                maximum_range,
+                                self.args.threads,
+                                self.args.evalue,
+                                self.args.min_orf_length,
+                                self.args.restrict_read_length,
+                                diamond_db,
+                                self.args.diamond_performance_parameters,
+                            )
                     except NoInputSequencesException as e:
                         logging.error("No sufficiently long open reading frames were found, indicating"
                                       " either the input sequences are too short or the min orf length"
@@ -399,16 +477,21 @@ class Run:
                 # Or the DNA pipeline
                 elif self.args.type == self.PIPELINE_NT:
                     logging.debug("Running nucleotide pipeline")
-                    search_time, (result, complement_information)  = self.ss.nt_db_search(
-                        self.gmf,
-                        base,
-                        unpack,
-                        self.args.euk_check,
-                        self.args.search_method,
-                        maximum_range,
-                        self.args.threads,
-                        self.args.evalue
-                    )
+                    with self.profiler.stage('search', sample=base, direction=direction):
+                        result, complement_information = self.ss.nt_db_search(
+                            self.gmf,
+                            base,
+                            unpack,
+                            self.args.euk_check,
+                            self.args.search_method,
+                            maximum_range,
+                            self.args.threads,
+                            self.args.evalue
+                        )
+
+                if base not in subsample_statistics:
+                    # The forward reads represent the sample
+                    subsample_statistics[base] = unpack.subsample_statistics()
 
                 reads_detected = True
                 if not result.hit_fasta() or os.path.getsize(result.hit_fasta()) == 0:
@@ -418,21 +501,25 @@ class Run:
 
 
                 if self.args.search_only:
+                    self._delete_intermediates(self.gmf, base)
                     db_search_results.append(result)
                     base_list.append(base)
                     continue
 
                 # Filter out decoys if specified
                 if reads_detected and doing_decoy_search:
-                    with tempfile.NamedTemporaryFile(prefix="graftm_decoy", suffix='.fa') as f:
+                    with tempfile.NamedTemporaryFile(prefix="graftm_decoy", suffix='.fa',
+                                                     dir=self._scratch_directory) as f:
                         tmpname = f.name
-                    any_remaining = decoy_filter.filter(result.hit_fasta(),
-                                                        tmpname)
+                    with self.profiler.stage('decoy_filter', sample=base, direction=direction):
+                        any_remaining = decoy_filter.filter(result.hit_fasta(),
+                                                            tmpname)
                     if any_remaining:
                         shutil.move(tmpname, result.hit_fasta())
                     else:
                         # No hits remain after decoy filtering.
                         os.remove(result.hit_fasta())
+                        self._delete_intermediates(self.gmf, base)
                         continue
 
                 if self.args.assignment_method == Run.PPLACER_TAXONOMIC_ASSIGNMENT:
@@ -440,19 +527,19 @@ class Run:
                     hit_aligned_reads = self.gmf.aligned_fasta_output_path(base)
 
                     if reads_detected:
-                        aln_time, aln_result = self.ss.align(
-                                                            result.hit_fasta(),
-                                                            hit_aligned_reads,
-                                                            complement_information,
-                                                            self.args.type,
-                                                            filter_minimum
-                                                            )
-                    else:
-                        aln_time = 'n/a'
+                        with self.profiler.stage('align', sample=base, direction=direction):
+                            self.ss.align(
+                                          result.hit_fasta(),
+                                          hit_aligned_reads,
+                                          complement_information,
+                                          self.args.type,
+                                          filter_minimum
+                                          )
                     if not os.path.exists(hit_aligned_reads): # If all were filtered out, or there just was none..
                         with open(hit_aligned_reads,'w') as f:
                             pass # just touch the file, nothing else
                     seqs_list.append(hit_aligned_reads)
+                self._delete_intermediates(self.gmf, base)
 
                 db_search_results.append(result)
                 base_list.append(base)
@@ -472,7 +559,7 @@ class Run:
 
         if self.args.merge_reads: # not run when diamond is the assignment mode- enforced by argparse grokking
             logging.debug("Running merge reads output")
-            if self.args.interleaved:
+            if self.args.interleaved or INTERLEAVE_PAIRS:
                 fwd_seqs = seqs_list
                 rev_seqs = []
             else:
@@ -482,7 +569,11 @@ class Run:
             merged_output=[GraftMFiles(base, self.args.output_directory, False).aligned_fasta_output_path(base) \
                            for base in base_list]
             logging.debug("merged reads to %s", merged_output)
-            self.ss.merge_forev_aln(fwd_seqs, rev_seqs, merged_output)
+            with self.profiler.stage('merge_reads'):
+                self.ss.merge_forev_aln(fwd_seqs, rev_seqs, merged_output)
+            if not self.args.keep_intermediates:
+                # Only the merged alignments are needed from here on
+                self.hk.delete(fwd_seqs + rev_seqs)
             seqs_list=merged_output
             REVERSE_PIPE = False
 
@@ -498,39 +589,48 @@ class Run:
             exit(0)
         self.gmf = GraftMFiles('',
                                self.args.output_directory,
-                               False)
+                               False,
+                               scratch_directory=self._scratch_directory)
 
         if self.args.assignment_method == Run.PPLACER_TAXONOMIC_ASSIGNMENT:
             clusterer=Clusterer()
             # Classification steps
-            seqs_list=clusterer.cluster(seqs_list, REVERSE_PIPE)
+            with self.profiler.stage('cluster'):
+                seqs_list=clusterer.cluster(seqs_list, REVERSE_PIPE)
             logging.info("Placing reads into phylogenetic tree")
-            taxonomic_assignment_time, assignments=self.p.place(REVERSE_PIPE,
-                                                                seqs_list,
-                                                                self.args.resolve_placements,
-                                                                self.gmf,
-                                                                self.args,
-                                                                result.slash_endings,
-                                                                gpkg.taxtastic_taxonomy_path(),
-                                                                clusterer)
-            assignments = clusterer.uncluster_annotations(assignments, REVERSE_PIPE)
+            with self.profiler.stage('place'):
+                assignments=self.p.place(REVERSE_PIPE,
+                                         seqs_list,
+                                         self.args.resolve_placements,
+                                         self.gmf,
+                                         self.args,
+                                         result.slash_endings,
+                                         gpkg.compiled_taxonomy(),
+                                         clusterer)
+            with self.profiler.stage('uncluster'):
+                assignments = clusterer.uncluster_annotations(assignments, REVERSE_PIPE)
+            taxonomic_assignment_time = self.profiler.total_wall_seconds('place')
 
         elif self.args.assignment_method == Run.DIAMOND_TAXONOMIC_ASSIGNMENT:
             logging.info("Assigning taxonomy with diamond")
-            taxonomic_assignment_time, assignments = self._assign_taxonomy_with_diamond(\
-                        base_list,
-                        db_search_results,
-                        gpkg,
-                        self.gmf,
-                        self.args.diamond_performance_parameters)
-            aln_time = 'n/a'
+            with self.profiler.stage('diamond_assignment'):
+                assignments = self._assign_taxonomy_with_diamond(\
+                            base_list,
+                            db_search_results,
+                            gpkg,
+                            self.gmf,
+                            self.args.diamond_performance_parameters)
+            taxonomic_assignment_time = self.profiler.total_wall_seconds('diamond_assignment')
         else: raise Exception("Unexpected assignment method encountered: %s" % self.args.placement_method)
-        
-        self.summarise(base_list, assignments, REVERSE_PIPE,
-                       [search_time, aln_time, taxonomic_assignment_time],
-                       hit_read_count_list, self.args.max_samples_for_krona)
 
-    @T.timeit
+        with self.profiler.stage('summarise'):
+            self.summarise(base_list, assignments,
+                           [self.profiler.total_wall_seconds('search'),
+                            self.profiler.total_wall_seconds('align'),
+                            taxonomic_assignment_time],
+                           hit_read_count_list, self.args.max_samples_for_krona,
+                           subsample_statistics=subsample_statistics)
+
     def _assign_taxonomy_with_diamond(self, base_list, db_search_results,
                                       graftm_package, graftm_files,
                                       diamond_performance_parameters):
@@ -551,17 +651,15 @@ class Run:
 
         Returns
         -------
-        list of
-        1. time taken for assignment
-        2. assignments i.e. dict of base_list entry to dict of read names to
-            to taxonomies, or None if there was no hit detected.
+        assignments i.e. dict of base_list entry to dict of read names to
+        to taxonomies, or None if there was no hit detected.
         '''
+        from graftm.expand_searcher import ExpandSearcher
+
         runner = Diamond(graftm_package.diamond_database_path(),
                          self.args.threads,
                          self.args.evalue)
-        taxonomy_definition = Getaxnseq().read_taxtastic_taxonomy_and_seqinfo\
-                (open(graftm_package.taxtastic_taxonomy_path()),
-                 open(graftm_package.taxtastic_seqinfo_path()))
+        taxonomy_definition = graftm_package.taxonomy_hash()
         results = {}
 
         # For each of the search results,
@@ -706,12 +804,14 @@ class Run:
                 else:
                     self.args.output = self.args.graftm_package + '-update.gpkg'
 
+            from graftm.update import Update
             Update(ExternalProgramSuite(
-                ['taxit', 'FastTreeMP', 'hmmalign', 'mafft'])).update(
+                ['taxit', 'FastTreeMP', 'hmmalign', 'mafft', 'pplacer', 'guppy'])).update(
                     input_sequence_path=self.args.sequences,
                     input_taxonomy_path=self.args.taxonomy,
                     input_graftm_package_path=self.args.graftm_package,
-                    output_graftm_package_path=self.args.output)
+                    output_graftm_package_path=self.args.output,
+                    full_rebuild=self.args.full_rebuild)
 
         elif self.args.subparser_name == 'expand_search':
             args = self.args
@@ -724,6 +824,7 @@ class Run:
             else:
                 pkg = None
 
+            from graftm.expand_searcher import ExpandSearcher
             expandsearcher = ExpandSearcher(search_hmm_files = args.search_hmm_files,
                 maximum_range = args.maximum_range,
                 threads = args.threads,
@@ -738,6 +839,7 @@ class Run:
 
 
         elif self.args.subparser_name == 'tree':
+            from graftm.decorator import Decorator
             if self.args.graftm_package:
                 # shim in the paths from the graftm package, not overwriting
                 # any of the provided paths.
@@ -794,6 +896,38 @@ If you're unsure see graftM tree -h")
                 logging.error("Either a taxtastic taxonomy or seqinfo file was provided. GraftM cannot continue without both.")
                 exit(1)
 
+        elif self.args.subparser_name == 'serve':
+            if not self.args.socket and not self.args.spool_directory:
+                logging.error("Either --socket or --spool_directory must be specified")
+                exit(1)
+            if self.args.socket and self.args.spool_directory:
+                logging.error("Only one of --socket and --spool_directory can be specified")
+                exit(1)
+            ExternalProgramSuite(Run.GRAFT_PROGRAMS)
+
+            server = GraftMServer(self.args.graft_parser,
+                                  self.args.graftm_package,
+                                  workers=self.args.workers)
+            if self.args.socket:
+                server.serve_socket(self.args.socket)
+            else:
+                server.serve_spool(self.args.spool_directory,
+                                   poll_interval=self.args.poll_interval)
+
+        elif self.args.subparser_name == 'merge':
+            inputs = list(self.args.input or [])
+            if self.args.input_list:
+                with open(self.args.input_list) as f:
+                    inputs += [line.strip() for line in f if line.strip()]
+            if not inputs:
+                logging.error("At least one of --input or --input_list must be specified")
+                exit(1)
+
+            from graftm.merge import Merger
+            Merger().merge(inputs, self.args.output_directory,
+                           force=self.args.force,
+                           max_samples_for_krona=self.args.max_samples_for_krona)
+
         elif self.args.subparser_name == 'archive':
             # Back slashes in the ASCII art are escaped.
             if self.args.verbosity >= self._MIN_VERBOSITY_FOR_ART: print("""
@@ -841,7 +975,9 @@ If you're unsure see graftM tree -h")
 
                 archive = Archive()
                 archive.create(self.args.graftm_package, self.args.archive,
-                               force=self.args.force)
+                               force=self.args.force,
+                               threads=self.args.threads,
+                               include_indexes=self.args.include_indexes)
 
             elif self.args.extract:
                 archive = Archive()
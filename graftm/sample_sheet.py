@@ -0,0 +1,274 @@
+import os
+import csv
+import copy
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from graftm.graftm_package import GraftMPackage
+from graftm.graftm_output_paths import GraftMFiles
+from graftm.housekeeping import HouseKeeping
+from graftm.unpack_sequences import UnpackRawReads
+
+class Sample:
+    def __init__(self, name, forward, reverse=None, interleaved=False,
+                 sequence_type=None, line_number=None, error=None):
+        self.name = name
+        self.forward = forward
+        self.reverse = reverse
+        self.interleaved = interleaved
+        self.sequence_type = sequence_type
+        self.line_number = line_number
+        # Description of why this sample cannot be run, or None if it can
+        self.error = error
+
+class SampleSheet:
+    '''A table describing one sample per line, so that many samples can be
+    given to graft without listing every file on the command line. The first
+    line is a header naming the columns, which are separated by tabs or
+    commas:
+
+        sample         name of the sample, used as its output directory and
+                       as its name in the output tables
+        forward        path to the forward (or single ended, or interleaved)
+                       reads
+        reverse        path to the reverse reads (optional)
+        interleaved    'true' if the forward file contains interleaved
+                       pairs (optional)
+        sequence_type  'nucleotide' or 'aminoacid' (optional, default guess)
+
+    Relative paths are relative to the directory containing the sample
+    sheet. Blank lines and lines starting with '#' are ignored.
+    '''
+
+    SAMPLE_COLUMN = 'sample'
+    FORWARD_COLUMN = 'forward'
+    REVERSE_COLUMN = 'reverse'
+    INTERLEAVED_COLUMN = 'interleaved'
+    SEQUENCE_TYPE_COLUMN = 'sequence_type'
+
+    _REQUIRED_COLUMNS = [SAMPLE_COLUMN, FORWARD_COLUMN]
+    _KNOWN_COLUMNS = [SAMPLE_COLUMN, FORWARD_COLUMN, REVERSE_COLUMN,
+                      INTERLEAVED_COLUMN, SEQUENCE_TYPE_COLUMN]
+    _TRUE_VALUES = set(['true', 't', 'yes', 'y', '1'])
+    _FALSE_VALUES = set(['false', 'f', 'no', 'n', '0', ''])
+
+    def __init__(self, path):
+        self.path = path
+
+    def each(self):
+        '''Iterate over the samples in the sheet, reading it lazily so that
+        arbitrarily large sheets can be used. Lines which cannot be run (e.g.
+        with a missing sample name) are yielded as a Sample with the error
+        attribute set, so that one bad line does not stop the others from
+        being run. Problems with the header raise an Exception.'''
+        directory = os.path.dirname(os.path.abspath(self.path))
+        seen_names = set()
+        with open(self.path, newline='') as f:
+            header = None
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip() or line.startswith('#'): continue
+                if header is None:
+                    delimiter = '\t' if '\t' in line else ','
+                    header = [c.strip().lower() for c in next(csv.reader([line], delimiter=delimiter))]
+                    self._check_header(header)
+                    continue
+
+                row = next(csv.reader([line], delimiter=delimiter))
+                sample = self._parse_row(header, row, line_number, directory)
+                if sample.error is None:
+                    if sample.name in seen_names:
+                        sample.error = "Sample name %s is used more than once" % sample.name
+                    seen_names.add(sample.name)
+                yield sample
+
+    def _check_header(self, header):
+        for column in SampleSheet._REQUIRED_COLUMNS:
+            if column not in header:
+                raise Exception("Sample sheet %s has no '%s' column" % (self.path, column))
+        for column in header:
+            if column not in SampleSheet._KNOWN_COLUMNS:
+                raise Exception("Unexpected column '%s' in sample sheet %s, expected some of: %s" % (
+                    column, self.path, ', '.join(SampleSheet._KNOWN_COLUMNS)))
+
+    def _parse_row(self, header, row, line_number, directory):
+        if len(row) != len(header):
+            return Sample("line%i" % line_number, None, line_number=line_number,
+                          error="Expected %i fields but found %i on line %i" % (
+                              len(header), len(row), line_number))
+        fields = dict(zip(header, [r.strip() for r in row]))
+
+        def path(value):
+            return os.path.join(directory, value) if value else None
+
+        name = fields[SampleSheet.SAMPLE_COLUMN]
+        sample = Sample(name,
+                        path(fields[SampleSheet.FORWARD_COLUMN]),
+                        path(fields.get(SampleSheet.REVERSE_COLUMN)),
+                        line_number=line_number)
+        if not name:
+            sample.name = "line%i" % line_number
+            sample.error = "No sample name given on line %i" % line_number
+        elif name in ('.', '..') or os.sep in name:
+            sample.error = "Sample name %s on line %i cannot be used as a directory name" % (name, line_number)
+        elif not sample.forward:
+            sample.error = "No forward reads given for sample %s" % name
+
+        interleaved = fields.get(SampleSheet.INTERLEAVED_COLUMN, '').lower()
+        if interleaved in SampleSheet._TRUE_VALUES:
+            sample.interleaved = True
+            if sample.reverse:
+                sample.error = "Sample %s is marked as interleaved but has reverse reads" % name
+        elif interleaved not in SampleSheet._FALSE_VALUES:
+            sample.error = "Unexpected interleaved value '%s' for sample %s" % (interleaved, name)
+
+        sequence_type = fields.get(SampleSheet.SEQUENCE_TYPE_COLUMN)
+        if sequence_type:
+            if sequence_type not in (UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
+                                     UnpackRawReads.NUCLEOTIDE_SEQUENCE_TYPE):
+                sample.error = "Unexpected sequence type '%s' for sample %s" % (sequence_type, name)
+            sample.sequence_type = sequence_type
+        return sample
+
+class SampleSheetRunnerDefaultOptions:
+    workers = 1
+
+class SampleSheetRunner:
+    '''Run graft separately on each sample of a SampleSheet, several at once,
+    writing each into its own subdirectory of the output directory. The
+    outcome of each sample is appended to a results file as it finishes, and
+    samples which fail do not stop the others from being run.'''
+
+    SUCCEEDED_STATUS = 'succeeded'
+    FAILED_STATUS = 'failed'
+
+    def __init__(self, args, **kwargs):
+        '''
+        Parameters
+        ----------
+        args: argparse.Namespace
+            arguments of 'graftM graft', which are applied to every sample
+        kwargs:
+            workers: int
+                number of samples to run at once
+        '''
+        workers = kwargs.pop('workers', SampleSheetRunnerDefaultOptions.workers)
+        if len(kwargs) > 0:
+            raise Exception("Unexpected arguments detected: %s" % kwargs)
+        self._args = args
+        self._workers = workers
+
+    def _sample_arguments(self, sample, output_directory):
+        args = copy.deepcopy(self._args)
+        args.sample_sheet = None
+        if sample.interleaved:
+            args.forward = None
+            args.interleaved = [sample.forward]
+        else:
+            args.forward = [sample.forward]
+            args.interleaved = None
+        args.reverse = [sample.reverse] if sample.reverse else None
+        if not sample.reverse:
+            # Only applies to the samples with reverse reads
+            args.interleave_pairs = False
+        if sample.sequence_type:
+            args.input_sequence_type = sample.sequence_type
+        args.output_directory = os.path.join(output_directory, sample.name)
+        # Name the sample in the output tables after the sheet rather than the
+        # reads file
+        args.sample_name = sample.name
+        return args
+
+    def run_sample(self, sample, output_directory):
+        '''Graft a single sample, returning a dict describing the outcome.
+        Failure is reported in the result rather than raised.'''
+        result = {'sample': sample.name,
+                  'output_directory': os.path.join(output_directory, sample.name)}
+        if sample.error is None:
+            for path in (sample.forward, sample.reverse):
+                if path and not os.path.isfile(path):
+                    sample.error = "The file '%s' does not appear to exist" % path
+                    break
+        if sample.error is not None:
+            result['status'] = SampleSheetRunner.FAILED_STATUS
+            result['error'] = sample.error
+            return result
+
+        logging.info("Starting sample %s" % sample.name)
+        try:
+            # Imported here so that a failure to import it is reported as a
+            # failure of the sample
+            from graftm.run import Run
+            Run(self._sample_arguments(sample, output_directory)).graft()
+            result['status'] = SampleSheetRunner.SUCCEEDED_STATUS
+        except SystemExit as e:
+            # The graft pipeline exits with status 0 when it stops early
+            # e.g. with --search_only, or when no reads are found
+            if e.code in (None, 0):
+                result['status'] = SampleSheetRunner.SUCCEEDED_STATUS
+            else:
+                result['status'] = SampleSheetRunner.FAILED_STATUS
+                result['error'] = "graft exited with status %s" % e.code
+        except Exception as e:
+            logging.exception("Sample %s failed" % sample.name)
+            result['status'] = SampleSheetRunner.FAILED_STATUS
+            result['error'] = str(e)
+        logging.info("Finished sample %s with status %s" % (sample.name, result['status']))
+        return result
+
+    def run(self, sample_sheet, output_directory, force=False):
+        '''Graft each sample in sample_sheet, returning the number of samples
+        which succeeded and failed.
+
+        Parameters
+        ----------
+        sample_sheet: SampleSheet
+            samples to graft
+        output_directory: str
+            directory to create, containing one subdirectory per sample and
+            the results file
+        force: bool
+            overwrite output_directory if it exists
+
+        Returns
+        -------
+        (num_succeeded, num_failed)
+        '''
+        HouseKeeping().make_working_directory(output_directory, force)
+        if self._args.graftm_package:
+            # Read the package once rather than once per sample
+            GraftMPackage.preload(self._args.graftm_package,
+                                  validation=self._args.package_validation,
+                                  threads=self._args.threads)
+
+        counts = {SampleSheetRunner.SUCCEEDED_STATUS: 0,
+                  SampleSheetRunner.FAILED_STATUS: 0}
+        results_path = GraftMFiles('', output_directory, False).sample_sheet_results_path()
+        with open(results_path, 'w') as results_io:
+            results_io.write("\t".join(['sample', 'status', 'output_directory', 'error'])+"\n")
+
+            def record(futures):
+                for future in futures:
+                    result = future.result()
+                    counts[result['status']] += 1
+                    results_io.write("\t".join([result['sample'],
+                                                result['status'],
+                                                result['output_directory'],
+                                                result.get('error', '').replace("\n", " ")])+"\n")
+                results_io.flush()
+
+            # Only read as far ahead in the sample sheet as is needed to keep
+            # the workers busy.
+            with ThreadPoolExecutor(max_workers=self._workers) as pool:
+                running = set()
+                for sample in sample_sheet.each():
+                    if len(running) >= 2*self._workers:
+                        done, running = wait(running, return_when=FIRST_COMPLETED)
+                        record(done)
+                    running.add(pool.submit(self.run_sample, sample, output_directory))
+                record(wait(running).done)
+
+        logging.info("Grafted %i sample(s) successfully, %i failed. Results written to %s" % (
+            counts[SampleSheetRunner.SUCCEEDED_STATUS],
+            counts[SampleSheetRunner.FAILED_STATUS],
+            results_path))
+        return counts[SampleSheetRunner.SUCCEEDED_STATUS], counts[SampleSheetRunner.FAILED_STATUS]
@@ -0,0 +1,116 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+
+import extern
+
+class SearchHmmDatabase:
+    '''The models of several HMM files concatenated into a single binary HMM
+    file with hmmconvert, so that sequences can be searched against all of
+    them with one hmmsearch process, which reads the binary format faster
+    than the text format. The database is generated the first time it is
+    needed, and again whenever any of the HMM files change.
+
+    The models in each HMM file are recorded, so that the hits of each
+    model can be attributed back to the file it came from. Model names must
+    therefore be unique across all the files.'''
+
+    _SOURCES_SUFFIX = '.sources.json'
+
+    def __init__(self, hmm_paths, database_path):
+        '''
+        Parameters
+        ----------
+        hmm_paths: list of str
+            paths to the HMM files to include
+        database_path: str
+            path to the binary HMM file to create. The sizes and modification
+            times of the HMM files it was generated from are recorded
+            alongside it.
+        '''
+        self.hmm_paths = list(hmm_paths)
+        self.path = database_path
+        self._model_indices = None
+        self._usable = None
+
+    def sources_path(self):
+        return self.path+SearchHmmDatabase._SOURCES_SUFFIX
+
+    @staticmethod
+    def model_names(hmm_path):
+        '''Return the names of the models in an HMM file'''
+        names = []
+        with open(hmm_path) as f:
+            for line in f:
+                if line.startswith('NAME '):
+                    names.append(line.split()[1])
+        return names
+
+    def _source_stamps(self):
+        stamps = []
+        for path in self.hmm_paths:
+            st = os.stat(path)
+            stamps.append([st.st_size, st.st_mtime_ns])
+        return stamps
+
+    def _is_current(self, sources):
+        if not os.path.exists(self.path) or not os.path.exists(self.sources_path()):
+            return False
+        try:
+            with open(self.sources_path()) as f:
+                return json.load(f) == sources
+        except ValueError:
+            return False
+
+    def _generate(self, sources):
+        logging.info("Generating search HMM database %s from %i HMM files" % (self.path, len(self.hmm_paths)))
+        # Generate in a temporary directory, then move into place, so that a
+        # concurrent run never sees a partial database.
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(self.path)),
+                                         prefix='.graftm_hmm_database') as tmp:
+            concatenated = os.path.join(tmp, 'concatenated.hmm')
+            with open(concatenated, 'wb') as out:
+                for hmm in self.hmm_paths:
+                    with open(hmm, 'rb') as f:
+                        shutil.copyfileobj(f, out)
+            tmp_path = os.path.join(tmp, os.path.basename(self.path))
+            extern.run("hmmconvert -b '%s' > '%s'" % (concatenated, tmp_path))
+            tmp_sources_path = tmp_path+SearchHmmDatabase._SOURCES_SUFFIX
+            with open(tmp_sources_path, 'w') as f:
+                json.dump(sources, f)
+            os.replace(tmp_path, self.path)
+            # The sources file is moved last, as it marks the database complete
+            os.replace(tmp_sources_path, self.sources_path())
+
+    def acquire(self):
+        '''Generate the database if it does not exist or is out of date.
+        Return True if the database can be used, or False if it cannot, in
+        which case the HMM files should be searched separately.'''
+        if self._usable is not None:
+            return self._usable
+        self._usable = False
+
+        model_indices = {}
+        for i, hmm in enumerate(self.hmm_paths):
+            for name in self.model_names(hmm):
+                if name in model_indices:
+                    logging.debug("Not using a search HMM database since the model name %s is not unique" % name)
+                    return False
+                model_indices[name] = i
+
+        sources = self._source_stamps()
+        if not self._is_current(sources):
+            try:
+                self._generate(sources)
+            except (OSError, extern.ExternCalledProcessError) as e:
+                logging.warning("Unable to generate search HMM database %s, searching with each HMM separately instead: %s" % (self.path, e))
+                return False
+        self._model_indices = model_indices
+        self._usable = True
+        return True
+
+    def model_index(self, model_name):
+        '''Return the index in hmm_paths of the file containing the model'''
+        return self._model_indices[model_name]
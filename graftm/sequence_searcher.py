@@ -11,7 +11,6 @@ from Bio import SeqIO
 from collections import OrderedDict
 from io import StringIO
 
-from graftm.timeit import Timer
 from graftm.hmmsearcher import HmmSearcher, NhmmerSearcher
 from graftm.orfm import OrfM
 from graftm.diamond import Diamond
@@ -26,16 +25,18 @@ FORMAT_FASTA_GZ = "FORMAT_FASTA_GZ"
 PIPELINE_AA = "P"
 PIPELINE_NT = "D"
 PREVIOUS_SPAN_CUTOFF = 0.25
-T = Timer()
 
 class InterleavedFileError(Exception):
     pass
 
 class SequenceSearcher:
 
-    def __init__(self, search_hmm, aln_hmm=None):
+    def __init__(self, search_hmm, aln_hmm=None, search_hmm_database=None):
+        '''search_hmm_database is an optional SearchHmmDatabase, which is
+        used in place of the search_hmm files when they are the same'''
         self.search_hmm = search_hmm
         self.aln_hmm = aln_hmm
+        self.search_hmm_database = search_hmm_database
 
     def _get_sequence_directions(self, search_result):
         sequence_directions = {}
@@ -213,12 +214,18 @@ class SequenceSearcher:
         else:
             raise Exception('Programming Error: error guessing input sequence type')
 
-        # Run the HMMsearches
+        # Run the HMMsearches, in a single process if there is a database of
+        # all the HMMs
         if cutoff == "--cut_tc":
             searcher = HmmSearcher(threads, cutoff)
         else:
             searcher = HmmSearcher(threads, '--domE %s' % cutoff)
-        searcher.hmmsearch(input_cmd, self.search_hmm, output_table_list)
+        if len(self.search_hmm) > 1 and self.search_hmm_database is not None and \
+                self.search_hmm_database.hmm_paths == self.search_hmm and \
+                self.search_hmm_database.acquire():
+            searcher.hmmsearch_database(input_cmd, self.search_hmm_database, output_table_list)
+        else:
+            searcher.hmmsearch(input_cmd, self.search_hmm, output_table_list)
 
         hmmtables = [HMMSearchResult.import_from_hmmsearch_table(x) for x in output_table_list]
         return hmmtables
@@ -786,7 +793,6 @@ deal with these, so please remove/rename sequences with duplicate keys.")
 
         return result
 
-    @T.timeit
     def aa_db_search(self, files, base, unpack, search_method,
                      maximum_range, threads, evalue, min_orf_length,
                      restrict_read_length, diamond_database,
@@ -991,7 +997,6 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         return result, direction_information
 
 
-    @T.timeit
     def nt_db_search(self, files, base, unpack, euk_check,
                      search_method, maximum_range, threads, evalue):
         '''
@@ -1138,7 +1143,6 @@ deal with these, so please remove/rename sequences with duplicate keys.")
 
         return result, direction_information
 
-    @T.timeit
     def align(self, input_path, output_path, directions, pipeline,
               filter_minimum):
         '''align - Takes input path to fasta of unaligned reads, aligns them to
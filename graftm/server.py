@@ -0,0 +1,209 @@
+import os
+import json
+import time
+import logging
+import socketserver
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from graftm.graftm_package import GraftMPackage
+
+class GraftMServerDefaultOptions:
+    workers = 1
+    poll_interval = 1.0
+
+class GraftMServer:
+    '''Run graft jobs in a long running process, so that the cost of starting
+    python, checking for external programs and reading GraftM packages is paid
+    once rather than once per sample.
+
+    A job is a JSON object {"arguments": [...]} where the arguments are those
+    that would be given to 'graftM graft' e.g.
+
+    {"arguments": ["--forward", "sample1.fa", "--graftm_package", "my.gpkg",
+                   "--output_directory", "sample1_graftm"]}
+
+    Jobs are accepted either over a Unix socket, one job per line with the
+    result written back as one line of JSON, or as files ending in '.job' in
+    a spool directory, in which case the result is written to a file of the
+    same name ending in '.result'. The result is a JSON object with keys
+    'status' (either 'succeeded' or 'failed'), 'arguments' and, for failed
+    jobs, 'error'.
+    '''
+
+    JOB_SUFFIX = '.job'
+    RUNNING_SUFFIX = '.running'
+    RESULT_SUFFIX = '.result'
+
+    SUCCEEDED_STATUS = 'succeeded'
+    FAILED_STATUS = 'failed'
+
+    def __init__(self, graft_parser, graftm_packages, **kwargs):
+        '''
+        Parameters
+        ----------
+        graft_parser: argparse.ArgumentParser
+            parser for the arguments of 'graftM graft', used to parse jobs
+        graftm_packages: list of str
+            paths to GraftM packages to preload
+        kwargs:
+            workers: int
+                number of jobs to run at once
+        '''
+        workers = kwargs.pop('workers', GraftMServerDefaultOptions.workers)
+        if len(kwargs) > 0:
+            raise Exception("Unexpected arguments detected: %s" % kwargs)
+
+        self._graft_parser = graft_parser
+        for path in graftm_packages:
+            logging.info("Preloading GraftM package %s" % path)
+            GraftMPackage.preload(path)
+        self._workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def run_job(self, job):
+        '''Run a single graft job, returning the result as a dict. Failure of
+        the job is reported in the result rather than raised.'''
+        arguments = job.get('arguments') if isinstance(job, dict) else None
+        result = {'arguments': arguments}
+        if not isinstance(arguments, list):
+            result['status'] = GraftMServer.FAILED_STATUS
+            result['error'] = "Job does not contain a list of arguments"
+            return result
+        arguments = [str(a) for a in arguments]
+        result['arguments'] = arguments
+
+        try:
+            args = self._graft_parser.parse_args(arguments)
+        except SystemExit:
+            result['status'] = GraftMServer.FAILED_STATUS
+            result['error'] = "Unable to parse graft arguments"
+            return result
+        args.subparser_name = 'graft'
+
+        logging.info("Starting job with arguments: %s" % ' '.join(arguments))
+        try:
+            # Import here to avoid a circular import, since run imports this
+            # module
+            from graftm.run import Run
+            Run(args).graft()
+            result['status'] = GraftMServer.SUCCEEDED_STATUS
+        except SystemExit as e:
+            # The graft pipeline exits with status 0 when it stops early
+            # e.g. with --search_only.
+            if e.code in (None, 0):
+                result['status'] = GraftMServer.SUCCEEDED_STATUS
+            else:
+                result['status'] = GraftMServer.FAILED_STATUS
+                result['error'] = "graft exited with status %s" % e.code
+        except Exception as e:
+            logging.exception("Job failed")
+            result['status'] = GraftMServer.FAILED_STATUS
+            result['error'] = str(e)
+        logging.info("Finished job with status %s: %s" % (result['status'], ' '.join(arguments)))
+        return result
+
+    def serve_socket(self, socket_path):
+        '''Accept jobs on a Unix socket at socket_path until interrupted.'''
+        server = self
+
+        class JobHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip(): continue
+                    try:
+                        job = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        result = {'status': GraftMServer.FAILED_STATUS,
+                                  'error': "Unable to parse job as JSON"}
+                    else:
+                        result = server._pool.submit(server.run_job, job).result()
+                    self.wfile.write((json.dumps(result)+"\n").encode('utf-8'))
+                    self.wfile.flush()
+
+        if os.path.exists(socket_path):
+            raise Exception("Socket %s already exists, is another server running?" % socket_path)
+        logging.info("Accepting graft jobs on socket %s" % socket_path)
+        with socketserver.ThreadingUnixStreamServer(socket_path, JobHandler) as unix_server:
+            try:
+                unix_server.serve_forever()
+            finally:
+                os.remove(socket_path)
+                self._pool.shutdown()
+
+    def serve_spool(self, spool_directory, **kwargs):
+        '''Run jobs written to spool_directory as they appear.
+
+        Parameters
+        ----------
+        spool_directory: str
+            directory to watch for job files
+        kwargs:
+            poll_interval: float
+                seconds to wait between checks for new jobs
+            exit_when_idle: bool
+                return once no jobs are waiting or running, rather than
+                waiting for more
+        '''
+        poll_interval = kwargs.pop('poll_interval', GraftMServerDefaultOptions.poll_interval)
+        exit_when_idle = kwargs.pop('exit_when_idle', False)
+        if len(kwargs) > 0:
+            raise Exception("Unexpected arguments detected: %s" % kwargs)
+
+        logging.info("Accepting graft jobs from spool directory %s" % spool_directory)
+        # Only claim as many jobs as can be run at once, so that other servers
+        # watching the same directory can take the rest.
+        free_workers = threading.BoundedSemaphore(self._workers)
+        try:
+            while True:
+                claimed_any = False
+                for name in sorted(os.listdir(spool_directory)):
+                    if not name.endswith(GraftMServer.JOB_SUFFIX): continue
+                    free_workers.acquire()
+                    job_path = os.path.join(spool_directory, name)
+                    running_path = job_path+GraftMServer.RUNNING_SUFFIX
+                    try:
+                        os.rename(job_path, running_path)
+                    except OSError:
+                        # Claimed by another server
+                        free_workers.release()
+                        continue
+                    claimed_any = True
+                    result_path = job_path[:-len(GraftMServer.JOB_SUFFIX)]+GraftMServer.RESULT_SUFFIX
+                    self._pool.submit(self._run_spooled_job, running_path, result_path, free_workers)
+
+                if not claimed_any:
+                    if exit_when_idle and self._idle(free_workers):
+                        break
+                    time.sleep(poll_interval)
+        finally:
+            self._pool.shutdown()
+
+    def _idle(self, free_workers):
+        acquired = 0
+        while acquired < self._workers and free_workers.acquire(blocking=False):
+            acquired += 1
+        for _ in range(acquired):
+            free_workers.release()
+        return acquired == self._workers
+
+    def _run_spooled_job(self, running_path, result_path, free_workers):
+        try:
+            try:
+                with open(running_path) as f:
+                    job = json.load(f)
+            except ValueError:
+                result = {'status': GraftMServer.FAILED_STATUS,
+                          'error': "Unable to parse job as JSON"}
+            except Exception as e:
+                logging.exception("Job failed")
+                result = {'status': GraftMServer.FAILED_STATUS,
+                          'error': str(e)}
+            else:
+                result = self.run_job(job)
+            with open(result_path+'.tmp', 'w') as f:
+                json.dump(result, f)
+            os.replace(result_path+'.tmp', result_path)
+            os.remove(running_path)
+        finally:
+            free_workers.release()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+'''Subsample FASTA reads on stdin, writing those kept to stdout. This module
+is run as a script in the shell pipelines built by UnpackRawReads, so only
+uses the standard library.'''
+
+import sys
+import json
+import zlib
+import argparse
+
+class ReadSubsampler:
+    '''Choose reads deterministically, so that the same reads are chosen each
+    time a file is read, and the same pairs are chosen from the forward and
+    reverse files of a paired sample.
+
+    A read is kept when the CRC32 hash of its name (with any /1 or /2 suffix
+    removed) is less than read_fraction of the hash space. Of the reads
+    passing that test, only the first max_reads are kept. In interleaved
+    input the decision is made on the first read of each pair, and applied
+    to both.'''
+
+    _HASH_SPACE = 2**32
+    _DRAIN_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, read_fraction=None, max_reads=None, interleaved=False):
+        if read_fraction is not None and not 0 < read_fraction <= 1:
+            raise Exception("The read fraction must be greater than 0 and at most 1, found %s" % read_fraction)
+        if max_reads is not None and max_reads < 1:
+            raise Exception("The maximum number of reads must be at least 1, found %s" % max_reads)
+        self._threshold = int(read_fraction * ReadSubsampler._HASH_SPACE) \
+            if read_fraction is not None else None
+        self._max_reads = max_reads
+        self._interleaved = interleaved
+
+    @staticmethod
+    def read_name(header_line):
+        '''Return the name of a read from its FASTA header line (bytes), in
+        the same form for both reads of a pair'''
+        name = header_line[1:].split(None, 1)[0] if len(header_line) > 1 else b''
+        if name.endswith(b'/1') or name.endswith(b'/2'):
+            name = name[:-2]
+        return name
+
+    def keep_read(self, name):
+        '''Return True if the read of the given name (bytes) passes the
+        read_fraction test'''
+        return self._threshold is None or \
+            (zlib.crc32(name) & 0xffffffff) < self._threshold
+
+    def subsample(self, input_io, output_io):
+        '''Write the chosen reads of binary FASTA input_io to output_io.
+
+        Once max_reads reads have been written, the remainder of the input is
+        only counted, not parsed, and is read to the end so that the process
+        writing it is not interrupted.
+
+        Returns
+        -------
+        dict with keys 'reads_seen' and 'reads_kept'
+        '''
+        seen = 0
+        kept = 0
+        keeping = False
+        for line in input_io:
+            if line.startswith(b'>'):
+                second_of_pair = self._interleaved and seen % 2 == 1
+                if not second_of_pair:
+                    if self._max_reads is not None and kept >= self._max_reads:
+                        seen += 1 + self._count_remaining_reads(input_io)
+                        keeping = False
+                        break
+                    keeping = self.keep_read(self.read_name(line))
+                seen += 1
+                if keeping:
+                    kept += 1
+            if keeping:
+                output_io.write(line)
+        return {'reads_seen': seen, 'reads_kept': kept}
+
+    def _count_remaining_reads(self, input_io):
+        count = 0
+        previous = b'\n'
+        while True:
+            chunk = input_io.read(ReadSubsampler._DRAIN_CHUNK_SIZE)
+            if not chunk: break
+            count += chunk.count(b'\n>')
+            if previous == b'\n' and chunk.startswith(b'>'):
+                count += 1
+            previous = chunk[-1:]
+        return count
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--read_fraction', type=float)
+    parser.add_argument('--max_reads', type=int)
+    parser.add_argument('--interleaved', action='store_true', default=False)
+    parser.add_argument('--statistics', help='write the number of reads seen and kept to this JSON file')
+    args = parser.parse_args()
+
+    statistics = ReadSubsampler(read_fraction=args.read_fraction,
+                                max_reads=args.max_reads,
+                                interleaved=args.interleaved).subsample(
+                                    sys.stdin.buffer, sys.stdout.buffer)
+    sys.stdout.buffer.flush()
+    if args.statistics:
+        with open(args.statistics, 'w') as f:
+            json.dump(statistics, f)
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,76 @@
-import numpy as np
+from array import array
 from biom.table import Table
+from scipy.sparse import coo_matrix
+import os
+import contextlib
+import shlex
 import tempfile
 import extern
 import logging
 
+class OtuTableAccumulator:
+    '''Counts of each taxonomy in each sample, stored sparsely so that tables
+    of many samples, most of which contain few of the taxonomies, can be
+    built without holding a dense matrix or any read-level assignments.
+
+    OTU IDs are numbered from 1 in the order in which each taxonomy is first
+    added, as in Stats_And_Summary._iterate_otu_table_rows.'''
+
+    def __init__(self):
+        self.sample_names = []
+        self._taxonomy_string_to_otu = {}
+        self._taxonomies = []
+        # For each OTU, a dict of sample index to count
+        self._counts = []
+
+    def add_sample(self, sample_name):
+        '''Add a sample with no counts, returning its index'''
+        self.sample_names.append(sample_name)
+        return len(self.sample_names)-1
+
+    def add(self, sample_index, taxonomy, count=1):
+        '''Add count observations of taxonomy (a list of str) to the sample
+        with the given index'''
+        taxonomy_string = '; '.join(taxonomy)
+        try:
+            otu = self._taxonomy_string_to_otu[taxonomy_string]
+        except KeyError:
+            otu = len(self._taxonomies)
+            self._taxonomy_string_to_otu[taxonomy_string] = otu
+            self._taxonomies.append(taxonomy)
+            self._counts.append({})
+        else:
+            if self._taxonomies[otu] != taxonomy:
+                raise Exception("Programming error: two different taxonomies had same taxonomy string")
+        counts = self._counts[otu]
+        counts[sample_index] = counts.get(sample_index, 0) + count
+
+    def num_otus(self):
+        return len(self._taxonomies)
+
+    def each_sparse_row(self):
+        '''Yield (otu_id, taxonomy, dict of sample index to count) for each
+        OTU'''
+        for otu, taxonomy in enumerate(self._taxonomies):
+            yield otu+1, taxonomy, self._counts[otu]
+
+    def each_row(self):
+        '''Yield (otu_id, taxonomy, list of counts in each sample) for each OTU,
+        as per Stats_And_Summary._iterate_otu_table_rows'''
+        num_samples = len(self.sample_names)
+        for otu_id, taxonomy, sparse_counts in self.each_sparse_row():
+            counts = [0]*num_samples
+            for sample_index, count in sparse_counts.items():
+                counts[sample_index] = count
+            yield otu_id, taxonomy, counts
+
 class Stats_And_Summary:
 
+    # Maximum number of samples given to each run of ktImportText
+    MAX_SAMPLES_PER_KRONA_PLOT = 1000
+    # Maximum number of krona input files written to at once
+    _MAX_OPEN_KRONA_INPUTS = 256
+
     def __init__(self): pass
 
     def coverage_of_hmm(self, hmm, count_table, coverage_table, avg_read_length):
@@ -38,12 +103,27 @@ class Stats_And_Summary:
             for read, tax in placements.items():
                 out.write("%s\t%s\n" % (read, '; '.join(tax)))
 
-    def build_basic_statistics(self, times, hit_read_count_list, placed_reads, base_list, output):
+    def build_basic_statistics(self, times, hit_read_count_list, placed_reads, base_list, output,
+                               subsample_statistics=None):
+        '''Write run statistics. If the reads were subsampled,
+        subsample_statistics is a list with an entry for each of base_list,
+        each a dict of 'reads_seen' and 'reads_kept' or None. The scaling
+        factor is the number by which counts can be multiplied to estimate
+        those of all the reads.'''
 
         output_lines = ["Basic run statistics (count):"]
         output_lines.append("Files:\t%s" % '\t'.join(base_list))
         if any([x[0] for x in hit_read_count_list if x[0] > 0]):
             output_lines.append("18S reads filtered:\t%s" % '\t'.join([str(x[0]) for x in hit_read_count_list]))
+        if subsample_statistics and any(subsample_statistics):
+            def field(stats, key):
+                return str(stats[key]) if stats else 'NA'
+            def scaling_factor(stats):
+                if not stats or stats['reads_kept'] == 0: return 'NA'
+                return "%.6g" % (float(stats['reads_seen']) / stats['reads_kept'])
+            output_lines.append("reads in input:\t%s" % '\t'.join([field(x, 'reads_seen') for x in subsample_statistics]))
+            output_lines.append("reads subsampled:\t%s" % '\t'.join([field(x, 'reads_kept') for x in subsample_statistics]))
+            output_lines.append("subsampling scaling factor:\t%s" % '\t'.join([scaling_factor(x) for x in subsample_statistics]))
         output_lines.append("reads detected:\t%s" % '\t'.join([str(x[1]) for x in hit_read_count_list]))
         output_lines.append("reads placed in tree:\t%s" % '\t'.join([str(x) for x in placed_reads]))
         output_lines.append("Runtime (seconds):")
@@ -56,6 +136,34 @@ class Stats_And_Summary:
             for line in output_lines:
                 stats_file.write(line + '\n')
 
+    def accumulate(self, read_taxonomies, sample_names=None):
+        '''Count the taxonomies of each sample into an OtuTableAccumulator,
+        so that the OTU table, biom file and krona plot can all be written from
+        the same sparse counts.
+
+        Parameters
+        ---------
+        read_taxonomies:
+            a list of hashes, where the position in the list corresponds to the
+            sample list, the key is the read name, and the value is an array
+            of taxonomic info
+        sample_names: list of str or None
+            names of each sample, or None to name them by their index
+
+        Returns
+        -------
+        OtuTableAccumulator'''
+        if sample_names is None:
+            sample_names = [str(i) for i in range(len(read_taxonomies))]
+        elif len(sample_names) != len(read_taxonomies):
+            raise Exception("Programming error: mismatched sample names and counts")
+        accumulator = OtuTableAccumulator()
+        for sample_name, read_to_taxonomy in zip(sample_names, read_taxonomies): # For each sample
+            sample_index = accumulator.add_sample(sample_name)
+            for taxonomy_array in read_to_taxonomy.values(): # For each read
+                accumulator.add(sample_index, taxonomy_array)
+        return accumulator
+
     def _iterate_otu_table_rows(self, read_taxonomies):
         '''yield that which is required for an OTU table: taxonomy, and
         count of that taxonomy in each sample as an array
@@ -76,39 +184,7 @@ class Stats_And_Summary:
         Return
         ------
         Nothing, use this as an iterator'''
-
-        taxonomy_string_to_taxonomy_array = {}
-        taxonomy_string_to_counts = {}
-        sample_index = 0
-        num_samples = len(read_taxonomies)
-        for read_to_taxonomy in read_taxonomies: # For each sample
-            for taxonomy_array in read_to_taxonomy.values(): # For each read
-                taxonomy_string = '; '.join(taxonomy_array)
-                if taxonomy_string in taxonomy_string_to_taxonomy_array:
-                    if taxonomy_string_to_taxonomy_array[taxonomy_string] != taxonomy_array:
-                        raise Exception("Programming error: two different taxonomies had same taxonomy string")
-                    try:
-                        taxonomy_string_to_counts[taxonomy_string][sample_index] += 1
-                    except KeyError:
-                        taxonomy_string_to_counts[taxonomy_string][sample_index] = 1
-                else:
-                    taxonomy_string_to_taxonomy_array[taxonomy_string] = taxonomy_array
-                    taxonomy_string_to_counts[taxonomy_string] = [0]*num_samples
-                    taxonomy_string_to_counts[taxonomy_string][sample_index] = 1
-            sample_index += 1
-
-        otu_id = 1
-        for tax_string, counts_array in taxonomy_string_to_counts.items():
-            array = []
-            for i in range(num_samples):
-                try:
-                    array.append(counts_array[i])
-                except IndexError:
-                    array.append(0)
-            yield otu_id,\
-                taxonomy_string_to_taxonomy_array[tax_string],\
-                array
-            otu_id += 1
+        return self.accumulate(read_taxonomies).each_row()
 
     def write_biom(self, sample_names, read_taxonomies, biom_file_io):
         '''Write the OTU info to a biom IO output stream
@@ -122,23 +198,51 @@ class Stats_And_Summary:
             open writeable stream to write biom contents to
 
         Returns True if successful, else False'''
-        counts = []
+        return self.write_accumulated_biom(self.accumulate(read_taxonomies, sample_names),
+                                           biom_file_io, 'GraftM graft')
+
+    def write_accumulated_biom(self, accumulator, biom_file_io, generated_by):
+        '''Write the counts of an OtuTableAccumulator to a biom IO output
+        stream, without converting them to a dense matrix.
+
+        Parameters
+        ----------
+        accumulator: OtuTableAccumulator
+            counts to write
+        biom_file_io: io
+            open writeable stream to write biom contents to
+        generated_by: str
+            description of the program generating the table
+
+        Returns True if successful, else False'''
+        if accumulator.num_otus() == 0:
+            logging.info("Not writing BIOM file since no sequences were assigned taxonomy")
+            return True
+
+        # Only the non-zero counts are stored
+        rows = array('q')
+        columns = array('q')
+        values = array('q')
         observ_metadata = []
         otu_ids = []
-        for otu_id, tax, count in self._iterate_otu_table_rows(read_taxonomies):
-            if len(count) != len(sample_names):
-                raise Exception("Programming error: mismatched sample names and counts")
-            counts.append(count)
+        for otu_id, tax, sparse_counts in accumulator.each_sparse_row():
+            for sample_index, count in sparse_counts.items():
+                rows.append(otu_id-1)
+                columns.append(sample_index)
+                values.append(count)
             observ_metadata.append({'taxonomy': tax})
             otu_ids.append(str(otu_id))
-        if len(counts) == 0:
-            logging.info("Not writing BIOM file since no sequences were assigned taxonomy")
-            return True
-        table = Table(np.array(counts),
-                      otu_ids, sample_names, observ_metadata,
-                      [{}]*len(sample_names), table_id='GraftM Taxonomy Count Table')
+        matrix = coo_matrix((values, (rows, columns)),
+                            shape=(len(otu_ids), len(accumulator.sample_names)))
+        table = Table(matrix.tocsr(),
+                      otu_ids, accumulator.sample_names, observ_metadata,
+                      [{}]*len(accumulator.sample_names),
+                      table_id='GraftM Taxonomy Count Table')
+        return self._write_biom_table(table, biom_file_io, generated_by)
+
+    def _write_biom_table(self, table, biom_file_io, generated_by):
         try:
-            table.to_hdf5(biom_file_io, 'GraftM graft')
+            table.to_hdf5(biom_file_io, generated_by)
             return True
         except RuntimeError as e:
             logging.warn("Error writing BIOM output, file not written. The specific error was: %s" % e)
@@ -147,12 +251,19 @@ class Stats_And_Summary:
     def write_tabular_otu_table(self, sample_names, read_taxonomies, combined_output_otu_table_io):
         '''A function that takes a hash of trusted placements, and compiles them
         into an OTU-esque table.'''
+        self.write_tabular_otu_table_rows(sample_names,
+                                          self._iterate_otu_table_rows(read_taxonomies),
+                                          combined_output_otu_table_io)
+
+    def write_tabular_otu_table_rows(self, sample_names, rows, combined_output_otu_table_io):
+        '''Write an OTU table from rows of (otu_id, taxonomy, counts) as
+        yielded by _iterate_otu_table_rows or OtuTableAccumulator.each_row'''
         delim = '\t'
         combined_output_otu_table_io.write(delim.join(['#ID',
                                                        delim.join(sample_names),
                                                        'ConsensusLineage']))
         combined_output_otu_table_io.write("\n")
-        for otu_id, tax, counts in self._iterate_otu_table_rows(read_taxonomies):
+        for otu_id, tax, counts in rows:
             combined_output_otu_table_io.write(delim.join(\
                 (str(otu_id),
                  delim.join([str(c) for c in counts]),
@@ -161,33 +272,63 @@ class Stats_And_Summary:
     def write_krona_plot(self, sample_names, read_taxonomies, output_krona_filename):
         '''Creates krona plot at the given location. Assumes the krona executable
         ktImportText is available on the shell PATH'''
-        tempfiles = []
-        for n in sample_names:
-            tempfiles.append(
-                tempfile.NamedTemporaryFile(
-                    prefix='GraftMkronaInput',
-                    suffix=n,
-                    mode='w'))
-
-        delim='\t'
-        for _, tax, counts in self._iterate_otu_table_rows(read_taxonomies):
-            for i, c in enumerate(counts):
-                if c != 0:
-                    tempfiles[i].write(delim.join((str(c),
-                                                  delim.join(tax)
-                                                  ))+"\n")
-
-        for t in tempfiles:
-            t.flush()
-
-        cmd = ["ktImportText",'-o',output_krona_filename]
-        for i, tmp in enumerate(tempfiles):
-            cmd.append(','.join([tmp.name,sample_names[i]]))
-
-        # run the actual krona
-        cmd = ' '.join(cmd)
-        extern.run(cmd)
-
-        # close tempfiles
-        for t in tempfiles:
-            t.close()
+        return self.write_accumulated_krona_plot(
+            self.accumulate(read_taxonomies, sample_names), output_krona_filename)
+
+    def write_accumulated_krona_plot(self, accumulator, output_krona_filename):
+        '''Creates krona plots of the counts of an OtuTableAccumulator.
+
+        The krona input of each sample is written to its own file in a
+        temporary directory, each row of the table being written straight to
+        the files of the samples it was found in. ktImportText is then run on
+        at most MAX_SAMPLES_PER_KRONA_PLOT samples at a time, so that command
+        line length limits are not reached. When there are more samples than
+        that, the plots are numbered, e.g. krona_1.html, krona_2.html,
+        otherwise the plot is written to output_krona_filename.
+
+        Parameters
+        ----------
+        accumulator: OtuTableAccumulator
+            counts to plot
+        output_krona_filename: str
+            path to the krona plot to create
+
+        Returns
+        -------
+        list of paths of the krona plots written
+        '''
+        sample_names = accumulator.sample_names
+        num_groups = max(1, -(-len(sample_names) // Stats_And_Summary.MAX_SAMPLES_PER_KRONA_PLOT))
+        if num_groups == 1:
+            output_paths = [output_krona_filename]
+        else:
+            base, extension = os.path.splitext(output_krona_filename)
+            output_paths = ["%s_%i%s" % (base, i+1, extension) for i in range(num_groups)]
+            logging.info("Splitting krona plot of %i samples into %i plots" % (len(sample_names), num_groups))
+
+        delim = '\t'
+        with tempfile.TemporaryDirectory(prefix='GraftMkronaInput') as directory:
+            input_paths = [os.path.join(directory, "%i.tsv" % i) for i in range(len(sample_names))]
+            # Only a limited number of files can be open at once, so the table
+            # is read once for each batch of samples
+            for start in range(0, len(sample_names), Stats_And_Summary._MAX_OPEN_KRONA_INPUTS):
+                end = min(start+Stats_And_Summary._MAX_OPEN_KRONA_INPUTS, len(sample_names))
+                with contextlib.ExitStack() as stack:
+                    files = [stack.enter_context(open(input_paths[i], 'w')) for i in range(start, end)]
+                    for _, tax, sparse_counts in accumulator.each_sparse_row():
+                        tax_string = None
+                        for sample_index, count in sparse_counts.items():
+                            if start <= sample_index < end:
+                                if tax_string is None:
+                                    tax_string = delim.join(tax)
+                                files[sample_index-start].write("%i%s%s\n" % (count, delim, tax_string))
+
+            for group, output_path in enumerate(output_paths):
+                start = group*Stats_And_Summary.MAX_SAMPLES_PER_KRONA_PLOT
+                cmd = ["ktImportText", '-o', shlex.quote(output_path)]
+                for i in range(start, min(start+Stats_And_Summary.MAX_SAMPLES_PER_KRONA_PLOT, len(sample_names))):
+                    cmd.append(shlex.quote(','.join([input_paths[i], sample_names[i]])))
+
+                # run the actual krona
+                extern.run(' '.join(cmd))
+        return output_paths
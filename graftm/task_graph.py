@@ -0,0 +1,119 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+class _Task:
+    def __init__(self, name, function, dependencies, threads):
+        self.name = name
+        self.function = function
+        self.dependencies = dependencies
+        self.threads = threads
+        self.result = None
+        self.start = None
+        self.end = None
+
+class TaskGraph:
+    '''A set of steps and the steps each depends on, run so that steps
+    whose dependencies have finished run at the same time, as long as the
+    number of threads they use together is within a budget. Steps are
+    expected to spend most of their time in external programs, so they are
+    run in Python threads.'''
+
+    def __init__(self):
+        self._tasks = {}
+        self._order = []
+
+    def add(self, name, function, dependencies=None, threads=1):
+        '''Add a step to the graph.
+
+        Parameters
+        ----------
+        name: str
+            unique name of the step
+        function: callable
+            called with no arguments to run the step. Its return value can be
+            retrieved with result(name)
+        dependencies: list of str
+            names of steps, already added, which must finish first
+        threads: int
+            number of threads the step uses
+        '''
+        if name in self._tasks:
+            raise Exception("Programming error: step %s added twice" % name)
+        dependencies = list(dependencies) if dependencies else []
+        for dependency in dependencies:
+            if dependency not in self._tasks:
+                raise Exception("Programming error: step %s depends on unknown step %s" % (name, dependency))
+        self._tasks[name] = _Task(name, function, dependencies, threads)
+        self._order.append(name)
+
+    def __contains__(self, name):
+        return name in self._tasks
+
+    def result(self, name):
+        '''Return the value returned by a step that has finished'''
+        return self._tasks[name].result
+
+    def run(self, threads=1):
+        '''Run all steps, using at most the given number of threads at once,
+        except that a step needing more than that many threads is run on its
+        own. If a step raises an exception, no more steps are started and the
+        exception is raised once the running steps have finished.'''
+        pending = list(self._order)
+        finished = set()
+        running = {}
+        available = threads
+        failure = None
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as pool:
+            while pending or running:
+                if failure is None:
+                    for name in list(pending):
+                        task = self._tasks[name]
+                        needed = min(task.threads, threads)
+                        if needed <= available and \
+                                all(d in finished for d in task.dependencies):
+                            logging.debug("Starting step %s" % name)
+                            pending.remove(name)
+                            available -= needed
+                            task.start = time.monotonic()
+                            running[pool.submit(task.function)] = task
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    task.end = time.monotonic()
+                    available += min(task.threads, threads)
+                    try:
+                        task.result = future.result()
+                    except Exception as e:
+                        if failure is None:
+                            failure = e
+                        continue
+                    logging.debug("Finished step %s in %.1f seconds" % (
+                        task.name, task.end-task.start))
+                    finished.add(task.name)
+        if failure is not None:
+            raise failure
+
+    def critical_path(self):
+        '''Return the chain of steps that determined how long the run took,
+        as a list of (name, seconds) tuples in the order they were run. It
+        ends with the last step to finish, and each step is preceded by
+        the dependency that finished last.'''
+        ran = [t for t in self._tasks.values() if t.end is not None]
+        if not ran:
+            return []
+        task = max(ran, key=lambda t: t.end)
+        path = []
+        while task is not None:
+            path.append((task.name, task.end-task.start))
+            task = max([self._tasks[d] for d in task.dependencies],
+                       key=lambda t: t.end, default=None)
+        return list(reversed(path))
+
+    def log_critical_path(self):
+        path = self.critical_path()
+        if path:
+            logging.info("Critical path: %s" % ", ".join(
+                "%s (%.1fs)" % (name, seconds) for name, seconds in path))
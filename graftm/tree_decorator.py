@@ -43,10 +43,12 @@ class TreeDecorator:
         tree        : dendropy.Tree
 
             dendropy.Tree object
-        taxonomy    : string
+        taxonomy    : string or dict
             Path to a file containing taxonomy information about the tree,
             either in Greengenes or taxtastic format (seqinfo file must also
-            be provided if taxonomy is in taxtastic format).
+            be provided if taxonomy is in taxtastic format), or an already
+            read dictionary of sequence name to taxonomy list, as returned
+            by GraftMPackage.taxonomy_hash.
         seqinfo     : string
             Path to a seqinfo file. This is a .csv file with the first column
             denoting the sequence name, and the second column, its most resolved
@@ -59,7 +61,9 @@ class TreeDecorator:
 
         # Read in taxonomy
         logging.info("Reading in taxonomy")
-        if seqinfo:
+        if isinstance(taxonomy, dict):
+            self.taxonomy = taxonomy
+        elif seqinfo:
             logging.info("Importing taxtastic taxonomy from files: %s and %s" % (taxonomy, seqinfo))
             gtns = Getaxnseq()
             self.taxonomy =  gtns.read_taxtastic_taxonomy_and_seqinfo(open(taxonomy), open(seqinfo))
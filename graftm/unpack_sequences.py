@@ -1,9 +1,21 @@
 import logging
 import subprocess
 import os
+import sys
+import json
+import shlex
 import itertools
 import extern
 
+from graftm import subsample_reads
+from graftm import interleave_reads
+
+class UnpackRawReadsDefaultOptions:
+    read_fraction = None
+    max_reads = None
+    subsample_statistics_path = None
+    reverse_read_file = None
+
 class UnpackRawReads:
     class UnexpectedFileFormatException(Exception): pass
 
@@ -32,7 +44,7 @@ class UnpackRawReads:
                                '.fasta.gz': FORMAT_FASTA_GZ,
                                }
 
-    def __init__(self, read_file, known_sequence_type=None, interleaved=False):
+    def __init__(self, read_file, known_sequence_type=None, interleaved=False, **kwargs):
         '''New object from a read file.
 
         read_file: str
@@ -41,13 +53,41 @@ class UnpackRawReads:
             PROTEIN_SEQUENCE_TYPE, NUCLEOTIDE_SEQUENCE_TYPE or None
             Whether input is nucleotide, amino acid, or should be guessed by
         peeking at the input sequence file.
-
+        kwargs:
+            read_fraction: float
+                only use this fraction of the reads, chosen by a hash of the
+                read name so that the same pairs are chosen from forward and
+                reverse read files (see subsample_reads.ReadSubsampler)
+            max_reads: int
+                only use the first this many reads (after read_fraction)
+            subsample_statistics_path: str
+                when subsampling, write the number of reads seen and used to
+                this file, for subsample_statistics()
+            reverse_read_file: str
+                path to the reverse reads of read_file. The reads of both are
+                streamed together as interleaved pairs, with /1 and /2
+                appended to the read names
         '''
+        read_fraction = kwargs.pop('read_fraction', UnpackRawReadsDefaultOptions.read_fraction)
+        max_reads = kwargs.pop('max_reads', UnpackRawReadsDefaultOptions.max_reads)
+        subsample_statistics_path = kwargs.pop('subsample_statistics_path', UnpackRawReadsDefaultOptions.subsample_statistics_path)
+        reverse_read_file = kwargs.pop('reverse_read_file', UnpackRawReadsDefaultOptions.reverse_read_file)
+        if len(kwargs) > 0:
+            raise Exception("Unexpected arguments detected: %s" % kwargs)
+
         logging.debug("Loading %s, type %s, interleaved %s", read_file,
                       known_sequence_type, interleaved)
         self.read_file = read_file
+        self.reverse_read_file = reverse_read_file
         self.known_sequence_type = known_sequence_type
-        self.interleaved = interleaved
+        self.interleaved = interleaved or reverse_read_file is not None
+        if read_fraction is not None or max_reads is not None:
+            # Check the options before they are used in a shell pipeline
+            subsample_reads.ReadSubsampler(read_fraction=read_fraction,
+                                           max_reads=max_reads)
+        self.read_fraction = read_fraction
+        self.max_reads = max_reads
+        self.subsample_statistics_path = subsample_statistics_path
 
     def _guess_sequence_type_from_string(self, seq):
         '''Return 'protein' if there is >10% amino acid residues in the
@@ -84,7 +124,7 @@ class UnpackRawReads:
         else:
             # If its Gzipped and fastq make a small sample of the sequence to be
             # read
-            cmd='%s | head -n 2' % (self.command_line())
+            cmd='%s | head -n 2' % (self._file_command_line(self.read_file))
             # We cannot use extern here because the zcat has non-zero
             # exitstatus because it is head'd and extern uses bash -o pipefail
             first_seq = subprocess.run(['bash','-c',cmd], stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout.decode('UTF-8')
@@ -120,21 +160,64 @@ class UnpackRawReads:
         names """
         return r""" | perl -pe 'if (m/^>/) {$i++; if ($i % 2 == 1) { if (m/^(\S+)(?<!\/1)(\s+\S.*)?(\s*)$/) { $_ = "$1/1$2$3" }} elsif ($i % 2 == 0) { if (m/^(\S+)(?<!\/2)(\s+\S.*)?(\s*)$/) { $_ = "$1/2$2$3" }}}'"""
 
+    def is_subsampled(self):
+        return self.read_fraction is not None or self.max_reads is not None
+
+    def subsample_command(self):
+        '''Return a command which subsamples FASTA reads from stdin to stdout'''
+        cmd = [sys.executable, os.path.abspath(subsample_reads.__file__)]
+        if self.read_fraction is not None:
+            cmd += ['--read_fraction', str(self.read_fraction)]
+        if self.max_reads is not None:
+            cmd += ['--max_reads', str(self.max_reads)]
+        if self.interleaved:
+            cmd.append('--interleaved')
+        if self.subsample_statistics_path:
+            cmd += ['--statistics', self.subsample_statistics_path]
+        return ' '.join([shlex.quote(c) for c in cmd])
+
+    def subsample_statistics(self):
+        '''Return a dict of the number of reads in the file ('reads_seen')
+        and the number used ('reads_kept'), or None if the reads were not
+        subsampled or have not yet been read.'''
+        if not self.is_subsampled() or not self.subsample_statistics_path \
+                or not os.path.exists(self.subsample_statistics_path):
+            return None
+        with open(self.subsample_statistics_path) as f:
+            return json.load(f)
+
     def command_line(self):
         '''Return a string to open read files with'''
-        file_format=self.guess_sequence_input_file_format(self.read_file)
+        cmd = self._unpack_command_line()
+        if self.is_subsampled():
+            cmd += " | %s" % self.subsample_command()
+            logging.debug("raw read unpacking command with subsampling: %s" % cmd)
+        return cmd
+
+    def _unpack_command_line(self):
+        if self.reverse_read_file:
+            cmd = ' '.join([shlex.quote(sys.executable),
+                            shlex.quote(os.path.abspath(interleave_reads.__file__)),
+                            "<(%s)" % self._file_command_line(self.read_file),
+                            "<(%s)" % self._file_command_line(self.reverse_read_file)])
+        else:
+            cmd = self._file_command_line(self.read_file)
+            if self.interleaved:
+                cmd+=self.get_interleaved_cmd()
+        logging.debug("raw read unpacking command chunk: %s" % cmd)
+        return cmd
+
+    def _file_command_line(self, read_file):
+        file_format=self.guess_sequence_input_file_format(read_file)
         logging.debug("Detected file format %s" % file_format)
         if file_format == self.FORMAT_FASTA:
-            cmd="""cat '%s'""" % (self.read_file)
+            cmd="""cat '%s'""" % (read_file)
         elif file_format == self.FORMAT_FASTQ_GZ:
-            cmd="""zcat '%s' | awk '{print ">" substr($0,2);getline;print;getline;getline}' -""" % (self.read_file)
+            cmd="""zcat '%s' | awk '{print ">" substr($0,2);getline;print;getline;getline}' -""" % (read_file)
         elif file_format == self.FORMAT_FASTA_GZ:
-            cmd="""zcat '%s'""" % (self.read_file)
+            cmd="""zcat '%s'""" % (read_file)
         elif file_format == self.FORMAT_FASTQ:
-            cmd="""awk '{print ">" substr($0,2);getline;print;getline;getline}' '%s'""" % (self.read_file)
-        if self.interleaved:
-            cmd+=self.get_interleaved_cmd()
-        logging.debug("raw read unpacking command chunk: %s" % cmd)
+            cmd="""awk '{print ">" substr($0,2);getline;print;getline;getline}' '%s'""" % (read_file)
         return cmd
 
     def get_file_as_process(self):
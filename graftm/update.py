@@ -4,16 +4,18 @@ import extern
 import tempfile
 from dendropy import Tree
 
-from graftm.create import Create
+from graftm.create import Create, InsufficientGraftMPackageVersion
 from graftm.graftm_package import GraftMPackageVersion3, GraftMPackage
 from graftm.greengenes_taxonomy import GreenGenesTaxonomy
 from graftm.decorator import Decorator
 from graftm.getaxnseq import Getaxnseq
 from graftm.rerooter import Rerooter
 from graftm.tree_decorator import TreeDecorator
+from graftm.sequence_io import SequenceIO
 
 class UpdateDefaultOptions:
     threads=5
+    full_rebuild=False
 
 class UpdatedGraftMPackage:
     '''Placeholder class for a package being built. For use internal to this file
@@ -41,6 +43,41 @@ class Update(Create):
         cmd = "cat %s > %s" % (to_cat, output)
         extern.run(cmd)
 
+    def _align_new_sequences(self, old_gpkg, input_sequence_path, output_alignment):
+        '''Align only the new sequences to the alignment HMM of the previous
+        package, and append them to its reference alignment.
+
+        Returns
+        -------
+        True if the new sequences could be aligned to the same columns as the
+        reference alignment, otherwise False.
+        '''
+        with tempfile.NamedTemporaryFile(prefix='graftm', suffix='.aln.fasta') as new_alignment:
+            self._align_sequences_to_hmm(old_gpkg.alignment_hmm_path(),
+                                         input_sequence_path,
+                                         new_alignment.name)
+            seqio = SequenceIO()
+            reference_lengths = set(len(s.seq) for s in
+                                    seqio.read_fasta_file(old_gpkg.alignment_fasta_path()))
+            new_lengths = set(len(s.seq) for s in
+                              seqio.read_fasta_file(new_alignment.name))
+            if len(reference_lengths | new_lengths) != 1:
+                logging.warning("New sequences aligned to the HMM have a different number of columns to the reference alignment")
+                return False
+            self._concatenate_file([old_gpkg.alignment_fasta_path(),
+                                    new_alignment.name],
+                                   output_alignment)
+        return True
+
+    def _starting_tree(self, old_gpkg, alignment, output_tree, threads):
+        '''Insert the sequences of alignment into the tree of the previous
+        package using pplacer, so that FastTree can optimise a tree
+        containing all sequences rather than build one from scratch.'''
+        with tempfile.NamedTemporaryFile(prefix='graftm', suffix='.jplace') as jplace:
+            extern.run("pplacer -j %i --verbosity 0 -c '%s' -o '%s' '%s'" % (
+                threads, old_gpkg.reference_package_path(), jplace.name, alignment))
+            extern.run("guppy tog -o '%s' '%s'" % (output_tree, jplace.name))
+
     def update(self, **kwargs):
         '''
         Update an existing GraftM package with new sequences and taxonomy. If no
@@ -61,12 +98,20 @@ class Update(Create):
         output_graftm_package_path: str
             Path to the directory to which the new GraftM package will be
             written to
+        threads: int
+            Number of threads to use
+        full_rebuild: bool
+            Re-align all sequences with mafft and build the HMM and tree from
+            scratch. By default only the new sequences are aligned, to the
+            previous alignment HMM, and the tree is optimised starting from
+            the previous tree with the new sequences inserted.
         '''
         input_sequence_path = kwargs.pop('input_sequence_path')
         input_taxonomy_path = kwargs.pop('input_taxonomy_path', None)
         input_graftm_package_path = kwargs.pop('input_graftm_package_path')
         output_graftm_package_path = kwargs.pop('output_graftm_package_path')
         threads = kwargs.pop('threads', UpdateDefaultOptions.threads) #TODO: add to user options
+        full_rebuild = kwargs.pop('full_rebuild', UpdateDefaultOptions.full_rebuild)
         if len(kwargs) > 0:
             raise Exception("Unexpected arguments detected: %s" % kwargs)
 
@@ -106,28 +151,52 @@ class Update(Create):
             if num_duplicate_taxonomies > 0:
                 logging.warn("Found %i taxonomic definitions in common between the previous and updated taxonomies. Using the updated taxonomy in each case." % num_duplicate_taxonomies)
 
-        ###############################
-        ### Re-construct alignments ###
-        logging.info("Multiple sequence aligning all sequences")
-        new_gpkg.aligned_sequences = "%s_mafft_alignment.fa" % (new_gpkg.name)
-        self._align_sequences(new_gpkg.unaligned_sequences, new_gpkg.aligned_sequences, threads)
-
-        ########################
-        ### Re-construct HMM ###
-        logging.info("Creating HMM from alignment")
-        new_gpkg.hmm = "%s.hmm" % (new_gpkg.name)
         new_gpkg.hmm_alignment = "%s_hmm_alignment.fa" % (new_gpkg.name)
-        self._get_hmm_from_alignment(new_gpkg.aligned_sequences, new_gpkg.hmm, new_gpkg.hmm_alignment)
-
-        #########################
-        ### Re-construct tree ###
-        logging.info("Generating phylogenetic tree")
+        new_gpkg.package_type, new_gpkg.hmm_length = self._pipe_type(old_gpkg.alignment_hmm_path())
         new_gpkg.unrooted_tree = "%s.tre" % (new_gpkg.name)
         new_gpkg.unrooted_tree_log = "%s.tre.log" % (new_gpkg.name)
-        new_gpkg.package_type, new_gpkg.hmm_length = self._pipe_type(old_gpkg.alignment_hmm_path())
-        new_gpkg.unrooted_gpkg_tree_log, new_gpkg.unrooted_gpkg_tree = \
-            self._build_tree(new_gpkg.hmm_alignment, new_gpkg.name,
-                             new_gpkg.package_type, self.fasttree)
+        if not full_rebuild:
+            ###########################################
+            ### Align new sequences to previous HMM ###
+            logging.info("Aligning new sequences to the previous alignment HMM")
+            if self._align_new_sequences(old_gpkg, input_sequence_path,
+                                         new_gpkg.hmm_alignment):
+                new_gpkg.hmm = old_gpkg.alignment_hmm_path()
+
+                ######################################
+                ### Extend tree from previous tree ###
+                logging.info("Generating phylogenetic tree starting from the previous tree")
+                new_gpkg.starting_tree = "%s_starting.tre" % (new_gpkg.name)
+                self._starting_tree(old_gpkg, new_gpkg.hmm_alignment,
+                                    new_gpkg.starting_tree, threads)
+                self.the_trash.append(new_gpkg.starting_tree)
+                new_gpkg.unrooted_gpkg_tree_log, new_gpkg.unrooted_gpkg_tree = \
+                    self._build_tree(new_gpkg.hmm_alignment, new_gpkg.name,
+                                     new_gpkg.package_type, self.fasttree,
+                                     starting_tree=new_gpkg.starting_tree)
+            else:
+                logging.warning("Unable to update the GraftM package incrementally, rebuilding it from scratch")
+                full_rebuild = True
+
+        if full_rebuild:
+            ###############################
+            ### Re-construct alignments ###
+            logging.info("Multiple sequence aligning all sequences")
+            new_gpkg.aligned_sequences = "%s_mafft_alignment.fa" % (new_gpkg.name)
+            self._align_sequences(new_gpkg.unaligned_sequences, new_gpkg.aligned_sequences, threads)
+
+            ########################
+            ### Re-construct HMM ###
+            logging.info("Creating HMM from alignment")
+            new_gpkg.hmm = "%s.hmm" % (new_gpkg.name)
+            self._get_hmm_from_alignment(new_gpkg.aligned_sequences, new_gpkg.hmm, new_gpkg.hmm_alignment)
+
+            #########################
+            ### Re-construct tree ###
+            logging.info("Generating phylogenetic tree")
+            new_gpkg.unrooted_gpkg_tree_log, new_gpkg.unrooted_gpkg_tree = \
+                self._build_tree(new_gpkg.hmm_alignment, new_gpkg.name,
+                                 new_gpkg.package_type, self.fasttree)
 
         ##############################################
         ### Re-root and decorate tree if necessary ###
@@ -150,8 +219,7 @@ class Update(Create):
             new_gpkg.gpkg_tree = "%s_gpkg.tree" % new_gpkg.name
             td = TreeDecorator(
                 rerooted_tree,
-                old_gpkg.taxtastic_taxonomy_path(),
-                old_gpkg.taxtastic_seqinfo_path())
+                old_gpkg.taxonomy_hash())
             
             with tempfile.NamedTemporaryFile(suffix='tsv') as taxonomy:
                 td.decorate(new_gpkg.gpkg_tree, taxonomy.name, True) 
@@ -196,6 +264,8 @@ class Update(Create):
 
         #####################################
         ### Re-construct diamond database ###
+        # DIAMOND databases cannot be extended in place, but makedb is only
+        # linear in the number of sequences, so it is simply run again.
         logging.info("Recreating DIAMOND DB")
         new_gpkg.diamond_database = "%s.dmnd" % (new_gpkg.name)
         self._create_dmnd_database(new_gpkg.unaligned_sequences, new_gpkg.name)
@@ -213,7 +283,7 @@ class Update(Create):
         ###################
         ### Test it out ###
         logging.info("Testing newly updated GraftM package works")
-        self._test_package(new_gpkg.name)
+        self._test_package(new_gpkg.name, threads)
 
         logging.info("Finished")
     
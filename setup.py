@@ -17,6 +17,8 @@ setup(name='graftm',
       packages=find_packages(exclude='docs'),
       install_requires=('biopython >=1.64',
                         'biom-format >=2.1.4',
+                        'numpy',
+                        'scipy',
                         'extern >=0.0.4',
                         'taxtastic >=0.5.4',
                         'bird_tool_utils',
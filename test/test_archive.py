@@ -29,10 +29,15 @@ import extern
 import logging
 import tempfile
 import filecmp
+import tarfile
+import io
+import shutil
 from bird_tool_utils import in_tempdir
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
 from graftm.archive import Archive
+from graftm.parallel_gzip import ParallelGzipWriterDefaultOptions
+from graftm.graftm_package import GraftMPackage
 
 path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)),'..','bin','graftM')
 path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
@@ -65,6 +70,111 @@ class Tests(unittest.TestCase):
                 sorted(file_list+[dmnd, refpkg]),
                 sorted(os.listdir(out)))
 
+    def test_extract_from_stdin(self):
+        with in_tempdir():
+            ingpkg = os.path.join(path_to_data, 'mcrA.gpkg')
+            arc = 'compressed.gpkg.tar.gz'
+            out = 'reconstituted.gpkg'
+            Archive().create(ingpkg, arc, threads=2)
+            with open(arc, 'rb') as f:
+                extern.run("%s archive --extract --archive - --graftm_package %s" % (
+                    path_to_script, out), stdin=f.read())
+            for f in ['CONTENTS.json', 'mcrA.faa', 'mcrA.hmm']:
+                self.assertTrue(filecmp.cmp(
+                    os.path.join(ingpkg, f),
+                    os.path.join(out, f)))
+            self.assertTrue(os.path.exists(os.path.join(out, 'mcra.faa.dmnd')))
+
+    def _create_multi_block_archive(self, ingpkg, arc):
+        # Use small blocks so the archive is written as many gzip members,
+        # as an archive of a package larger than one default block would be
+        default_block_size = ParallelGzipWriterDefaultOptions.block_size
+        ParallelGzipWriterDefaultOptions.block_size = 4096
+        try:
+            Archive().create(ingpkg, arc, threads=4)
+        finally:
+            ParallelGzipWriterDefaultOptions.block_size = default_block_size
+        with open(arc, 'rb') as f:
+            self.assertTrue(f.read().count(b'\x1f\x8b\x08') > 2)
+
+    def test_extract_multi_block(self):
+        with in_tempdir():
+            ingpkg = os.path.join(path_to_data, 'mcrA.gpkg')
+            arc = 'compressed.gpkg.tar.gz'
+            out = 'reconstituted.gpkg'
+            self._create_multi_block_archive(ingpkg, arc)
+            Archive().extract(arc, out)
+            for f in ['CONTENTS.json', 'mcrA.faa', 'mcrA.hmm']:
+                self.assertTrue(filecmp.cmp(
+                    os.path.join(ingpkg, f),
+                    os.path.join(out, f), shallow=False))
+            self.assertTrue(os.path.exists(os.path.join(out, 'mcra.faa.dmnd')))
+
+    def test_extract_multi_block_from_stdin(self):
+        with in_tempdir():
+            ingpkg = os.path.join(path_to_data, 'mcrA.gpkg')
+            arc = 'compressed.gpkg.tar.gz'
+            out = 'reconstituted.gpkg'
+            self._create_multi_block_archive(ingpkg, arc)
+            with open(arc, 'rb') as f:
+                extern.run("%s archive --extract --archive - --graftm_package %s" % (
+                    path_to_script, out), stdin=f.read())
+            for f in ['CONTENTS.json', 'mcrA.faa', 'mcrA.hmm']:
+                self.assertTrue(filecmp.cmp(
+                    os.path.join(ingpkg, f),
+                    os.path.join(out, f), shallow=False))
+            self.assertTrue(os.path.exists(os.path.join(out, 'mcra.faa.dmnd')))
+
+    def test_extract_path_traversal(self):
+        with in_tempdir():
+            with tarfile.open('bad.tar.gz', 'w:gz') as tar:
+                info = tarfile.TarInfo('bad.gpkg/../../evil')
+                info.size = 1
+                tar.addfile(info, io.BytesIO(b'x'))
+            with self.assertRaises(Exception):
+                Archive().extract('bad.tar.gz', 'out.gpkg')
+            self.assertFalse(os.path.exists('out.gpkg'))
+            self.assertFalse(os.path.exists(os.path.join('..', 'evil')))
+
+    def test_include_indexes(self):
+        with in_tempdir():
+            shutil.copytree(os.path.join(path_to_data, 'mcrA.gpkg'), 'mcrA.gpkg')
+            arc = 'compressed.gpkg.tar.gz'
+            Archive().create('mcrA.gpkg', arc, include_indexes=True)
+            with tarfile.open(arc) as tar:
+                self.assertTrue('mcrA.gpkg/mcra.faa.dmnd' in tar.getnames())
+                self.assertTrue('mcrA.gpkg/taxonomy.compiled' in tar.getnames())
+
+            Archive().extract(arc, 'reconstituted.gpkg')
+            self.assertTrue(filecmp.cmp('mcrA.gpkg/mcra.faa.dmnd',
+                                        'reconstituted.gpkg/mcra.faa.dmnd',
+                                        shallow=False))
+            self.assertFalse(os.path.exists('reconstituted.gpkg/INDEXES.json'))
+            # The bundled compiled taxonomy is up to date, so is not rewritten
+            compiled = 'reconstituted.gpkg/taxonomy.compiled'
+            mtime = os.stat(compiled).st_mtime_ns
+            GraftMPackage.acquire('reconstituted.gpkg').compiled_taxonomy()
+            self.assertEqual(mtime, os.stat(compiled).st_mtime_ns)
+
+    def test_include_indexes_corrupt(self):
+        with in_tempdir():
+            shutil.copytree(os.path.join(path_to_data, 'mcrA.gpkg'), 'mcrA.gpkg')
+            Archive().create('mcrA.gpkg', 'good.tar.gz', include_indexes=True)
+            # Rewrite the archive with a corrupted compiled taxonomy
+            with tarfile.open('good.tar.gz') as good, tarfile.open('bad.tar.gz', 'w:gz') as bad:
+                for member in good.getmembers():
+                    data = good.extractfile(member).read() if member.isfile() else None
+                    if member.name == 'mcrA.gpkg/taxonomy.compiled':
+                        data = b'corrupted'
+                        member.size = len(data)
+                    bad.addfile(member, io.BytesIO(data) if data is not None else None)
+
+            Archive().extract('bad.tar.gz', 'reconstituted.gpkg')
+            self.assertFalse(os.path.exists('reconstituted.gpkg/taxonomy.compiled'))
+            self.assertTrue(os.path.exists('reconstituted.gpkg/mcra.faa.dmnd'))
+            # and is regenerated when needed
+            self.assertTrue(len(GraftMPackage.acquire('reconstituted.gpkg').taxonomy_hash()) > 0)
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.ERROR)
     unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import json
+import tempfile
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.classify import Classify
+from graftm.compiled_taxonomy import CompiledTaxonomy
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+taxonomy_path = os.path.join(path_to_data, '61_otus.gpkg', '61_otus.refpkg', '61_otus_taxonomy.csv')
+seqinfo_path = os.path.join(path_to_data, '61_otus.gpkg', '61_otus.refpkg', '61_otus_seqinfo.csv')
+
+class Tests(unittest.TestCase):
+    fields = ["classification", "distal_length", "edge_num", "like_weight_ratio", "likelihood", "pendant_length"]
+
+    def assign(self, placements, cutoff=0.75, resolve_placements=False):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.jplace') as f:
+            json.dump({'fields': self.fields, 'placements': placements}, f)
+            f.flush()
+            classify = Classify(taxonomy_path)
+            return classify, classify.assignPlacement(f.name, cutoff, resolve_placements)
+
+    def test_single_confident_placement(self):
+        _, assignments = self.assign([
+            {'p': [['c__Gammaproteobacteria', 0.1, 1, 0.9, -1, 0.2]],
+             'nm': [['read1_0', 1]]}])
+        self.assertEqual(['Root', 'k__Bacteria', 'p__Proteobacteria', 'c__Gammaproteobacteria'],
+                         assignments['0']['read1']['placement'])
+
+    def test_split_placement_stops_at_cutoff(self):
+        _, assignments = self.assign([
+            {'p': [['c__Gammaproteobacteria', 0.1, 1, 0.5, -1, 0.2],
+                   ['p__Proteobacteria', 0.1, 2, 0.5, -1, 0.2]],
+             'nm': [['read1_0', 1]]}])
+        self.assertEqual(['Root', 'k__Bacteria', 'p__Proteobacteria'],
+                         assignments['0']['read1']['placement'])
+        self.assertEqual([1.0, 1.0, 1.0],
+                         assignments['0']['read1']['confidence'])
+
+    def test_resolve_placements(self):
+        _, assignments = self.assign([
+            {'p': [['c__Gammaproteobacteria', 0.1, 1, 0.6, -1, 0.2],
+                   ['p__Proteobacteria', 0.1, 2, 0.4, -1, 0.2]],
+             'nm': [['read1_0', 1]]}],
+            resolve_placements=True)
+        self.assertEqual(['Root', 'k__Bacteria', 'p__Proteobacteria', 'c__Gammaproteobacteria'],
+                         assignments['0']['read1']['placement'])
+
+    def test_identical_placement_groups_are_cached(self):
+        p = [['c__Gammaproteobacteria', 0.1, 1, 0.5, -1, 0.2],
+             ['p__Proteobacteria', 0.1, 2, 0.5, -1, 0.2]]
+        classify, assignments = self.assign([
+            {'p': p, 'nm': [['read1_0', 1]]},
+            {'p': p, 'nm': [['read2_1', 1]]}])
+        self.assertEqual(1, len(classify._placement_cache))
+        self.assertIs(assignments['0']['read1'], assignments['1']['read2'])
+    def test_compiled_taxonomy(self):
+        with open(taxonomy_path) as tax:
+            with open(seqinfo_path) as seqinfo:
+                compiled = CompiledTaxonomy._from_buffer(CompiledTaxonomy.compile(tax, seqinfo))
+        self.assertEqual(Classify(taxonomy_path).taxonomy,
+                         Classify(compiled).taxonomy)
+
+    def test_compiled_taxonomy_empty_middle_rank(self):
+        taxonomy = "\n".join([
+            "tax_id,parent_id,rank,tax_name,root,kingdom,phylum,class,order",
+            "Root,Root,root,Root,Root,,,,",
+            "k__A,Root,kingdom,k__A,Root,k__A,,,",
+            "p__B,k__A,phylum,p__B,Root,k__A,p__B,,",
+            # No class
+            "o__C,p__B,order,o__C,Root,k__A,p__B,,o__C"])+"\n"
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv') as tax:
+            tax.write(taxonomy)
+            tax.flush()
+            compiled = CompiledTaxonomy._from_buffer(CompiledTaxonomy.compile(
+                open(tax.name), ["seqname,tax_id\n", "seq1,o__C\n"]))
+            self.assertEqual(['Root', 'k__A', 'p__B', 'o__C'],
+                             Classify(tax.name).taxonomy['o__C'])
+            self.assertEqual(Classify(tax.name).taxonomy,
+                             Classify(compiled).taxonomy)
+        self.assertEqual({'seq1': ['k__A', 'p__B', 'o__C']}, compiled.taxonomy_hash())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -32,7 +32,7 @@ from Bio.Seq import Seq
 from dendropy import Tree
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
-from graftm.create import Create
+from graftm.create import Create, RerootingFailedException
 from graftm.graftm_package import GraftMPackageVersion2, GraftMPackage
 from graftm.sequence_io import Sequence
 from graftm.external_program_suite import ExternalProgramSuite
@@ -214,6 +214,29 @@ r6\td__Archaea;p__Euryarchaeota;c__Methanomicrobia;o__Halobacteriales;f__Halobac
 
                         self.assertEqual(nseq, expected)
 
+    def test_insufficiently_aligned_cascade(self):
+        # Once X is removed, the last 3 columns are no longer match columns,
+        # so Y becomes insufficiently aligned too
+        alignment = [Sequence('s0','AAAAAAAAAA'),
+                     Sequence('s1','AAAAAAA---'),
+                     Sequence('s2','AAAAAAA---'),
+                     Sequence('s3','AAAAAAA---'),
+                     Sequence('X', '-------AAA'),
+                     Sequence('Y', 'AA-----AAA')]
+        create = Create(prerequisites)
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.fasta') as f:
+            for s in alignment:
+                f.write(">%s\n%s\n" % (s.name, s.seq))
+            f.flush()
+            with open(f.name) as a:
+                self.assertEqual(['X'], create._check_reads_hit(a, 0.3))
+            self.assertEqual(['X','Y'],
+                             create._insufficiently_aligned_sequences(f.name, [], 0.3))
+            self.assertEqual(['Y'],
+                             create._insufficiently_aligned_sequences(f.name, ['X'], 0.3))
+            self.assertEqual([],
+                             create._insufficiently_aligned_sequences(f.name, [], 0.1))
+
     def test_strange_character_replace(self):
         create = Create(prerequisites)
         seqs = [Sequence('namer','SEQWENCE')]
@@ -238,6 +261,19 @@ r6\td__Archaea;p__Euryarchaeota;c__Methanomicrobia;o__Halobacteriales;f__Halobac
         self.assertEqual(1, len(seqs))
         self.assertEqual('ATGCNTNT', str(seqs[0].seq))
 
+    def test_strange_character_warnings_aggregated(self):
+        create = Create(prerequisites)
+        seqs = [Sequence('one','SEQUUENCEBu'),
+                Sequence('two','SEQWENCE'),
+                Sequence('three','SEQ*ENCE')]
+        with self.assertLogs(level='WARNING') as logs:
+            create._mask_strange_sequence_letters(seqs, Create._PROTEIN_PACKAGE_TYPE)
+        self.assertEqual(['SEQXXENCEXX','SEQWENCE','SEQXENCE'],
+                         [s.seq for s in seqs])
+        self.assertEqual(3, len(logs.output))
+        self.assertTrue("'B' x1, 'U' x2, 'u' x1" in logs.output[0])
+        self.assertTrue("Replaced 5 non-standard characters in 2 sequences" in logs.output[2])
+
     def test_remove_strange_characters_integration_test(self):
         with tempfile.TemporaryDirectory() as tmp:
             gpkg = tmp+".gpkg"
@@ -321,6 +357,23 @@ r6\td__Archaea;p__Euryarchaeota;c__Methanomicrobia;o__Halobacteriales;f__Halobac
             with self.assertRaises(KeyError) as context:
                 pkg.reference_package_tree_path()
 
+    def test_taxit_create_failure_raises(self):
+        # taxit create fails with empty inputs, which must raise rather than
+        # exit, since it is run in a step of the create TaskGraph
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                for name in ['aln.faa', 'tree.tre', 'tree.log', 'tax.csv', 'seqinfo.csv']:
+                    open(name, 'w').close()
+                with self.assertRaises(RerootingFailedException):
+                    Create(prerequisites)._taxit_create(
+                        'base', 'aln.faa', 'tree.tre', 'tree.log', 'tax.csv',
+                        'seqinfo.csv', 'out.refpkg', False)
+                self.assertTrue(os.path.exists('graftm_create_tree.base.tree'))
+            finally:
+                os.chdir(cwd)
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.ERROR)
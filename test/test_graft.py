@@ -593,6 +593,32 @@ AAAAAFFFAFFFFFF<FFFFFFAAFFFFFF)FFFFAFFFFFFFFFFFFFFFFFFFFFFFF7FF7FFFFFFFF<FFFFFFF
             self.assertTrue(os.path.isdir(os.path.join(tmp, 'mcrA_1.1', 'forward'))) # Check forward and reverse reads exist.
             self.assertTrue(os.path.isdir(os.path.join(tmp, 'mcrA_1.1', 'reverse')))
 
+    def test_single_paired_read_run_McrA_interleave_pairs(self):
+        data_for = os.path.join(path_to_data,'mcrA.gpkg', 'mcrA_1.1.fna')
+        data_rev = os.path.join(path_to_data,'mcrA.gpkg', 'mcrA_1.2.fna')
+        package = os.path.join(path_to_data,'mcrA.gpkg')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cmd = '%s graft --verbosity 2  --forward %s --reverse %s --interleave_pairs --graftm_package %s --output_directory %s --force' % (path_to_script,
+                                                                                                           data_for,
+                                                                                                           data_rev,
+                                                                                                           package,
+                                                                                                           tmp)
+            subprocess.check_output(cmd, shell=True)
+            otuTableFile = os.path.join(tmp, 'combined_count_table.txt')
+            lines = ("\t".join(('#ID','mcrA_1.1','ConsensusLineage')),
+                     "\t".join(('1','1','Root; mcrA; Euryarchaeota_mcrA; Methanomicrobia; Methanosarcinales; Methanosarcinaceae; Methanosarcina')),
+                     )
+            count = 0
+            for line in open(otuTableFile):
+                self.assertEqual(lines[count], line.strip())
+                count += 1
+            self.assertEqual(count, 2)
+
+            # Both directions are searched together
+            self.assertTrue(os.path.isdir(os.path.join(tmp, 'mcrA_1.1', 'interleaved')))
+            self.assertFalse(os.path.isdir(os.path.join(tmp, 'mcrA_1.1', 'forward')))
+
     def test_multiple_forward_read_run_McrA(self):
         data_for1 = os.path.join(path_to_data,'mcrA.gpkg', 'mcrA_1.1.fna')
         data_for2 = os.path.join(path_to_data,'mcrA.gpkg', 'mcrA_2.1.fna')
@@ -1488,6 +1514,40 @@ CGGGAGGAACACCAGTGGCGAAGGCGGCTTCCTGGCCTGTTCTTGACGCTGAGGCGCGAA
             self.assertTrue(os.path.exists(os.path.join(tmp, "combined_count_table.txt")))
             self.assertFalse(os.path.exists(os.path.join(tmp, "krona.html")))
 
+    def test_scratch_directory(self):
+        data = os.path.join(path_to_data,'16S_inputs','16S_1.1.fa')
+        package = os.path.join(path_to_data,'61_otus.gpkg')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with tempfile.TemporaryDirectory() as scratch:
+                cmd = '%s graft --verbosity 2  --forward %s --graftm_package %s --output_directory %s --force --scratch_directory %s' % (path_to_script,
+                                                                                                   data,
+                                                                                                   package,
+                                                                                                   tmp,
+                                                                                                   scratch)
+                extern.run(cmd)
+                with open(os.path.join(tmp, 'combined_count_table.txt')) as f:
+                    self.assertEqual("\n".join(["\t".join(('#ID','16S_1.1','ConsensusLineage')),
+                                                "\t".join(('1','2','Root; k__Bacteria')),'']),
+                                     f.read())
+                self.assertEqual([], os.listdir(scratch))
+                self.assertFalse(os.path.exists(os.path.join(tmp, 'combined_alignment.aln.fa')))
+                self.assertTrue(os.path.exists(os.path.join(tmp, '16S_1.1', 'placements.jplace')))
+
+    def test_keep_intermediates(self):
+        data = os.path.join(path_to_data,'16S_inputs','16S_1.1.fa')
+        package = os.path.join(path_to_data,'61_otus.gpkg')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cmd = '%s graft --verbosity 2  --forward %s --graftm_package %s --output_directory %s --force --keep_intermediates' % (path_to_script,
+                                                                                               data,
+                                                                                               package,
+                                                                                               tmp)
+            extern.run(cmd)
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'combined_alignment.aln.fa')))
+            self.assertTrue(os.path.exists(os.path.join(tmp, 'combined_alignment.aln.jplace')))
+            self.assertTrue(os.path.exists(os.path.join(tmp, '16S_1.1', '16S_1.1_clustered.fa')))
+
     def test_decoy(self):
         # Sequence mostly like McrA in file, but also some extra stuff so decoy
         # bitscore is higher.
@@ -1657,6 +1717,28 @@ ACAGTCGAGACGGTCAAAGATATCGGTACAGAGGTA
 KRWKFHAPNMGARKRHSPRRGSLAYSPRARAKSMEARIRAWPEVDEAQEPRILAHCGFKAGCVQIVSIDDRGKVPNAGKQLVSLGTVLATPPVLILGIRGYARDAARGLYAAFDVYAEDMPREMAKVVKLKNGDENALKNAEASLGRISELYAILAVSPRQAGLEQKNPYIFEGMVGGGTIAQQFEYLSGMLGKQVSISDTFEAGSSVDVAAITKGKGWQGVLKRWNVKKKQHKSRKTVREVGSLGPISPQSVMYTVPRAGQFGFHQRTEYNKRIMIVGDATAEEEQRRQEMEAQSAAAAGSKKSDGIKRRRGAGSQSAQLQQQNKGINPAGGYKHFGLVKGEYVILKGSVPGTYRRLVKLRSQVRNKPAKVSKPNILEVVV'''+"\n",
                     f.read())
 
+    def test_search_hmm_database_same_as_separate_searches(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            package = os.path.join(tmp, 'rplC.gpkg')
+            shutil.copytree(os.path.join(path_to_data, 'S1.2.ribosomal_protein_L3_rplC'), package)
+            with open(os.path.join(package, 'CONTENTS.json')) as f:
+                contents = json.load(f)
+            search_hmms = [os.path.join(package, hmm) for hmm in contents['search_hmms']]
+            aln_hmm = os.path.join(package, contents['align_hmm'])
+            forward = os.path.join(path_to_data,'aa_orf_split_bug.fna')
+
+            extern.run('{} graft --forward {} --graftm_package {} --search_and_align_only --output_directory {}/database'.format(
+                path_to_script, forward, package, tmp))
+            self.assertTrue(os.path.exists(os.path.join(package, 'search_hmms.binary.hmm')))
+            extern.run('{} graft --forward {} --search_hmm_files {} --aln_hmm_file {} --search_and_align_only --output_directory {}/separate'.format(
+                path_to_script, forward, ' '.join(search_hmms), aln_hmm, tmp))
+
+            with open(os.path.join(tmp, 'database', 'aa_orf_split_bug', 'aa_orf_split_bug_hits.aln.fa')) as f:
+                database_alignment = f.read()
+            with open(os.path.join(tmp, 'separate', 'aa_orf_split_bug', 'aa_orf_split_bug_hits.aln.fa')) as f:
+                self.assertEqual(f.read(), database_alignment)
+            self.assertTrue(len(database_alignment) > 0)
+
 
 
 if __name__ == "__main__":
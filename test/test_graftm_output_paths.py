@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.graftm_output_paths import GraftMFiles
+
+class Tests(unittest.TestCase):
+    def test_intermediate_paths_in_scratch_directory(self):
+        gmf = GraftMFiles('sample', '/out', 'forward', scratch_directory='/scratch')
+        paths = gmf.intermediate_paths('sample')
+        self.assertTrue(os.path.join('/scratch', 'sample', 'forward', 'sample_forward.sto') in paths)
+        for path in paths:
+            self.assertTrue(path.startswith(os.path.join('/scratch', 'sample', 'forward')+os.sep), path)
+        self.assertEqual(os.path.join('/scratch', 'combined_alignment.aln.fa'), gmf.comb_aln_fa())
+        # Outputs stay in the output directory
+        self.assertEqual(os.path.join('/out', 'sample', 'forward', 'sample_forward_hits.aln.fa'),
+                         gmf.aligned_fasta_output_path('sample'))
+
+    def test_intermediate_paths_without_scratch_directory(self):
+        gmf = GraftMFiles('sample', '/out', False)
+        for path in gmf.intermediate_paths('sample'):
+            self.assertTrue(path.startswith(os.path.join('/out', 'sample', 'sample')), path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,9 +24,14 @@
 import unittest
 import sys
 import os
+import json
+import shutil
+import tempfile
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
-from graftm.graftm_package import GraftMPackage
+from graftm.graftm_package import GraftMPackage, GraftMPackageVersion3
+from graftm.package_manifest import PackageManifest, CorruptGraftMPackageException
+from graftm.getaxnseq import Getaxnseq
 
 path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
 
@@ -52,7 +57,118 @@ class Tests(unittest.TestCase):
         pkg = GraftMPackage.acquire(os.path.join(path_to_data, '61_otus.gpkg'))
         self.assertEqual(False, pkg.is_protein_package())
         self.assertEqual(False, pkg.is_protein_package())
-        
+
+    def test_compiled_taxonomy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            gpkg_path = os.path.join(tmp, '61_otus.gpkg')
+            shutil.copytree(os.path.join(path_to_data, '61_otus.gpkg'), gpkg_path)
+            pkg = GraftMPackage.acquire(gpkg_path)
+            with open(pkg.taxtastic_taxonomy_path()) as tax:
+                with open(pkg.taxtastic_seqinfo_path()) as seqinfo:
+                    expected = Getaxnseq().read_taxtastic_taxonomy_and_seqinfo(tax, seqinfo)
+
+            self.assertFalse(os.path.exists(pkg.compiled_taxonomy_path()))
+            taxonomy = pkg.taxonomy_hash()
+            self.assertTrue(os.path.exists(pkg.compiled_taxonomy_path()))
+            self.assertEqual(expected, taxonomy)
+            self.assertEqual(['k__Bacteria','p__Proteobacteria','c__Deltaproteobacteria','o__Desulfobacterales','f__Desulfobulbaceae'],
+                             taxonomy['4459468'])
+            self.assertIs(taxonomy['4363563'], taxonomy['4452949'])
+
+            # Read back from the compiled file by a fresh package
+            self.assertEqual(expected, GraftMPackage.acquire(gpkg_path).taxonomy_hash())
+
+    def test_compiled_taxonomy_regenerated_when_stale(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            gpkg_path = os.path.join(tmp, '61_otus.gpkg')
+            shutil.copytree(os.path.join(path_to_data, '61_otus.gpkg'), gpkg_path)
+            pkg = GraftMPackage.acquire(gpkg_path)
+            pkg.taxonomy_hash()
+            with open(pkg.taxtastic_seqinfo_path(), 'a') as f:
+                f.write("new_sequence,k__Bacteria\n")
+            self.assertEqual(['k__Bacteria'],
+                             GraftMPackage.acquire(gpkg_path).taxonomy_hash()['new_sequence'])
+
+    def test_version2_taxonomy_hash(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            gpkg_path = os.path.join(tmp, '61_otus.gpkg')
+            shutil.copytree(os.path.join(path_to_data, '61_otus.gpkg'), gpkg_path)
+            contents_path = os.path.join(gpkg_path, 'CONTENTS.json')
+            with open(contents_path) as f:
+                contents = json.load(f)
+            contents['graftm_package_version'] = 2
+            del contents['unaligned_sequence_database']
+            with open(contents_path, 'w') as f:
+                json.dump(contents, f)
+
+            pkg = GraftMPackage.acquire(gpkg_path)
+            self.assertEqual(2, pkg.version)
+            self.assertEqual(['k__Bacteria','p__Proteobacteria','c__Deltaproteobacteria','o__Desulfobacterales','f__Desulfobulbaceae'],
+                             pkg.taxonomy_hash()['4459468'])
+
+    def test_compile_writes_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            pkg = GraftMPackage.acquire(os.path.join(path_to_data, 'mcrA.gpkg'))
+            gpkg_path = os.path.join(tmp, 'new.gpkg')
+            GraftMPackageVersion3.compile(gpkg_path, pkg.reference_package_path(),
+                                          pkg.alignment_hmm_path(), None, 1000,
+                                          pkg.unaligned_sequence_database_path())
+            with open(os.path.join(gpkg_path, PackageManifest.FILE_NAME)) as f:
+                manifest = json.load(f)
+            self.assertTrue('CONTENTS.json' in manifest['files'])
+            self.assertTrue('mcrA.faa' in manifest['files'])
+            self.assertTrue(os.path.join('mcrA.refpkg', 'CONTENTS.json') in manifest['files'])
+            GraftMPackage.acquire(gpkg_path, validation=PackageManifest.FULL_VALIDATION)
+
+    def test_validation(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            gpkg_path = os.path.join(tmp, 'mcrA.gpkg')
+            shutil.copytree(os.path.join(path_to_data, 'mcrA.gpkg'), gpkg_path)
+            PackageManifest.write(gpkg_path)
+            GraftMPackage.acquire(gpkg_path, validation=PackageManifest.QUICK_VALIDATION)
+            GraftMPackage.acquire(gpkg_path, validation=PackageManifest.FULL_VALIDATION)
+
+            # Same size, different contents
+            hmm = os.path.join(gpkg_path, 'mcrA.hmm')
+            with open(hmm, 'r+b') as f:
+                first = f.read(1)
+                f.seek(0)
+                f.write(b'X')
+            GraftMPackage.acquire(gpkg_path, validation=PackageManifest.QUICK_VALIDATION)
+            with self.assertRaises(CorruptGraftMPackageException):
+                GraftMPackage.acquire(gpkg_path, validation=PackageManifest.FULL_VALIDATION)
+            with open(hmm, 'r+b') as f:
+                f.write(first)
+            GraftMPackage.acquire(gpkg_path, validation=PackageManifest.FULL_VALIDATION)
+
+            # Truncated
+            with open(hmm, 'r+b') as f:
+                f.truncate(10)
+            with self.assertRaises(CorruptGraftMPackageException):
+                GraftMPackage.acquire(gpkg_path, validation=PackageManifest.QUICK_VALIDATION)
+            GraftMPackage.acquire(gpkg_path, validation=PackageManifest.NO_VALIDATION)
+
+    def test_full_validation_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            gpkg_path = os.path.join(tmp, 'mcrA.gpkg')
+            shutil.copytree(os.path.join(path_to_data, 'mcrA.gpkg'), gpkg_path)
+            PackageManifest.write(gpkg_path)
+            GraftMPackage.acquire(gpkg_path, validation=PackageManifest.FULL_VALIDATION)
+
+            # A change which leaves the size and modification time the same
+            # is not detected, because the file is not hashed again
+            hmm = os.path.join(gpkg_path, 'mcrA.hmm')
+            st = os.stat(hmm)
+            with open(hmm, 'r+b') as f:
+                f.write(b'X')
+            os.utime(hmm, ns=(st.st_atime_ns, st.st_mtime_ns))
+            GraftMPackage.acquire(gpkg_path, validation=PackageManifest.FULL_VALIDATION)
+
+            # but is once the modification time changes
+            os.utime(hmm, ns=(st.st_atime_ns, st.st_mtime_ns+1000))
+            with self.assertRaises(CorruptGraftMPackageException):
+                GraftMPackage.acquire(gpkg_path, validation=PackageManifest.FULL_VALIDATION)
+
 
 if __name__ == "__main__":
     unittest.main()
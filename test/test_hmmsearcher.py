@@ -30,6 +30,7 @@ import sys
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
 import graftm.hmmsearcher
 from graftm.hmmsearcher import NoInputSequencesException
+from graftm.search_hmm_database import SearchHmmDatabase
 
 class HmmsearcherTests(unittest.TestCase):
     path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
@@ -108,6 +109,73 @@ example_partial_mcra8 -            162 mcrA.fasta           -            557
                                [hmm_file],
                                [output.name])
 
+    def test_split_table(self):
+        searcher = graftm.hmmsearcher.HmmSearcher(1)
+        with tempfile.TemporaryDirectory() as tmp:
+            table = os.path.join(tmp, 'combined.tsv')
+            with open(table, 'w') as f:
+                f.write("# target name accession tlen query name\n"
+                        "read1 - 50 m2 - 100 1e-10\n"
+                        "read2 - 50 m1 - 100 1e-10\n"
+                        "read1 - 50 m1 - 100 1e-10\n"
+                        "#\n")
+            outputs = [os.path.join(tmp, 'out1'), os.path.join(tmp, 'out2')]
+            searcher._split_table(table, {'m1': 0, 'm2': 1}.__getitem__, outputs)
+            with open(outputs[0]) as f:
+                self.assertEqual("# target name accession tlen query name\n"
+                                 "read2 - 50 m1 - 100 1e-10\n"
+                                 "read1 - 50 m1 - 100 1e-10\n"
+                                 "#\n", f.read())
+            with open(outputs[1]) as f:
+                self.assertEqual("# target name accession tlen query name\n"
+                                 "read1 - 50 m2 - 100 1e-10\n"
+                                 "#\n", f.read())
+
+    def test_search_hmm_database_duplicate_model_names(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            hmms = []
+            for i in range(2):
+                hmms.append(os.path.join(tmp, 'hmm%i.hmm' % i))
+                with open(hmms[-1], 'w') as f:
+                    f.write("HMMER3/f\nNAME  same\n//\n")
+            database = SearchHmmDatabase(hmms, os.path.join(tmp, 'db.hmm'))
+            self.assertFalse(database.acquire())
+            self.assertFalse(os.path.exists(database.path))
+
+    def test_hmmsearch_database_same_as_separate(self):
+        package = os.path.join(self.path_to_data, 'S1.2.ribosomal_protein_L3_rplC')
+        faa_file = os.path.join(package, 'graftm_VEYiP.faa')
+        with tempfile.TemporaryDirectory() as tmp:
+            hmms = [os.path.join(package, 'graftmeZ00Qg_search.hmm'),
+                    os.path.join(package, 'graftmID8t_I_search.hmm')]
+            database = SearchHmmDatabase(hmms, os.path.join(tmp, 'db.hmm'))
+            self.assertTrue(database.acquire())
+            searcher = graftm.hmmsearcher.HmmSearcher(2, '--domE 1e-5')
+            separate = [os.path.join(tmp, 'separate%i' % i) for i in range(2)]
+            searcher.hmmsearch('cat %s' % faa_file, hmms, separate)
+            combined = [os.path.join(tmp, 'combined%i' % i) for i in range(2)]
+            searcher.hmmsearch_database('cat %s' % faa_file, database, combined)
+            for separate_path, combined_path in zip(separate, combined):
+                with open(separate_path) as f:
+                    expected = [l for l in f if not l.startswith('#')]
+                with open(combined_path) as f:
+                    observed = [l for l in f if not l.startswith('#')]
+                self.assertTrue(len(expected) > 0)
+                self.assertEqual(expected, observed)
+
+    def test_hmmsearch_database_no_input_exception(self):
+        package = os.path.join(self.path_to_data, 'S1.2.ribosomal_protein_L3_rplC')
+        fna_file = os.path.join(self.path_to_data, 'mcrA.gpkg/mcrA_1.1.fna')
+        with tempfile.TemporaryDirectory() as tmp:
+            database = SearchHmmDatabase([os.path.join(package, 'graftmeZ00Qg_search.hmm'),
+                                          os.path.join(package, 'graftmID8t_I_search.hmm')],
+                                         os.path.join(tmp, 'db.hmm'))
+            self.assertTrue(database.acquire())
+            searcher = graftm.hmmsearcher.HmmSearcher(2)
+            with self.assertRaises(NoInputSequencesException):
+                searcher.hmmsearch_database('orfm -m 3000 %s' % fna_file, database,
+                                            [os.path.join(tmp, 'out1'), os.path.join(tmp, 'out2')])
+
 
 
 
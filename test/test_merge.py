@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import tempfile
+from biom import load_table
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.merge import Merger
+
+class Tests(unittest.TestCase):
+    def write(self, path, contents):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_merge_read_tax_and_count_tables(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            read_tax = self.write(os.path.join(tmp, 'sample1', 'sample1_read_tax.tsv'),
+                                  "r1\tRoot; k__A\n"
+                                  "r2\tRoot; k__A; p__B\n"
+                                  "r3\tRoot; k__A\n")
+            # The output of a graft run on two samples
+            self.write(os.path.join(tmp, 'run2', 'combined_count_table.txt'),
+                       "#ID\tsample2\tsample3\tConsensusLineage\n"
+                       "1\t0\t4\tRoot; k__A; p__B\n"
+                       "2\t5\t0\tRoot; k__C\n")
+            # The output of a graft run with --sample_sheet
+            self.write(os.path.join(tmp, 'batch', 'sample_sheet_results.tsv'),
+                       "sample\tstatus\toutput_directory\terror\n"
+                       "sample4\tsucceeded\tbatch/sample4\t\n"
+                       "sample5\tfailed\tbatch/sample5\tgraft exited with status 1\n")
+            self.write(os.path.join(tmp, 'batch', 'sample4', 'combined_count_table.txt'),
+                       "#ID\tsample4\tConsensusLineage\n"
+                       "1\t2\tRoot; k__C\n")
+
+            output = os.path.join(tmp, 'merged')
+            accumulator = Merger().merge([read_tax,
+                                          os.path.join(tmp, 'run2'),
+                                          os.path.join(tmp, 'batch')],
+                                         output, max_samples_for_krona=0)
+            self.assertEqual(['sample1','sample2','sample3','sample4'], accumulator.sample_names)
+            with open(os.path.join(output, 'combined_count_table.txt')) as f:
+                self.assertEqual("#ID\tsample1\tsample2\tsample3\tsample4\tConsensusLineage\n"
+                                 "1\t2\t0\t0\t0\tRoot; k__A\n"
+                                 "2\t1\t0\t4\t0\tRoot; k__A; p__B\n"
+                                 "3\t0\t5\t0\t2\tRoot; k__C\n",
+                                 f.read())
+
+            table = load_table(os.path.join(output, 'graftm.biom'))
+            self.assertEqual(['sample1','sample2','sample3','sample4'], list(table.ids()))
+            self.assertEqual(4, table.get_value_by_ids('2', 'sample3'))
+            self.assertEqual(2, table.get_value_by_ids('3', 'sample4'))
+            self.assertEqual(['Root', 'k__C'], table.metadata('3', axis='observation')['taxonomy'])
+            self.assertEqual(14, table.sum())
+            self.assertFalse(os.path.exists(os.path.join(output, 'krona.html')))
+
+    def test_merge_sample_sheet_samples_sharing_a_basename(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.write(os.path.join(tmp, 'batch', 'sample_sheet_results.tsv'),
+                       "sample\tstatus\toutput_directory\terror\n"
+                       "a\tsucceeded\tbatch/a\t\n"
+                       "b\tsucceeded\tbatch/b\t\n")
+            # Both samples' reads files were called R1.fq.gz
+            self.write(os.path.join(tmp, 'batch', 'a', 'combined_count_table.txt'),
+                       "#ID\tR1\tConsensusLineage\n"
+                       "1\t2\tRoot; k__C\n")
+            self.write(os.path.join(tmp, 'batch', 'b', 'combined_count_table.txt'),
+                       "#ID\tR1\tConsensusLineage\n"
+                       "1\t3\tRoot; k__A\n")
+
+            output = os.path.join(tmp, 'merged')
+            accumulator = Merger().merge([os.path.join(tmp, 'batch')], output,
+                                         max_samples_for_krona=0)
+            self.assertEqual(['a','b'], accumulator.sample_names)
+            with open(os.path.join(output, 'combined_count_table.txt')) as f:
+                self.assertEqual("#ID\ta\tb\tConsensusLineage\n"
+                                 "1\t2\t0\tRoot; k__C\n"
+                                 "2\t0\t3\tRoot; k__A\n",
+                                 f.read())
+
+    def test_duplicate_sample(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            read_tax = self.write(os.path.join(tmp, 'a', 'sample1_read_tax.tsv'), "r1\tRoot\n")
+            read_tax2 = self.write(os.path.join(tmp, 'b', 'sample1_read_tax.tsv'), "r1\tRoot\n")
+            with self.assertRaises(Exception):
+                Merger().merge([read_tax, read_tax2], os.path.join(tmp, 'merged'),
+                               max_samples_for_krona=0)
+
+if __name__ == "__main__":
+    unittest.main()
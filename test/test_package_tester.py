@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os.path
+import sys
+import shutil
+import tempfile
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+
+from graftm.package_tester import PackageTester
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    def test_protein_package(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            gpkg = os.path.join(tmp, 'mcrA.10seqs.gpkg')
+            shutil.copytree(os.path.join(path_to_data, 'mcrA.10seqs.gpkg'), gpkg)
+            timings = PackageTester().test(gpkg, num_sequences=3)
+            self.assertEqual(PackageTester.STEPS, list(timings.keys()))
+            for step in PackageTester.STEPS:
+                self.assertTrue(timings[step] >= 0)
+
+    def test_unexpected_arguments(self):
+        with self.assertRaises(Exception):
+            PackageTester().test(os.path.join(path_to_data, 'mcrA.10seqs.gpkg'),
+                                 unknown_argument=1)
+
+if __name__ == "__main__":
+    unittest.main()
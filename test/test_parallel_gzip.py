@@ -0,0 +1,84 @@
+
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+
+import unittest
+import os.path
+import sys
+import io
+import gzip
+import tarfile
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.parallel_gzip import ParallelGzipWriter
+
+class Tests(unittest.TestCase):
+
+    def _compress(self, chunks, **kwargs):
+        out = io.BytesIO()
+        with ParallelGzipWriter(out, **kwargs) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+        return out.getvalue()
+
+    def test_round_trip(self):
+        data = b''.join(b"read%i ACGTACGTTTGA\n" % i for i in range(5000))
+        self.assertEqual(data, gzip.decompress(self._compress([data])))
+
+    def test_block_boundaries(self):
+        data = bytes(range(256)) * 40
+        chunks = [data[i:i+7] for i in range(0, len(data), 7)]
+        compressed = self._compress(chunks, threads=3, block_size=1000)
+        self.assertEqual(data, gzip.decompress(compressed))
+        # one gzip member per block
+        self.assertEqual(11, compressed.count(b'\x1f\x8b\x08'))
+
+    def test_empty(self):
+        self.assertEqual(b'', gzip.decompress(self._compress([])))
+        self.assertEqual(b'', gzip.decompress(self._compress([b''])))
+
+    def test_unexpected_argument(self):
+        with self.assertRaises(Exception):
+            ParallelGzipWriter(io.BytesIO(), thread=2)
+
+    def test_tarfile(self):
+        out = io.BytesIO()
+        content = b'>seq1\nMKLV\n' * 1000
+        with ParallelGzipWriter(out, threads=2, block_size=512) as writer:
+            with tarfile.open(fileobj=writer, mode='w|') as tar:
+                info = tarfile.TarInfo('my.gpkg/seqs.faa')
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        self.assertTrue(out.getvalue().count(b'\x1f\x8b\x08') > 1)
+        out.seek(0)
+        # Read as a stream, as Archive.extract does
+        with gzip.GzipFile(fileobj=out, mode='rb') as decompressed, \
+                tarfile.open(fileobj=decompressed, mode='r|') as tar:
+            member = tar.next()
+            self.assertEqual('my.gpkg/seqs.faa', member.name)
+            self.assertEqual(content, tar.extractfile(member).read())
+            self.assertEqual(None, tar.next())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+
+import unittest
+import os
+import sys
+import json
+import tempfile
+import extern
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.profiler import Profiler
+
+class Tests(unittest.TestCase):
+    def test_stages_and_commands(self):
+        prof = Profiler(package='my.gpkg')
+        with prof.activate():
+            with prof.stage('search', sample='sample1'):
+                self.assertEqual("hello\n", extern.run('echo hello'))
+                with Profiler.current_stage('inner'):
+                    pass
+            with prof.stage('search', sample='sample2'):
+                pass
+        # Not recorded once the profiler is no longer active
+        extern.run('true')
+
+        # Records are in order of completion
+        self.assertEqual(['echo','inner','search','search'],
+                         [r['name'] for r in prof.records])
+        echo, inner, search1, search2 = prof.records
+        self.assertEqual(Profiler.COMMAND_KIND, echo['kind'])
+        self.assertEqual('echo hello', echo['command'])
+        self.assertEqual({'package': 'my.gpkg', 'sample': 'sample1', 'stage': 'search'},
+                         echo['tags'])
+        self.assertEqual({'package': 'my.gpkg', 'sample': 'sample1', 'stage': 'inner'},
+                         inner['tags'])
+        self.assertEqual({'package': 'my.gpkg', 'sample': 'sample2', 'stage': 'search'},
+                         search2['tags'])
+        for r in prof.records:
+            self.assertFalse(r['failed'])
+            for key in ('wall_seconds', 'cpu_seconds', 'children_cpu_seconds',
+                        'peak_rss_kb', 'children_peak_rss_kb', 'read_bytes', 'write_bytes'):
+                self.assertGreaterEqual(r[key], 0)
+        self.assertGreater(echo['children_cpu_seconds']+echo['wall_seconds'], 0)
+
+        self.assertEqual(round(search1['wall_seconds']+search2['wall_seconds'], 2),
+                         prof.total_wall_seconds('search'))
+        self.assertEqual('n/a', prof.total_wall_seconds('align'))
+
+    def test_failed_stage(self):
+        prof = Profiler()
+        with prof.activate():
+            with self.assertRaises(extern.ExternCalledProcessError):
+                with prof.stage('search'):
+                    extern.run('false')
+        self.assertEqual([True, True], [r['failed'] for r in prof.records])
+
+    def test_write(self):
+        prof = Profiler(package='my.gpkg')
+        with prof.activate():
+            with prof.stage('search', sample='sample1'):
+                extern.run('true')
+        with tempfile.TemporaryDirectory() as tmp:
+            prof.write_json(os.path.join(tmp, 'profile.json'))
+            with open(os.path.join(tmp, 'profile.json')) as f:
+                profile = json.load(f)
+            self.assertEqual({'package': 'my.gpkg'}, profile['tags'])
+            self.assertEqual(['search', 'true'], [r['name'] for r in profile['records']])
+
+            prof.write_chrome_trace(os.path.join(tmp, 'profile.trace.json'))
+            with open(os.path.join(tmp, 'profile.trace.json')) as f:
+                trace = json.load(f)
+            self.assertEqual(2, len(trace['traceEvents']))
+            event = trace['traceEvents'][1]
+            self.assertEqual('search', event['name'])
+            self.assertEqual('X', event['ph'])
+            self.assertEqual('sample1', event['args']['sample'])
+
+if __name__ == "__main__":
+    unittest.main()
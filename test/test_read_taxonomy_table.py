@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.read_taxonomy_table import ReadTaxonomyTableWriter, ReadTaxonomyTableReader, ReadTaxonomyTableFormatError
+from graftm.merge import Merger
+
+class Tests(unittest.TestCase):
+    sample1 = {'r1': ['Root','k__A'],
+               'r2': ['Root','k__A','p__B'],
+               'r3': ['Root','k__A']}
+    sample2 = {'r4': ['Root','k__C'],
+               'r5': ['Root','k__A','p__B','c__D']}
+
+    def write_table(self, path):
+        with ReadTaxonomyTableWriter(path) as writer:
+            writer.add_sample('sample1', self.sample1)
+            writer.add_sample('empty', {})
+            writer.add_sample('sample2', self.sample2)
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'read_tax.grt')
+            self.write_table(path)
+            reader = ReadTaxonomyTableReader(path)
+            self.assertEqual(['sample1','empty','sample2'], reader.sample_names())
+            self.assertEqual(4, len(reader.lineages))
+            self.assertEqual(self.sample1, reader.read_taxonomies('sample1'))
+            self.assertEqual({}, reader.read_taxonomies('empty'))
+            self.assertEqual(self.sample2, reader.read_taxonomies('sample2'))
+            self.assertEqual(5, len(list(reader.each_read())))
+            self.assertEqual({('Root','k__A'): 2, ('Root','k__A','p__B'): 1},
+                             reader.taxonomy_counts('sample1'))
+            with self.assertRaises(Exception):
+                reader.num_reads('not_a_sample')
+
+    def test_query_by_taxon(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'read_tax.grt')
+            self.write_table(path)
+            reader = ReadTaxonomyTableReader(path)
+            self.assertEqual([('sample1','r2',['Root','k__A','p__B']),
+                              ('sample2','r5',['Root','k__A','p__B','c__D'])],
+                             list(reader.each_read_in_taxon(['Root','k__A','p__B'])))
+            self.assertEqual([], list(reader.each_read_in_taxon(['Root','k__Z'])))
+            self.assertEqual({'sample1': 3, 'empty': 0, 'sample2': 1},
+                             reader.taxon_counts(['Root','k__A']))
+
+    def test_truncated(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'read_tax.grt')
+            self.write_table(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path, 'wb') as f:
+                f.write(data[:-3])
+            with self.assertRaises(ReadTaxonomyTableFormatError):
+                ReadTaxonomyTableReader(path)
+
+    def test_merge(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'read_tax.grt')
+            self.write_table(path)
+            accumulator = Merger().merge([path], os.path.join(tmp, 'merged'), max_samples_for_krona=0)
+            self.assertEqual(['sample1','empty','sample2'], accumulator.sample_names)
+            with open(os.path.join(tmp, 'merged', 'combined_count_table.txt')) as f:
+                self.assertEqual("#ID\tsample1\tempty\tsample2\tConsensusLineage\n"
+                                 "1\t2\t0\t0\tRoot; k__A\n"
+                                 "2\t1\t0\t0\tRoot; k__A; p__B\n"
+                                 "3\t0\t0\t1\tRoot; k__C\n"
+                                 "4\t0\t0\t1\tRoot; k__A; p__B; c__D\n",
+                                 f.read())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import argparse
+import tempfile
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.sample_sheet import Sample, SampleSheet, SampleSheetRunner
+
+class Tests(unittest.TestCase):
+    def write_sheet(self, directory, name, contents):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return path
+
+    def test_parse_tsv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write_sheet(tmp, 'samples.tsv', "\n".join([
+                "Sample\tforward\treverse\tinterleaved\tsequence_type",
+                "# a comment",
+                "s1\ts1.fa\t\t\t",
+                "s2\t/abs/s2_1.fq.gz\t/abs/s2_2.fq.gz\tfalse\tnucleotide",
+                "s3\ts3.fa\t\tyes\t",
+                "",
+                "s4\ts4.faa\t\t\taminoacid"])+"\n")
+            samples = list(SampleSheet(path).each())
+            self.assertEqual(['s1','s2','s3','s4'], [s.name for s in samples])
+            self.assertEqual([None]*4, [s.error for s in samples])
+            self.assertEqual(os.path.join(tmp, 's1.fa'), samples[0].forward)
+            self.assertEqual(None, samples[0].reverse)
+            self.assertEqual('/abs/s2_2.fq.gz', samples[1].reverse)
+            self.assertEqual([False, False, True, False], [s.interleaved for s in samples])
+            self.assertEqual([None, 'nucleotide', None, 'aminoacid'], [s.sequence_type for s in samples])
+            self.assertEqual(7, samples[3].line_number)
+
+    def test_parse_csv_with_bad_lines(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write_sheet(tmp, 'samples.csv', "\n".join([
+                "sample,forward,interleaved",
+                "s1,s1.fa,",
+                "s1,s1_again.fa,",
+                ",s2.fa,",
+                "s3,,",
+                "s4,s4.fa,maybe",
+                "s5,s5.fa",
+                "s6,s6.fa,true"])+"\n")
+            samples = list(SampleSheet(path).each())
+            self.assertEqual(['s1','s1','line4','s3','s4','line7','s6'], [s.name for s in samples])
+            self.assertEqual([False, True, True, True, True, True, False],
+                             [s.error is not None for s in samples])
+
+    def test_bad_header(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write_sheet(tmp, 'samples.tsv', "sample\treads\ns1\ts1.fa\n")
+            with self.assertRaises(Exception):
+                list(SampleSheet(path).each())
+
+    def test_sample_arguments_name_samples_sharing_a_basename(self):
+        runner = SampleSheetRunner(argparse.Namespace(graftm_package=None))
+        names = []
+        for name, forward in [('a', '/x/a/R1.fq.gz'), ('b', '/x/b/R1.fq.gz')]:
+            args = runner._sample_arguments(Sample(name, forward), '/out')
+            self.assertEqual([forward], args.forward)
+            self.assertEqual(os.path.join('/out', name), args.output_directory)
+            names.append(args.sample_name)
+        self.assertEqual(['a', 'b'], names)
+
+    def test_runner_records_failures_and_continues(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = self.write_sheet(tmp, 'samples.tsv', "\n".join([
+                "sample\tforward",
+                "missing\tdoes_not_exist.fa",
+                "\tno_name.fa",
+                "missing2\tdoes_not_exist2.fa"])+"\n")
+            args = argparse.Namespace(graftm_package=None)
+            output = os.path.join(tmp, 'out')
+            succeeded, failed = SampleSheetRunner(args, workers=2).run(
+                SampleSheet(path), output)
+            self.assertEqual((0, 3), (succeeded, failed))
+            with open(os.path.join(output, 'sample_sheet_results.tsv')) as f:
+                lines = [line.rstrip("\n").split("\t") for line in f]
+            self.assertEqual(['sample', 'status', 'output_directory', 'error'], lines[0])
+            self.assertEqual(['line3', 'missing', 'missing2'], sorted([l[0] for l in lines[1:]]))
+            self.assertEqual([SampleSheetRunner.FAILED_STATUS]*3, [l[1] for l in lines[1:]])
+
+if __name__ == "__main__":
+    unittest.main()
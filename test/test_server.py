@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+
+import unittest
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.server import GraftMServer
+from graftm.graftm_package import GraftMPackage
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    def test_spool_reports_failed_jobs(self):
+        parser = argparse.ArgumentParser()
+        parser.add_argument('--forward')
+        with tempfile.TemporaryDirectory() as tmp:
+            gpkg_path = os.path.join(tmp, '61_otus.gpkg')
+            shutil.copytree(os.path.join(path_to_data, '61_otus.gpkg'), gpkg_path)
+            spool = os.path.join(tmp, 'spool')
+            os.mkdir(spool)
+            with open(os.path.join(spool, 'bad_arguments.job'), 'w') as f:
+                json.dump({'arguments': ['--not_an_argument']}, f)
+            with open(os.path.join(spool, 'bad_json.job'), 'w') as f:
+                f.write('{')
+            with open(os.path.join(spool, 'no_arguments.job'), 'w') as f:
+                json.dump({}, f)
+
+            try:
+                server = GraftMServer(parser, [gpkg_path], workers=2)
+                self.assertIs(GraftMPackage.acquire(gpkg_path), GraftMPackage.acquire(gpkg_path))
+                server.serve_spool(spool, poll_interval=0.01, exit_when_idle=True)
+            finally:
+                GraftMPackage._preloaded_packages.pop(os.path.realpath(gpkg_path), None)
+
+            self.assertEqual(['bad_arguments.result', 'bad_json.result', 'no_arguments.result'],
+                             sorted(os.listdir(spool)))
+            with open(os.path.join(spool, 'bad_arguments.result')) as f:
+                self.assertEqual({'arguments': ['--not_an_argument'],
+                                  'status': GraftMServer.FAILED_STATUS,
+                                  'error': 'Unable to parse graft arguments'},
+                                 json.load(f))
+            with open(os.path.join(spool, 'bad_json.result')) as f:
+                self.assertEqual(GraftMServer.FAILED_STATUS, json.load(f)['status'])
+            with open(os.path.join(spool, 'no_arguments.result')) as f:
+                self.assertEqual(GraftMServer.FAILED_STATUS, json.load(f)['status'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+
+import unittest
+import os
+import sys
+import subprocess
+import tempfile
+
+path_to_script = os.path.join(os.path.dirname(os.path.realpath(__file__)),'..','bin','graftM')
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    '''Start up time budget of bin/graftM. Modules that are slow to import are
+    only imported by the subcommands that use them.'''
+
+    # Targets for the total time spent importing modules, in seconds. Timings
+    # vary with the load on the machine, so they are only checked when this
+    # environment variable is set
+    CHECK_IMPORT_TIME_ENVIRONMENT_VARIABLE = 'GRAFTM_CHECK_IMPORT_TIME'
+    GRAFT_HELP_IMPORT_TIME_TARGET = 0.2
+    ARCHIVE_IMPORT_TIME_TARGET = 0.2
+
+    SLOW_MODULES = ['biom', 'numpy', 'scipy', 'Bio', 'dendropy', 'taxtastic']
+
+    def import_times(self, arguments):
+        '''Run graftM with python -X importtime, and return a dict of the
+        top level modules imported to their cumulative import time in
+        seconds.'''
+        process = subprocess.run([sys.executable, '-X', 'importtime', path_to_script]+arguments,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+        self.assertEqual(0, process.returncode, process.stderr)
+        times = {}
+        for line in process.stderr.split("\n"):
+            if not line.startswith('import time:'): continue
+            _, cumulative, name = line.split('|')
+            if cumulative.strip() == 'cumulative': continue # header
+            times[name.rstrip()] = int(cumulative)/1e6
+        return times
+
+    def graft_help_import_times(self):
+        return self.import_times(['graft', '--help'])
+
+    def archive_create_import_times(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            return self.import_times(['archive', '--create',
+                                      '--graftm_package', os.path.join(path_to_data, 'mcrA.gpkg'),
+                                      '--archive', os.path.join(tmp, 'mcrA.gpkg.tar.gz'),
+                                      '--verbosity', '2'])
+
+    def assert_no_slow_modules(self, times):
+        slow = [name.strip() for name in times
+                if name.strip().split('.')[0] in self.SLOW_MODULES]
+        self.assertEqual([], slow)
+
+    def assert_import_time(self, times, target):
+        total = sum(t for name, t in times.items() if not name.startswith(' '))
+        self.assertLess(total, target)
+
+    def test_graft_help(self):
+        self.assert_no_slow_modules(self.graft_help_import_times())
+
+    def test_archive_create(self):
+        self.assert_no_slow_modules(self.archive_create_import_times())
+
+    @unittest.skipUnless(os.environ.get(CHECK_IMPORT_TIME_ENVIRONMENT_VARIABLE),
+                         'set %s to check import times' % CHECK_IMPORT_TIME_ENVIRONMENT_VARIABLE)
+    def test_graft_help_import_time(self):
+        self.assert_import_time(self.graft_help_import_times(),
+                                self.GRAFT_HELP_IMPORT_TIME_TARGET)
+
+    @unittest.skipUnless(os.environ.get(CHECK_IMPORT_TIME_ENVIRONMENT_VARIABLE),
+                         'set %s to check import times' % CHECK_IMPORT_TIME_ENVIRONMENT_VARIABLE)
+    def test_archive_create_import_time(self):
+        self.assert_import_time(self.archive_create_import_times(),
+                                self.ARCHIVE_IMPORT_TIME_TARGET)
+
+if __name__ == "__main__":
+    unittest.main()
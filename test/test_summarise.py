@@ -82,6 +82,44 @@ class Tests(unittest.TestCase):
             )
         )
 
+    def test_accumulate_is_sparse(self):
+        s = Stats_And_Summary()
+        accumulator = s.accumulate([{'r1': ['ab','c'], 'r2': ['ab','c']},
+                                    {},
+                                    {'r3': ['ab','d']}],
+                                   ['sample1','sample2','sample3'])
+        self.assertEqual(['sample1','sample2','sample3'], accumulator.sample_names)
+        self.assertEqual([(1, ['ab','c'], {0: 2}), (2, ['ab','d'], {2: 1})],
+                         list(accumulator.each_sparse_row()))
+        self.assertEqual([(1, ['ab','c'], [2,0,0]), (2, ['ab','d'], [0,0,1])],
+                         list(accumulator.each_row()))
+
+    def test_write_krona_plot_in_groups(self):
+        s = Stats_And_Summary()
+        accumulator = s.accumulate([{'r1': ['ab','c'], 'r2': ['ab','c']},
+                                    {'r3': ['ab','d']},
+                                    {'r4': ['ab','c'], 'r5': ['ab','e']}],
+                                   ['sample1','sample2','sample3'])
+        max_samples = Stats_And_Summary.MAX_SAMPLES_PER_KRONA_PLOT
+        max_open = Stats_And_Summary._MAX_OPEN_KRONA_INPUTS
+        try:
+            Stats_And_Summary.MAX_SAMPLES_PER_KRONA_PLOT = 2
+            Stats_And_Summary._MAX_OPEN_KRONA_INPUTS = 1
+            with tempfile.TemporaryDirectory() as tmp:
+                paths = s.write_accumulated_krona_plot(accumulator, os.path.join(tmp, 'krona.html'))
+                self.assertEqual([os.path.join(tmp, 'krona_1.html'),
+                                  os.path.join(tmp, 'krona_2.html')], paths)
+                with open(paths[0]) as f:
+                    plot = f.read()
+                    self.assertTrue('sample1' in plot)
+                    self.assertTrue('sample2' in plot)
+                    self.assertFalse('sample3' in plot)
+                with open(paths[1]) as f:
+                    self.assertTrue('sample3' in f.read())
+        finally:
+            Stats_And_Summary.MAX_SAMPLES_PER_KRONA_PLOT = max_samples
+            Stats_And_Summary._MAX_OPEN_KRONA_INPUTS = max_open
+
     def test_write_otu_table(self):
         string = io.StringIO()
         s = Stats_And_Summary()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os.path
+import sys
+import time
+import threading
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+
+from graftm.task_graph import TaskGraph
+
+class Tests(unittest.TestCase):
+    def test_dependencies_and_results(self):
+        graph = TaskGraph()
+        graph.add('a', lambda: 1)
+        graph.add('b', lambda: graph.result('a')+1, dependencies=['a'])
+        graph.add('c', lambda: graph.result('a')+10, dependencies=['a'])
+        graph.add('d', lambda: graph.result('b')+graph.result('c'),
+                  dependencies=['b','c'])
+        graph.run(threads=4)
+        self.assertEqual(13, graph.result('d'))
+        self.assertTrue('d' in graph)
+        self.assertFalse('e' in graph)
+
+    def test_unknown_dependency(self):
+        graph = TaskGraph()
+        with self.assertRaises(Exception):
+            graph.add('a', lambda: 1, dependencies=['b'])
+
+    def test_thread_budget(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0}
+        def step():
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.05)
+            with lock:
+                state['running'] -= 1
+        for threads, expected in ((1, 1), (4, 2)):
+            state['max_running'] = 0
+            graph = TaskGraph()
+            for i in range(4):
+                graph.add(str(i), step, threads=2)
+            graph.run(threads=threads)
+            self.assertEqual(expected, state['max_running'])
+
+    def test_failure(self):
+        ran = []
+        def fail():
+            raise Exception("failed step")
+        graph = TaskGraph()
+        graph.add('a', fail)
+        graph.add('b', lambda: ran.append('b'), dependencies=['a'])
+        with self.assertRaises(Exception) as cm:
+            graph.run()
+        self.assertEqual("failed step", str(cm.exception))
+        self.assertEqual([], ran)
+
+    def test_critical_path(self):
+        graph = TaskGraph()
+        graph.add('align', lambda: time.sleep(0.01))
+        graph.add('search_hmm', lambda: time.sleep(0.01), dependencies=['align'])
+        graph.add('tree', lambda: time.sleep(0.2), dependencies=['align'])
+        graph.add('compile', lambda: None, dependencies=['search_hmm','tree'])
+        graph.run(threads=2)
+        self.assertEqual(['align','tree','compile'],
+                         [name for name, _ in graph.critical_path()])
+
+if __name__ == "__main__":
+    unittest.main()
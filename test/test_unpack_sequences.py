@@ -24,9 +24,13 @@
 import unittest
 import os
 import sys
+import io
+import tempfile
+import extern
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
 from graftm.unpack_sequences import UnpackRawReads
+from graftm.subsample_reads import ReadSubsampler
 
 class Tests(unittest.TestCase):
     def test__guess_sequence_type(self):
@@ -41,6 +45,81 @@ class Tests(unittest.TestCase):
         urr = UnpackRawReads(None)
         self.assertEqual('aminoacid', urr._guess_sequence_type_from_string('P'*10+"*"))
 
+    def fasta(self, names):
+        return ''.join([">%s desc\nACGT\nACGT\n" % name for name in names]).encode()
+
+    def subsample(self, subsampler, fasta):
+        output = io.BytesIO()
+        stats = subsampler.subsample(io.BytesIO(fasta), output)
+        names = [line[1:].split()[0].decode() for line in output.getvalue().split(b"\n") if line.startswith(b'>')]
+        return names, stats
+
+    def test_read_fraction_is_pair_consistent(self):
+        forward = ['read%i/1' % i for i in range(1000)]
+        reverse = ['read%i/2' % i for i in range(1000)]
+        kept_forward, stats = self.subsample(ReadSubsampler(read_fraction=0.1), self.fasta(forward))
+        kept_reverse, _ = self.subsample(ReadSubsampler(read_fraction=0.1), self.fasta(reverse))
+        self.assertEqual([n[:-2] for n in kept_forward], [n[:-2] for n in kept_reverse])
+        self.assertTrue(50 < len(kept_forward) < 150)
+        self.assertEqual({'reads_seen': 1000, 'reads_kept': len(kept_forward)}, stats)
+
+        everything, stats = self.subsample(ReadSubsampler(read_fraction=1), self.fasta(forward))
+        self.assertEqual(forward, everything)
+
+    def test_max_reads_keeps_pairs_and_counts_the_rest(self):
+        interleaved = ['read%i/%i' % (i, j) for i in range(10) for j in (1, 2)]
+        kept, stats = self.subsample(ReadSubsampler(max_reads=3, interleaved=True), self.fasta(interleaved))
+        self.assertEqual(interleaved[:4], kept)
+        self.assertEqual({'reads_seen': 20, 'reads_kept': 4}, stats)
+
+        kept, stats = self.subsample(ReadSubsampler(max_reads=3), self.fasta(interleaved))
+        self.assertEqual(interleaved[:3], kept)
+        self.assertEqual({'reads_seen': 20, 'reads_kept': 3}, stats)
+
+    def test_bad_subsample_options(self):
+        with self.assertRaises(Exception):
+            UnpackRawReads('a.fa', read_fraction=0)
+        with self.assertRaises(Exception):
+            UnpackRawReads('a.fa', max_reads=0)
+
+    def test_subsampled_command_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            reads = os.path.join(tmp, 'reads.fa')
+            with open(reads, 'wb') as f:
+                f.write(self.fasta(['read%i' % i for i in range(100)]))
+            stats_path = os.path.join(tmp, 'stats.json')
+            unpack = UnpackRawReads(reads, max_reads=5, subsample_statistics_path=stats_path)
+            self.assertEqual(None, unpack.subsample_statistics())
+            output = extern.run(unpack.command_line())
+            self.assertEqual(self.fasta(['read%i' % i for i in range(5)]).decode(), output)
+            self.assertEqual({'reads_seen': 100, 'reads_kept': 5}, unpack.subsample_statistics())
+
+            self.assertEqual(None, UnpackRawReads(reads).subsample_statistics())
+
+    def test_interleave_pairs_command_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            forward = os.path.join(tmp, 'reads_1.fa')
+            with open(forward, 'w') as f:
+                f.write(">r1/1 extra\nAAAA\nCC\n>r2\nGGGG\n")
+            reverse = os.path.join(tmp, 'reads_2.fq')
+            with open(reverse, 'w') as f:
+                f.write("@r1/2 extra\nTTTT\n+\nIIII\n@r2\nCCCC\n+\nIIII\n")
+            unpack = UnpackRawReads(forward, reverse_read_file=reverse)
+            self.assertTrue(unpack.interleaved)
+            self.assertEqual('reads_1', unpack.basename())
+            self.assertEqual(">r1/1 extra\nAAAA\nCC\n>r1/2 extra\nTTTT\n>r2/1\nGGGG\n>r2/2\nCCCC\n",
+                             extern.run(unpack.command_line()))
+
+            # Subsampling keeps pairs together
+            unpack = UnpackRawReads(forward, reverse_read_file=reverse, max_reads=1)
+            self.assertEqual(">r1/1 extra\nAAAA\nCC\n>r1/2 extra\nTTTT\n",
+                             extern.run(unpack.command_line()))
+
+            with open(reverse, 'w') as f:
+                f.write("@r2/2\nTTTT\n+\nIIII\n@r1\nCCCC\n+\nIIII\n")
+            with self.assertRaises(extern.ExternCalledProcessError):
+                extern.run(UnpackRawReads(forward, reverse_read_file=reverse).command_line())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -113,6 +113,47 @@ SAYTGIVAAAHSARGDAWALSPHVKVAFADRSLPFDFANITKEFGRGAMREFVPAGERDLIIP
                     len(seqio.read_fasta_file(prev.unaligned_sequence_database_path()))+1,
                     len(seqio.read_fasta_file(up.unaligned_sequence_database_path())))
 
+    def test_full_rebuild(self):
+        with in_tempdir():
+            with tempfile.NamedTemporaryFile(mode='w') as fasta:
+                with tempfile.NamedTemporaryFile(mode='w') as tax:
+                    fasta.write(Tests.extra_mcra_fasta)
+                    fasta.flush()
+                    tax.write(Tests.extra_mcra_taxonomy)
+                    tax.flush()
+
+                    prev_path = os.path.join(path_to_data,'mcrA.10seqs.gpkg')
+                    for full_rebuild, output in ((False, 'incremental.gpkg'),
+                                                 (True, 'rebuilt.gpkg')):
+                        Update(prerequisites).update(
+                            input_sequence_path = fasta.name,
+                            input_taxonomy_path = tax.name,
+                            input_graftm_package_path = prev_path,
+                            output_graftm_package_path = output,
+                            full_rebuild = full_rebuild)
+                    prev = GraftMPackage.acquire(prev_path)
+                    incremental = GraftMPackage.acquire('incremental.gpkg')
+                    rebuilt = GraftMPackage.acquire('rebuilt.gpkg')
+
+                    # The incremental update keeps the previous alignment HMM
+                    with open(prev.alignment_hmm_path()) as f:
+                        prev_hmm = f.read()
+                    with open(incremental.alignment_hmm_path()) as f:
+                        self.assertEqual(prev_hmm, f.read())
+                    with open(rebuilt.alignment_hmm_path()) as f:
+                        self.assertNotEqual(prev_hmm, f.read())
+
+                    seqio = SequenceIO()
+                    for gpkg in (incremental, rebuilt):
+                        self.assertEqual(['mcrA','Euryarchaeota_mcrA','Methanofastidiosa'],
+                                         gpkg.taxonomy_hash()['KYC55281.1'])
+                        aligned_names = set(s.name for s in
+                                            seqio.read_fasta_file(gpkg.alignment_fasta_path()))
+                        self.assertTrue('KYC55281.1' in aligned_names)
+                        self.assertEqual(
+                            len(seqio.read_fasta_file(prev.unaligned_sequence_database_path()))+1,
+                            len(seqio.read_fasta_file(gpkg.unaligned_sequence_database_path())))
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG)
     unittest.main()